@@ -0,0 +1,232 @@
+# Shared by the agent and the reservations service, both copies are kept
+# identical (see agent/tests/test_shared_modules.py).
+import re
+import time
+import asyncio
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+def normalize_text(text: str) -> str:
+    # collapse case, whitespace and trailing punctuation so repeated spoken
+    # questions map to the same key
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.,;:")
+
+
+class TTLCache:
+    """
+    In-process LRU cache with an optional per-entry TTL and hit/miss counters.
+    When `maxweight` is set, entries are also evicted once the summed `weigher`
+    of the stored values goes above it (e.g. total characters of cached text).
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        maxweight: Optional[int] = None,
+        weigher: Callable[[Any], int] = len,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigher = weigher
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at, _ = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        weight = self.weigher(value) if self.maxweight else 0
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, expires_at, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (
+                self.maxweight and self.weight > self.maxweight and len(self._data) > 1
+            ):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self.weight -= evicted
+
+    def _remove(self, key: Hashable):
+        item = self._data.pop(key, _MISSING)
+        if item is not _MISSING:
+            self.weight -= item[2]
+        return item
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._remove(key)
+        return default if item is _MISSING else item[0]
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def items(self) -> list:
+        """Live (key, value, seconds left or None) entries, the counters are left alone."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value, None if expires_at is None else expires_at - now)
+                for key, (value, expires_at, _) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def __contains__(self, key: Hashable) -> bool:
+        # a membership check that leaves the hit/miss counters alone
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            return item is not _MISSING and (item[1] is None or item[1] > time.monotonic())
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class EmbeddingCache:
+    """
+    Query embeddings keyed by (model, normalized text). An in-process LRU sits in
+    front of an optional SQLite file that several worker processes can share.
+
+    The SQLite tier blocks, so async callers use `aget`/`aset` with an executor.
+    Rows past `max_rows` are pruned every `prune_every` inserts rather than on
+    each one, the table can run a little over in between.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 2048,
+        ttl: Optional[float] = None,
+        db_path: Optional[str] = None,
+        max_rows: int = 100_000,
+        prune_every: int = 1000,
+    ):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self.disk_hits = 0
+        self._inserts = 0
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=1.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL, "
+                "created_at REAL NOT NULL, PRIMARY KEY (model, query))"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)"
+            )
+            self._db.commit()
+
+    def get(self, query: str, model: str) -> Optional[list[float]]:
+        key = (model, normalize_text(query))
+        vector = self.memory.get(key)
+        if vector is not None or self._db is None:
+            return vector
+        return self._disk_get(key)
+
+    async def aget(self, query: str, model: str, executor: Optional[Executor] = None) -> Optional[list[float]]:
+        key = (model, normalize_text(query))
+        vector = self.memory.get(key)
+        if vector is not None or self._db is None:
+            return vector
+        return await asyncio.get_running_loop().run_in_executor(executor, self._disk_get, key)
+
+    def _disk_get(self, key) -> Optional[list[float]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT vector, created_at FROM embeddings WHERE model = ? AND query = ?",
+                key,
+            ).fetchone()
+        if row is None:
+            return None
+        blob, created_at = row
+        if self.ttl and created_at + self.ttl < time.time():
+            return None
+        vector = array("f", blob).tolist()
+        self.disk_hits += 1
+        self.memory.set(key, vector)
+        return vector
+
+    def set(self, query: str, model: str, vector: list[float]):
+        key = (model, normalize_text(query))
+        self.memory.set(key, vector)
+        if self._db is not None:
+            self._disk_set(key, vector)
+
+    def aset(self, query: str, model: str, vector: list[float], executor: Optional[Executor] = None):
+        # write-behind, the caller already has the vector and need not wait
+        key = (model, normalize_text(query))
+        self.memory.set(key, vector)
+        if self._db is not None:
+            return asyncio.get_running_loop().run_in_executor(executor, self._disk_set, key, vector)
+
+    def _disk_set(self, key, vector: list[float]):
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                    (*key, array("f", vector).tobytes(), time.time()),
+                )
+                self._inserts += 1
+                if self._inserts % self.prune_every == 0:
+                    self._db.execute(
+                        "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings "
+                        "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_rows,),
+                    )
+                self._db.commit()
+        except sqlite3.OperationalError:
+            # another process holds the write lock, the in-memory tier still has it
+            pass
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        return stats
@@ -1,8 +1,25 @@
 import os
 import re
+import json
+import time
+import asyncio
+import logging
+import tempfile
+import weakref
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 import aiohttp
+from cache import TTLCache, normalize_text
+from title_index import TitleIndex
+
+logger = logging.getLogger("cinema")
+
+# cached marker for titles TMDB returned no results for
+NO_MOVIE = object()
+
+
+class BookingConflictError(Exception):
+    pass
 
 
 class CinemaService:
@@ -19,16 +36,129 @@ class CinemaService:
         self.base_url = os.getenv("RES_BASE_URL", "http://localhost:8000")
         self.tmdb_url = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
         self.tmdb_api_key = os.getenv("TMDB_READ_ACCESS_KEY")
+        self.http_limit = int(os.getenv("CINEMA_HTTP_LIMIT", "100"))
+        self.http_limit_per_host = int(os.getenv("CINEMA_HTTP_LIMIT_PER_HOST", "20"))
+        self.http_keepalive = float(os.getenv("CINEMA_HTTP_KEEPALIVE", "30"))
+        self.http_dns_ttl = int(os.getenv("CINEMA_HTTP_DNS_TTL", "300"))
+        self.http_timeout = float(os.getenv("CINEMA_HTTP_TIMEOUT", "10"))
+        self.http_connect_timeout = float(os.getenv("CINEMA_HTTP_CONNECT_TIMEOUT", "3"))
+        # requests in a row that got no response at all (refused, reset,
+        # timed out); past the limit the service reports itself unhealthy and
+        # the worker builds a new one with a fresh connector and DNS cache
+        self.connection_failures = 0
+        self.max_connection_failures = int(os.getenv("CINEMA_MAX_CONNECTION_FAILURES", "3"))
+        # the service is shared by every job in the process, jobs running as
+        # threads each have their own loop and so their own session
+        self._sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+            weakref.WeakKeyDictionary()
+        )
+        # movie metadata keyed by normalized title, misses are cached for a
+        # shorter time so a newly listed title is picked up again soon
+        self.movie_cache = TTLCache(
+            maxsize=int(os.getenv("TMDB_CACHE_SIZE", "5000")),
+            ttl=float(os.getenv("TMDB_CACHE_TTL", "86400")),
+        )
+        self.movie_negative_ttl = float(os.getenv("TMDB_NEGATIVE_TTL", "600"))
+        self.catalog_pages = int(os.getenv("TMDB_PREFETCH_PAGES", "3"))
+        self.catalog_refresh = float(os.getenv("TMDB_PREFETCH_INTERVAL", "21600"))
+        self._catalog_fetched_at = 0.0
+        self._catalog_task: Optional[asyncio.Task] = None
+        # fuzzy index over every movie seen so far, for transcribed titles
+        # that do not match a cache key exactly. A fuzzy hit is only cached
+        # briefly, it may still be the wrong movie (see title_bench.py)
+        self.title_index = TitleIndex()
+        self.fuzzy_threshold = float(os.getenv("TMDB_FUZZY_THRESHOLD", "0.85"))
+        self.fuzzy_ttl = float(os.getenv("TMDB_FUZZY_CACHE_TTL", "600"))
+        # job processes are single use, so the catalog and the movie cache are
+        # shared through this file and a fresh one skips the prefetch
+        self.catalog_path = os.getenv(
+            "TMDB_CATALOG_PATH", os.path.join(tempfile.gettempdir(), "tmdb_catalog.json")
+        )
+        self.load_catalog_snapshot()
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # One pooled session per event loop, reused by every call so requests
+        # ride on already open keep-alive connections.
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.http_limit,
+                limit_per_host=self.http_limit_per_host,
+                keepalive_timeout=self.http_keepalive,
+                ttl_dns_cache=self.http_dns_ttl,
+                use_dns_cache=True,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=self.http_timeout, connect=self.http_connect_timeout
+                ),
+                trace_configs=[self._connection_trace()],
+            )
+            self._sessions[loop] = session
+        return session
+
+    def _connection_trace(self) -> aiohttp.TraceConfig:
+        async def on_request_end(session, context, params):
+            self.connection_failures = 0
+
+        async def on_request_exception(session, context, params):
+            self.connection_failures += 1
 
-    def recommend_room(self, people_count: int) -> str:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        return trace
+
+    def is_open(self) -> bool:
+        # health check for the shared service, see prewarm.ClientRegistry
+        return self.connection_failures < self.max_connection_failures
+
+    async def persist(self):
+        """Save the catalog snapshot, what a finishing job does with the shared service."""
+        try:
+            await self.save_catalog_snapshot()
+        except OSError as e:
+            logger.warning(f"could not save movie catalog snapshot: {e}")
+
+    async def aclose(self):
+        # closes the session of the running loop only, sessions of other
+        # loops belong to jobs that may still be running
+        await self.persist()
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def recommend_room(self, people_count: int) -> Optional[str]:
+        # None when the party is too big for any room
         if people_count <= 4:
             return "Small Room"
         elif people_count <= 7:
             return "Medium Room"
         elif people_count <= 10:
             return "Large Room"
-        else:
+        return None
+
+    async def recommend_available_room(self, people_count: int, date_str: str, time_str: str) -> Optional[str]:
+        # smallest room that fits the party and is free at that slot, falls back
+        # to the size-only recommendation if the availability check fails;
+        # None when no room fits or every room that fits is booked
+        try:
+            rooms = await self.get_room_availability(date_str, time_str, people_count)
+        except Exception:
+            return self.recommend_room(people_count)
+        for room in sorted(rooms, key=lambda room: room["capacity"]):
+            if room["available"]:
+                return room["room"]
+        if rooms:
+            return None
+        return self.recommend_room(people_count)
+
+    def no_room_message(self, people_count: int) -> str:
+        if self.recommend_room(people_count) is None:
             return "I'm sorry, we don't have a room for that many people, our largest room can accommodate 10 people."
+        return "I'm sorry, all rooms that fit your party are booked at that time, could you pick another time?"
 
     def validate_phone_number(self, phone: str) -> bool:
         us_phone_pattern = r"^(?:\+1\s?)?(?:\(?\d{3}\)?[\s.-]?)?\d{3}[\s.-]?\d{4}$"
@@ -94,7 +224,13 @@ class CinemaService:
         print(f"{reservation_obj = }")
 
         # Create reservation
-        booking = await self.create_reservation(reservation_obj)
+        try:
+            booking = await self.create_reservation(reservation_obj)
+        except BookingConflictError:
+            return {
+                "success": False,
+                "error": f"the {reservation_obj['room']} was just booked for that time by someone else",
+            }
         print(f"{booking = }")
 
         # self.bookings.append(booking)
@@ -102,56 +238,196 @@ class CinemaService:
         return {"success": True, **booking}
 
     async def get_reservation(self, reservation_id: int):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"{self.base_url}/reservations/{reservation_id}"
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"Failed to get reservation: {response.status}")
+        session = self.get_session()
+        async with session.get(
+            f"{self.base_url}/reservations/{reservation_id}"
+        ) as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                raise Exception(f"Failed to get reservation: {response.status}")
 
     async def create_reservation(self, reservation_data: dict):
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/reservations", json=reservation_data
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"Failed to create reservation: {response.status}")
+        session = self.get_session()
+        async with session.post(
+            f"{self.base_url}/reservations", json=reservation_data
+        ) as response:
+            if response.status == 200:
+                return await response.json()
+            elif response.status == 409:
+                raise BookingConflictError(await response.text())
+            else:
+                raise Exception(f"Failed to create reservation: {response.status}")
 
     async def update_reservation(self, reservation_id: int, reservation_data: dict):
-        async with aiohttp.ClientSession() as session:
-            async with session.put(
-                f"{self.base_url}/reservations/{reservation_id}", json=reservation_data
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"Failed to update reservation: {response.status}")
+        session = self.get_session()
+        async with session.put(
+            f"{self.base_url}/reservations/{reservation_id}", json=reservation_data
+        ) as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                raise Exception(f"Failed to update reservation: {response.status}")
+
+    async def get_room_availability(self, date_str: str, time_str: str, people_count: int):
+        session = self.get_session()
+        async with session.get(
+            f"{self.base_url}/rooms/availability",
+            params={"date": date_str, "time": time_str, "party_size": people_count},
+        ) as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                raise Exception(f"Failed to get room availability: {response.status}")
+
+    def tmdb_headers(self) -> Dict:
+        return {
+            "Authorization": f"Bearer {self.tmdb_api_key}",
+            "accept": "application/json",
+        }
 
     async def retrieve_movie(self, query: str) -> Optional[Dict]:
-        async with aiohttp.ClientSession() as session:
-
-            async with session.get(
-                f"{self.tmdb_url}/search/movie",
-                headers={
-                    "Authorization": f"Bearer {self.tmdb_api_key}",
-                    "accept": "application/json",
-                },
-                params={
-                    "query": query,
-                    "include_adult": "false",
-                    "language": "en-US",
-                    "page": 1,
-                },
-            ) as response:
-                if response.status == 200:
-                    try:
-                        movie = await response.json()
-                        return movie['results'][0]
-                    except IndexError:
-                        raise Exception("No movie found")
-                else:
-                    raise Exception(f"Failed to update reservation: {response.status}")
+        key = normalize_text(query)
+        cached = self.movie_cache.get(key)
+        if cached is NO_MOVIE:
+            raise Exception("No movie found")
+        if cached is not None:
+            return cached
+
+        # only go to TMDB when the local index has the exact title or a close
+        # match with the same sequel numbers
+        movie = self.title_index.exact(query)
+        if movie is not None:
+            self.movie_cache.set(key, movie)
+            return movie
+        matches = self.title_index.search(query)
+        if matches and matches[0][0] >= self.fuzzy_threshold:
+            score, movie = matches[0]
+            logger.info(f"matched '{query}' to '{movie.get('title')}' locally ({score})")
+            self.movie_cache.set(key, movie, ttl=self.fuzzy_ttl)
+            return movie
+
+        session = self.get_session()
+        async with session.get(
+            f"{self.tmdb_url}/search/movie",
+            headers=self.tmdb_headers(),
+            params={
+                "query": query,
+                "include_adult": "false",
+                "language": "en-US",
+                "page": 1,
+            },
+        ) as response:
+            if response.status == 200:
+                try:
+                    movie = await response.json()
+                    result = movie['results'][0]
+                except IndexError:
+                    self.movie_cache.set(key, NO_MOVIE, ttl=self.movie_negative_ttl)
+                    raise Exception("No movie found")
+                self.movie_cache.set(key, result)
+                self.title_index.add(result)
+                return result
+            else:
+                raise Exception(f"Failed to update reservation: {response.status}")
+
+    async def prefetch_catalog(self):
+        # load the now playing and popular lists so most requested titles are
+        # answered from the cache
+        count = 0
+        session = self.get_session()
+        for path in ("movie/now_playing", "movie/popular"):
+            for page in range(1, self.catalog_pages + 1):
+                async with session.get(
+                    f"{self.tmdb_url}/{path}",
+                    headers=self.tmdb_headers(),
+                    params={"language": "en-US", "page": page},
+                ) as response:
+                    if response.status != 200:
+                        logger.warning(f"TMDB prefetch of {path} failed: {response.status}")
+                        break
+                    for movie in (await response.json()).get("results", []):
+                        key = normalize_text(movie.get("title", ""))
+                        if key and key not in self.movie_cache:
+                            self.movie_cache.set(key, movie)
+                            count += 1
+                        self.title_index.add(movie)
+        self._catalog_fetched_at = time.time()
+        await self.save_catalog_snapshot()
+        logger.info(f"prefetched {count} movies from TMDB, cache stats: {self.movie_cache.stats()}")
+
+    def read_catalog_snapshot(self) -> Optional[dict]:
+        """
+        The snapshot file as a dict, or None when there is none. The snapshot is
+        {"fetched_at": <unix time>, "movies": [...], "cache": {key: {"movie", "expires_at"}}}.
+        Blocks on the file, async callers run it in a thread.
+        """
+        if not self.catalog_path or not os.path.exists(self.catalog_path):
+            return None
+        try:
+            with open(self.catalog_path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"could not load movie catalog snapshot: {e}")
+            return None
+        if isinstance(snapshot, list):
+            # older snapshots only held the movie list
+            snapshot = {"movies": snapshot}
+        return snapshot
+
+    def apply_catalog_snapshot(self, snapshot: dict):
+        """Fill the title index and the movie cache from a snapshot and take over its fetch time."""
+        for movie in snapshot.get("movies", []):
+            self.title_index.add(movie)
+        now = time.time()
+        for key, entry in snapshot.get("cache", {}).items():
+            ttl = entry["expires_at"] - now
+            if ttl > 0 and key not in self.movie_cache:
+                self.movie_cache.set(key, entry["movie"], ttl=ttl)
+        self._catalog_fetched_at = max(self._catalog_fetched_at, snapshot.get("fetched_at", 0.0))
+
+    def load_catalog_snapshot(self):
+        # blocking, the service is built off the event loop (see main.entrypoint)
+        snapshot = self.read_catalog_snapshot()
+        if snapshot is not None:
+            self.apply_catalog_snapshot(snapshot)
+
+    def write_catalog_snapshot(self, snapshot: dict):
+        tmp_path = f"{self.catalog_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.catalog_path)
+
+    async def save_catalog_snapshot(self):
+        if not self.catalog_path:
+            return
+        # other worker processes write the same file, keep what they added; the
+        # file is read and written in a thread, the index and cache stay on the loop
+        snapshot = await asyncio.to_thread(self.read_catalog_snapshot)
+        if snapshot is not None:
+            self.apply_catalog_snapshot(snapshot)
+        now = time.time()
+        default_ttl = self.movie_cache.ttl or 86400
+        snapshot = {
+            "fetched_at": self._catalog_fetched_at,
+            "movies": list(self.title_index.movies),
+            "cache": {
+                key: {"movie": movie, "expires_at": now + (default_ttl if ttl is None else ttl)}
+                for key, movie, ttl in self.movie_cache.items()
+                if movie is not NO_MOVIE
+            },
+        }
+        await asyncio.to_thread(self.write_catalog_snapshot, snapshot)
+
+    def ensure_catalog(self):
+        """Start a background catalog prefetch if none ran recently."""
+        if self.catalog_pages <= 0 or (self._catalog_task and not self._catalog_task.done()):
+            return
+        if self._catalog_fetched_at and time.time() - self._catalog_fetched_at < self.catalog_refresh:
+            return
+        self._catalog_task = asyncio.create_task(self.prefetch_catalog())
+        self._catalog_task.add_done_callback(self._on_catalog_done)
+
+    def _on_catalog_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"TMDB prefetch failed: {task.exception()}")
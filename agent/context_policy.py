@@ -0,0 +1,125 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count, ~4 characters per token for English text."""
+    return len(text) // 4
+
+
+def estimate_tokens(message) -> int:
+    """Rough token count of a chat message plus framing."""
+    content = message.content
+    parts = content if isinstance(content, list) else [content]
+    texts = [part for part in parts if isinstance(part, str)]
+    for call in message.tool_calls or ():
+        texts += [call.function_info.name, getattr(call, "raw_arguments", "") or ""]
+    return count_tokens("".join(texts)) + 4
+
+
+def opening(text: str, chars: int) -> str:
+    """The first `chars` characters of text, cut back to a sentence or word end."""
+    if len(text) <= chars:
+        return text
+    head = text[:chars]
+    cut = max(head.rfind(". "), head.rfind("\n"))
+    if cut < chars // 2:
+        cut = head.rfind(" ")
+    return head[: cut + 1 if cut > 0 else chars].strip()
+
+
+@dataclass
+class Compaction:
+    messages: List
+    tokens_before: int
+    tokens_after: int
+    decisions: List[str] = field(default_factory=list)
+
+
+class ContextCompactor:
+    """
+    Keeps the chat history sent to the LLM within a token budget.
+
+    - Leading system messages are never touched, so the prompt prefix stays
+      identical between turns and provider prompt caching keeps working.
+    - Tool outputs older than the last `keep_tool_outputs` are cut down to
+      their opening (stale RAG chunks are the bulk of a long document session).
+    - When the history is still over `budget`, the oldest turns (a user message
+      and the replies and tool calls that followed it) are dropped until it is
+      under `low_water * budget`; the latest turn is always kept.
+
+    Decisions are remembered per message id and reapplied on later turns, so
+    the compacted history only changes when the budget is hit again instead
+    of shifting every turn.
+    """
+
+    def __init__(
+        self,
+        budget: int = 4000,
+        low_water: float = 0.75,
+        keep_tool_outputs: int = 1,
+        stub_chars: int = 200,
+    ):
+        self.budget = budget
+        self.low_water = low_water
+        self.keep_tool_outputs = keep_tool_outputs
+        self.stub_chars = stub_chars
+        self.trimmed: Dict[str, str] = {}
+        self.dropped: Set[str] = set()
+
+    @classmethod
+    def from_env(cls) -> "ContextCompactor":
+        return cls(
+            budget=int(os.getenv("CHAT_CONTEXT_TOKENS", "4000")),
+            low_water=float(os.getenv("CHAT_CONTEXT_LOW_WATER", "0.75")),
+            keep_tool_outputs=int(os.getenv("CHAT_CONTEXT_KEEP_TOOL_OUTPUTS", "1")),
+            stub_chars=int(os.getenv("CHAT_CONTEXT_STUB_CHARS", "200")),
+        )
+
+    def compact(self, messages: List) -> Compaction:
+        tokens_before = sum(estimate_tokens(message) for message in messages)
+        decisions = []
+
+        prefix_len = 0
+        while prefix_len < len(messages) and messages[prefix_len].role == "system":
+            prefix_len += 1
+        prefix = messages[:prefix_len]
+        history = [message for message in messages[prefix_len:] if message.id not in self.dropped]
+
+        tool_outputs = [message for message in history if message.role == "tool"]
+        stale = tool_outputs[: max(len(tool_outputs) - self.keep_tool_outputs, 0)]
+        for message in stale:
+            if message.id not in self.trimmed:
+                content = message.content if isinstance(message.content, str) else ""
+                if len(content) <= self.stub_chars:
+                    continue
+                self.trimmed[message.id] = (
+                    f"{opening(content, self.stub_chars)} "
+                    f"[earlier {message.name or 'tool'} output trimmed, {len(content)} characters]"
+                )
+                decisions.append(f"trimmed {message.name or 'tool'} output {message.id} ({len(content)} chars)")
+            message.content = self.trimmed[message.id]
+
+        tokens = sum(estimate_tokens(message) for message in prefix + history)
+        if tokens > self.budget:
+            # group the history into turns, each starting at a user message
+            turns: List[List] = []
+            for message in history:
+                if message.role == "user" or not turns:
+                    turns.append([])
+                turns[-1].append(message)
+            target = self.low_water * self.budget
+            while len(turns) > 1 and tokens > target:
+                turn = turns.pop(0)
+                tokens -= sum(estimate_tokens(message) for message in turn)
+                self.dropped.update(message.id for message in turn)
+                decisions.append(f"dropped oldest turn ({len(turn)} messages)")
+            history = [message for turn in turns for message in turn]
+
+        return Compaction(
+            messages=prefix + history,
+            tokens_before=tokens_before,
+            tokens_after=tokens,
+            decisions=decisions,
+        )
@@ -0,0 +1,105 @@
+"""
+Per-call ClientSession vs the pooled CinemaService session, against a stub
+reservation service on localhost.
+
+    python http_bench.py [--requests 500] [--concurrency 32] [--delay-ms 5]
+
+"per-call" opens a session (and so a new connection) for every request, the
+way the service did before sessions were pooled; "pooled" goes through
+CinemaService.get_reservation. Both run once one request at a time and once
+with `concurrency` requests in flight, p50/p99 are per request.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Awaitable, Callable, List
+
+import aiohttp
+from aiohttp import web
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def start_stub(delay: float) -> tuple:
+    async def reservation(request):
+        if delay:
+            await asyncio.sleep(delay)
+        return web.json_response({"id": int(request.match_info["id"]), "room": "Small Room", "status": "pending"})
+
+    app = web.Application()
+    app.router.add_get("/reservations/{id}", reservation)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+async def measure(call: Callable[[int], Awaitable], requests: int, concurrency: int) -> tuple:
+    latencies: List[float] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def run(requests: int, concurrency: int, delay: float):
+    runner, base_url = await start_stub(delay)
+    os.environ["RES_BASE_URL"] = base_url
+    os.environ.setdefault("TMDB_CATALOG_PATH", "")
+    from cinema_service import CinemaService
+
+    service = CinemaService()
+
+    async def per_call(i: int):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{base_url}/reservations/{i}") as response:
+                return await response.json()
+
+    async def pooled(i: int):
+        return await service.get_reservation(i)
+
+    print(f"{requests} requests, stub delay {delay * 1000:.0f}ms")
+    print(f"{'path':<9} {'in flight':>9} {'req/s':>7} {'p50 ms':>7} {'p99 ms':>7}")
+    try:
+        for label, call in (("per-call", per_call), ("pooled", pooled)):
+            for in_flight in (1, concurrency):
+                await call(0)  # warm up, the pooled path opens its connection here
+                latencies, elapsed = await measure(call, requests, in_flight)
+                print(
+                    f"{label:<9} {in_flight:>9} {requests / elapsed:>7.0f} "
+                    f"{percentile(latencies, 0.5) * 1000:>7.2f} {percentile(latencies, 0.99) * 1000:>7.2f}"
+                )
+    finally:
+        await service.aclose()
+        await runner.cleanup()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="http_bench")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--delay-ms", type=float, default=5.0, help="stub server latency per request")
+    args = parser.parse_args(argv)
+
+    asyncio.run(run(args.requests, args.concurrency, args.delay_ms / 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
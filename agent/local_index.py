@@ -0,0 +1,252 @@
+# Shared by the agent and the reservations service, both copies are kept
+# identical (see agent/tests/test_shared_modules.py).
+import os
+import json
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class LocalIndex:
+    """
+    On-disk vector index with one directory per namespace:
+
+        <root>/<namespace>/manifest.json       segment names, and which one has IVF lists
+        <root>/<namespace>/<segment>.npy       unit-normalized float32/float16 matrix
+        <root>/<namespace>/<segment>.jsonl     one {"id", "metadata"} object per row
+        <root>/<namespace>/<segment>.ivf.npz   optional IVF lists for a big segment
+
+    Every `add` writes a new segment and then swaps in a manifest listing it,
+    so a reader sees either all of a batch (vectors and rows) or none of it and
+    ingestion cost stays linear. `finalize` merges the segments of a namespace
+    into one and, above `ivf_threshold` rows, builds a k-means IVF index for it
+    so only the `nprobe` closest lists are scanned; other segments are searched
+    with a brute-force cosine top-k.
+
+    Matrices are opened memory-mapped, so several worker processes share the
+    same pages. The file layout is shared by the agent and the reservations
+    service.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        dtype: str = "float32",
+        ivf_threshold: int = 20000,
+        nprobe: int = 8,
+        batch_size: int = 65536,
+    ):
+        self.root = root
+        self.dtype = np.dtype(dtype)
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.batch_size = batch_size
+        self._loaded: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, namespace: str, name: str = "") -> str:
+        if not namespace or os.sep in namespace or namespace.startswith("."):
+            raise ValueError(f"Invalid namespace: {namespace!r}")
+        return os.path.join(self.root, namespace, name)
+
+    def _manifest(self, namespace: str) -> dict:
+        try:
+            with open(self._path(namespace, "manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": [], "ivf": None}
+
+    def _write_manifest(self, namespace: str, manifest: dict):
+        path = self._path(namespace, "manifest.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+        self._loaded.pop(namespace, None)
+
+    def _write_segment(self, namespace: str, name: str, matrix: np.ndarray, rows: Iterable[dict]):
+        vectors_path = self._path(namespace, f"{name}.npy")
+        np.save(vectors_path + ".tmp.npy", matrix)
+        os.replace(vectors_path + ".tmp.npy", vectors_path)
+        meta_path = self._path(namespace, f"{name}.jsonl")
+        with open(meta_path + ".tmp", "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _load(self, namespace: str) -> Optional[tuple]:
+        manifest_path = self._path(namespace, "manifest.json")
+        for _ in range(3):
+            try:
+                mtime = os.stat(manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                self._loaded.pop(namespace, None)
+                return None
+
+            with self._lock:
+                cached = self._loaded.get(namespace)
+                if cached and cached[0] == mtime:
+                    return cached
+                try:
+                    manifest = self._manifest(namespace)
+                    segments = []
+                    for name in manifest["segments"]:
+                        vectors = np.load(self._path(namespace, f"{name}.npy"), mmap_mode="r")
+                        with open(self._path(namespace, f"{name}.jsonl")) as f:
+                            rows = [json.loads(line) for line in f]
+                        ivf = None
+                        if manifest.get("ivf") == name:
+                            with np.load(self._path(namespace, f"{name}.ivf.npz")) as data:
+                                ivf = (data["centroids"], data["order"], data["offsets"])
+                        segments.append((vectors, rows, ivf))
+                except FileNotFoundError:
+                    # a writer merged the segments under us, read the new manifest
+                    continue
+                cached = (mtime, segments)
+                self._loaded[namespace] = cached
+                return cached
+        return None
+
+    def version(self, namespace: str) -> Optional[int]:
+        """Changes whenever the namespace is written to, None if it does not exist."""
+        try:
+            return os.stat(self._path(namespace, "manifest.json")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def count(self, namespace: str) -> int:
+        loaded = self._load(namespace)
+        return 0 if loaded is None else sum(len(rows) for _, rows, _ in loaded[1])
+
+    def add(
+        self,
+        namespace: str,
+        vectors: List[List[float]],
+        metadatas: List[dict],
+        ids: List[str],
+    ) -> List[str]:
+        if not len(vectors):
+            return []
+        new = np.asarray(vectors, dtype=np.float32)
+        new /= np.maximum(np.linalg.norm(new, axis=1, keepdims=True), 1e-12)
+
+        os.makedirs(self._path(namespace), exist_ok=True)
+        with self._lock:
+            manifest = self._manifest(namespace)
+            name = f"{self._next_segment(manifest):06d}"
+            self._write_segment(
+                namespace,
+                name,
+                new.astype(self.dtype),
+                ({"id": id_, "metadata": metadata} for id_, metadata in zip(ids, metadatas)),
+            )
+            manifest["segments"].append(name)
+            self._write_manifest(namespace, manifest)
+        return ids
+
+    @staticmethod
+    def _next_segment(manifest: dict) -> int:
+        return max((int(name) for name in manifest["segments"]), default=0) + 1
+
+    def finalize(self, namespace: str):
+        """Merge the segments of a namespace and build its IVF index once."""
+        with self._lock:
+            manifest = self._manifest(namespace)
+            old = manifest["segments"]
+            parts = [np.load(self._path(namespace, f"{name}.npy"), mmap_mode="r") for name in old]
+            if len(old) <= 1 and (
+                manifest.get("ivf") or sum(len(part) for part in parts) < self.ivf_threshold
+            ):
+                return
+            matrix = np.concatenate(parts)
+            rows = []
+            for name in old:
+                with open(self._path(namespace, f"{name}.jsonl")) as f:
+                    rows.extend(json.loads(line) for line in f)
+
+            name = f"{self._next_segment(manifest):06d}"
+            self._write_segment(namespace, name, matrix, rows)
+            ivf = None
+            if len(matrix) >= self.ivf_threshold:
+                self._build_ivf(matrix, self._path(namespace, f"{name}.ivf.npz"))
+                ivf = name
+            self._write_manifest(namespace, {"segments": [name], "ivf": ivf})
+            for stale in old:
+                for suffix in (".npy", ".jsonl", ".ivf.npz"):
+                    try:
+                        os.remove(self._path(namespace, stale + suffix))
+                    except FileNotFoundError:
+                        pass
+
+    def _build_ivf(self, matrix: np.ndarray, path: str, iterations: int = 10):
+        n = len(matrix)
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        sample = matrix[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        sample = sample.astype(np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(nlist):
+                members = sample[assign == i]
+                if len(members):
+                    centroids[i] = members.mean(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        assign = np.concatenate(
+            [
+                np.argmax(matrix[i : i + self.batch_size].astype(np.float32) @ centroids.T, axis=1)
+                for i in range(0, n, self.batch_size)
+            ]
+        )
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=centroids, order=order, offsets=offsets)
+        os.replace(tmp_path, path)
+
+    def _candidates(self, ivf: tuple, query: np.ndarray) -> np.ndarray:
+        centroids, order, offsets = ivf
+        nprobe = min(self.nprobe, len(centroids))
+        lists = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        return np.sort(np.concatenate([order[offsets[i] : offsets[i + 1]] for i in lists]))
+
+    def _scores(self, vectors: np.ndarray, ivf: Optional[tuple], query: np.ndarray):
+        if ivf is not None:
+            candidates = self._candidates(ivf, query)
+            return candidates, vectors[candidates].astype(np.float32) @ query
+        scores = np.concatenate(
+            [
+                vectors[i : i + self.batch_size].astype(np.float32) @ query
+                for i in range(0, len(vectors), self.batch_size)
+            ]
+        )
+        return None, scores
+
+    def query(self, namespace: str, vector: List[float], top_k: int = 4) -> List[dict]:
+        loaded = self._load(namespace)
+        if loaded is None:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        matches = []
+        for vectors, rows, ivf in loaded[1]:
+            candidates, scores = self._scores(vectors, ivf, query)
+            k = min(top_k, len(scores))
+            if k == 0:
+                continue
+            top = np.argpartition(-scores, k - 1)[:k]
+            for i in top:
+                row = rows[int(candidates[i] if candidates is not None else i)]
+                matches.append({"id": row["id"], "score": float(scores[i]), "metadata": row["metadata"]})
+        matches.sort(key=lambda match: -match["score"])
+        return matches[:top_k]
+
+    def delete_namespace(self, namespace: str):
+        with self._lock:
+            self._loaded.pop(namespace, None)
+            shutil.rmtree(self._path(namespace), ignore_errors=True)
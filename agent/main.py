@@ -1,9 +1,13 @@
 import os
+import sys
+import asyncio
 import logging
+import importlib
+from time import perf_counter
 
 # import random
 import json
-from typing import Annotated, Dict, Any
+from typing import Annotated, Callable, Dict, Any, Optional, TYPE_CHECKING
 from dataclasses import dataclass
 
 from dotenv import load_dotenv
@@ -16,15 +20,105 @@ from livekit.agents import (
     llm,
 )
 from livekit.agents.pipeline import AgentCallContext, VoicePipelineAgent
-from livekit.plugins import deepgram, openai, silero, cartesia, elevenlabs
+from cache import normalize_text
 from cinema_service import CinemaService
-from rag_service import RAGService
+from prewarm import ClientRegistry, SessionTimer, client_is_open, parse_client_names
+from tool_budget import PENDING, ToolBudget
+from tracing import TurnTracer
+from speech_text import before_tts
+from context_policy import ContextCompactor
+
+if TYPE_CHECKING:
+    from rag_service import RAGService
 load_dotenv()
 
 logger = logging.getLogger("demo")
 logger.setLevel(logging.INFO)
-cinema_service = CinemaService()
-rag_service = RAGService()
+
+# Only the configured providers are imported, so a worker only pays for the
+# plugins it uses, and the RAG stack (OpenAI, Pinecone gRPC, NumPy) is only
+# loaded once a RAG session needs it. livekit plugins register themselves on
+# import and that must happen on the main thread (Plugin.register_plugin raises
+# otherwise), so the provider modules are imported by import_plugins() before
+# the worker starts; jobs and prewarm may run on executor threads
+# (JobExecutorType.THREAD, the default on Windows).
+STT_PROVIDERS = {
+    "deepgram": ("livekit.plugins.deepgram", lambda m: m.STT(api_key=os.getenv("DEEPGRAM_API_KEY", ""))),
+}
+TTS_PROVIDERS = {
+    "deepgram": ("livekit.plugins.deepgram", lambda m: m.TTS(api_key=os.getenv("DEEPGRAM_API_KEY", ""))),
+    "elevenlabs": ("livekit.plugins.elevenlabs", lambda m: m.TTS(api_key=os.getenv("ELEVENLABS_API_KEY", ""))),
+    "cartesia": ("livekit.plugins.cartesia", lambda m: m.TTS(api_key=os.getenv("CARTESIA_API_KEY", ""))),
+    "openai": ("livekit.plugins.openai", lambda m: m.TTS(api_key=os.getenv("OPENAI_API_KEY", ""), voice="nova")),
+}
+LLM_PROVIDERS = {
+    "openai": ("livekit.plugins.openai", lambda m: m.LLM(model="gpt-4o-mini", api_key=os.getenv("OPENAI_API_KEY", ""))),
+    "groq": ("livekit.plugins.openai", lambda m: m.LLM.with_groq(model="llama-3.3-70b-versatile", api_key=os.getenv("GROQ_API_KEY", ""))),
+    "azure": (
+        "livekit.plugins.openai",
+        lambda m: m.LLM.with_azure(
+            azure_endpoint=os.getenv("AZURE_URL", ""),
+            azure_deployment=os.getenv("AZURE_DEPLOYMENT", ""),
+            api_key=os.getenv("AZURE_API_KEY", ""),
+            api_version=os.getenv("AZURE_API_VERSION", ""),
+        ),
+    ),
+}
+# how long reservation_details waits on each backend before using a fallback
+STAGE_TIMEOUT = float(os.getenv("RESERVATION_STAGE_TIMEOUT", "2"))
+# start the TMDB lookup as soon as a title is mentioned, before the booking step
+SPECULATIVE_MOVIE_LOOKUP = os.getenv("SPECULATIVE_MOVIE_LOOKUP", "true").lower() == "true"
+# segment and normalize LLM text before it reaches TTS, see speech_text.py
+TTS_SEGMENTATION = os.getenv("TTS_SEGMENTATION", "true").lower() == "true"
+# fixed phrases are synthesized once and replayed from disk, see phrase_cache.py
+PHRASE_CACHE_DIR = os.getenv("PHRASE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "phrase_cache"))
+PHRASE_CACHE_EXTRA = [phrase for phrase in os.getenv("PHRASE_CACHE_PHRASES", "").split("|") if phrase.strip()]
+RESERVATIONS_GREETING = "Hi This is Emma from CineLounge! How can I help ?"
+RAG_GREETING = "Hi, I'm Alice, your personal document assistant. How can I help you today?"
+STT_PROVIDER = os.getenv("STT_PROVIDER", "deepgram")
+TTS_PROVIDER = os.getenv("TTS_PROVIDER", "deepgram")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+
+
+def plugin_modules() -> list[str]:
+    modules = [
+        providers[name][0]
+        for providers, name in (
+            (STT_PROVIDERS, STT_PROVIDER), (TTS_PROVIDERS, TTS_PROVIDER), (LLM_PROVIDERS, LLM_PROVIDER)
+        )
+    ]
+    return list(dict.fromkeys([*modules, "livekit.plugins.silero"]))
+
+
+def import_plugins():
+    # main thread only, see above
+    for module_name in plugin_modules():
+        importlib.import_module(module_name)
+
+
+def build_provider(providers: dict, name: str):
+    module_name, build = providers[name]
+    return build(importlib.import_module(module_name))
+
+
+def build_tts():
+    provider = build_provider(TTS_PROVIDERS, TTS_PROVIDER)
+    if not PHRASE_CACHE_DIR:
+        return provider
+    from phrase_cache import PhraseAudioStore, PhraseCacheTTS
+
+    return PhraseCacheTTS(
+        provider,
+        PhraseAudioStore(PHRASE_CACHE_DIR),
+        [RESERVATIONS_GREETING, RAG_GREETING, *PHRASE_CACHE_EXTRA],
+        TTS_PROVIDER,
+    )
+
+
+def build_rag_service():
+    from rag_service import RAGService
+
+    return RAGService()
 
 
 @dataclass
@@ -48,6 +142,47 @@ class AssistantFnc(llm.FunctionContext):
     """
     The class defines a set of LLM functions that the assistant can execute.
     """
+    def __init__(self, cinema_service: CinemaService):
+        super().__init__()
+        self.cinema_service = cinema_service
+        self.movie_lookups: Dict[str, asyncio.Task] = {}
+        self.budget = ToolBudget()
+
+    def lookup_movie(self, movie_name: str) -> asyncio.Task:
+        """Start (or reuse) the TMDB lookup for a title mentioned in this session."""
+        key = normalize_text(movie_name)
+        task = self.movie_lookups.get(key)
+        if task is None or (task.done() and task.exception() is not None):
+            task = asyncio.create_task(self.cinema_service.retrieve_movie(movie_name))
+            # a speculative lookup nobody awaits should not log "exception never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self.movie_lookups[key] = task
+        return task
+
+    async def lookup_details(
+        self, movie_name: str, date: str, time: str, party_size: int, timings: Dict[str, float]
+    ) -> tuple[str, Dict]:
+        # the room check and the movie lookup are independent, run them together
+        async def timed(name, awaitable):
+            stage_start = perf_counter()
+            try:
+                return await asyncio.wait_for(awaitable, STAGE_TIMEOUT)
+            finally:
+                timings[name] = (perf_counter() - stage_start) * 1000
+
+        room, movie = await asyncio.gather(
+            timed("room", self.cinema_service.recommend_available_room(party_size, date, time)),
+            # shielded so a timeout here still lets the lookup finish and fill the cache
+            timed("movie", asyncio.shield(self.lookup_movie(movie_name))),
+            return_exceptions=True,
+        )
+        if isinstance(room, BaseException):
+            logger.warning(f"room availability check failed: {room!r}")
+            room = self.cinema_service.recommend_room(party_size)
+        if isinstance(movie, BaseException):
+            logger.warning(f"movie lookup for '{movie_name}' failed: {movie!r}")
+            movie = {}
+        return room, movie
 
     @llm.ai_callable(description="Collect and validate customer contact information")
     async def set_customer_info(
@@ -56,8 +191,14 @@ class AssistantFnc(llm.FunctionContext):
         phone_number: Annotated[
             str, llm.TypeInfo(description="Customer's phone number")
         ],
+        movie_name: Annotated[
+            str,
+            llm.TypeInfo(description="Name of the movie, only if the customer already mentioned one"),
+        ] = "",
     ) -> str:
-        # if not cinema_service.validate_phone_number(phone_number.replace(" ", "")):
+        if movie_name and SPECULATIVE_MOVIE_LOOKUP:
+            self.lookup_movie(movie_name)
+        # if not self.cinema_service.validate_phone_number(phone_number.replace(" ", "")):
         #     return "The phone number provided is invalid. Please provide a valid US phone number, hint: it's 10 digits and starts with 1"
 
         self.current_reservation = getattr(self, "current_reservation", {})
@@ -77,7 +218,13 @@ class AssistantFnc(llm.FunctionContext):
         ],
     ) -> str:
         try:
-            reservation = await cinema_service.get_reservation(reservation_id)
+            reservation = await self.budget.run(
+                "check_existing_reservation",
+                reservation_id,
+                lambda: self.cinema_service.get_reservation(reservation_id),
+            )
+            if reservation is PENDING:
+                return self.budget.interim_reply
             self.old_reservation = getattr(self, "old_reservation", {})
             self.old_reservation.update(reservation)
             return reservation
@@ -93,9 +240,13 @@ class AssistantFnc(llm.FunctionContext):
         ],
     ) -> str:
         try:
-            result = await cinema_service.update_reservation(
-                reservation_id, {"status": "cancelled"}
+            result = await self.budget.run(
+                "cancel_reservation",
+                reservation_id,
+                lambda: self.cinema_service.update_reservation(reservation_id, {"status": "cancelled"}),
             )
+            if result is PENDING:
+                return self.budget.interim_reply
             return "Your reservation has been successfully canceled. We hope to see you soon!"
         except Exception as e:
             return f"Sorry, I couldn't cancel the reservation. Please try again later!"
@@ -112,7 +263,7 @@ class AssistantFnc(llm.FunctionContext):
     #     include_snakes: Annotated[bool|None, llm.TypeInfo(description="Whether the reservation includes snacks package or not")],
     # ) -> str:
     #     try:
-    #         result = await cinema_service.update_reservation(reservation_id, {"movie_name": movie_name, "date": date, "time": time, "party_size": party_size, "include_snakes": include_snakes})
+    #         result = await self.cinema_service.update_reservation(reservation_id, {"movie_name": movie_name, "date": date, "time": time, "party_size": party_size, "include_snakes": include_snakes})
     #         return "Your reservation has been successfully updated. Enjoy your movie!"
     #     except Exception as e:
     #         return f"Sorry, I couldn't update the reservation. Please try again later!"
@@ -156,14 +307,29 @@ class AssistantFnc(llm.FunctionContext):
                 "Before booking your reservation, I need your contact information. "
                 "Could you please provide your name and phone number?"
             )
+        start = perf_counter()
         if date and time:
-            is_valid, message = cinema_service.validate_datetime(date, time)
+            is_valid, message = self.cinema_service.validate_datetime(date, time)
             if not is_valid:
                 return message
 
-        room = cinema_service.recommend_room(party_size)
-        movie = await cinema_service.retrieve_movie(movie_name)
-        print(f"{movie = }")
+        timings = {"validate": (perf_counter() - start) * 1000}
+        details = await self.budget.run(
+            "reservation_details",
+            (normalize_text(movie_name), date, time, party_size),
+            lambda: self.lookup_details(movie_name, date, time, party_size, timings),
+        )
+        if details is PENDING:
+            return self.budget.interim_reply
+        room, movie = details
+        timings["total"] = (perf_counter() - start) * 1000
+        logger.info(
+            "reservation_details timings: "
+            + ", ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items())
+        )
+        if room is None:
+            # nothing to hold yet, the customer picks another time or party size
+            return self.cinema_service.no_room_message(party_size)
         self.current_reservation.update(
             {
                 "movie_name": movie_name,
@@ -201,8 +367,16 @@ class AssistantFnc(llm.FunctionContext):
         if not customer_confirmation:
             return "No problem! Let me know if you want to confirm the reservation or if you need to make any changes."
 
-        # Process booking with the cinema service
-        result = await cinema_service.process_reservation(self.current_reservation)
+        # Process booking with the cinema service, keyed by the details so a
+        # booking still running in the background is never submitted twice
+        reservation = dict(self.current_reservation)
+        result = await self.budget.run(
+            "confirm_reservation",
+            tuple(sorted(reservation.items())),
+            lambda: self.cinema_service.process_reservation(reservation),
+        )
+        if result is PENDING:
+            return self.budget.interim_reply
 
         if result.get("success"):
             confirmation_id = result["id"]
@@ -225,30 +399,104 @@ class RAGFnc(llm.FunctionContext):
     """
     The class defines a set of LLM functions that the assistant can execute.
     """
-    def __init__(self, namespace: str):
+    def __init__(
+        self,
+        namespace: str,
+        rag_service: "RAGService",
+        on_connection_error: Optional[Callable[[], None]] = None,
+    ):
         super().__init__()  # Call the superclass's __init__ method
         self.namespace = namespace
+        self.rag_service = rag_service
+        self.on_connection_error = on_connection_error
+        self.budget = ToolBudget()
     @llm.ai_callable(description="Get more information about a specific topic")
     async def query_info(
         self,
         query: Annotated[str, llm.TypeInfo(description="The user's query")],
     ) -> str:
         logger.info(f"Querying RAG with: {query}")
-        return rag_service.retrieve_docs(query, self.namespace)
+        try:
+            docs = await self.budget.run(
+                "query_info", query, lambda: self.rag_service.aretrieve_docs(query, self.namespace)
+            )
+        except Exception as e:
+            if self.on_connection_error is not None and self.rag_service.is_connection_error(e):
+                self.on_connection_error()
+            raise
+        return self.budget.interim_reply if docs is PENDING else docs
 
 def prewarm_process(proc: JobProcess):
+    from livekit.plugins import silero
+
     # preload silero VAD in memory to speed up session start
     proc.userdata["vad"] = silero.VAD.load()
 
+    # shared clients are built once per process and reused by every job it
+    # runs; the mode specific services are only built when a session needs them
+    clients = ClientRegistry()
+    # every client is checked before a job gets it and rebuilt when broken
+    clients.register("stt", lambda: build_provider(STT_PROVIDERS, STT_PROVIDER), check=client_is_open)
+    clients.register("tts", build_tts, check=client_is_open)
+    clients.register("llm", lambda: build_provider(LLM_PROVIDERS, LLM_PROVIDER), check=client_is_open)
+    # the cinema service holds the pooled HTTP session, closed once the last
+    # job of the process is done rather than by whichever job ends first
+    clients.register(
+        "cinema",
+        CinemaService,
+        check=lambda service: service.is_open(),
+        close=lambda service: service.aclose(),
+    )
+    clients.register("rag", build_rag_service, check=lambda service: service.is_open())
+    # rag is left out by default: building it imports the Pinecone and OpenAI
+    # stack and opens the index in every worker process, which only pays off
+    # on workers that mostly serve documents (PREWARM_CLIENTS=stt,tts,llm,rag);
+    # otherwise the first document session builds it on demand
+    clients.warm(*parse_client_names(os.getenv("PREWARM_CLIENTS", "stt,tts,llm")))
+    proc.userdata["clients"] = clients
+
+
+def get_clients(proc: JobProcess) -> ClientRegistry:
+    # prewarm_fnc normally runs first, this keeps the entrypoint usable without it
+    if "clients" not in proc.userdata:
+        prewarm_process(proc)
+    return proc.userdata["clients"]
+
 
 async def entrypoint(ctx: JobContext):
+    timer = SessionTimer(ctx.room.name)
+    clients = get_clients(ctx.proc)
+    clients.hold()
+
+    async def _release_clients():
+        await clients.release()
+        logger.info(f"shared clients after {ctx.room.name}: {clients.stats()}")
+
+    ctx.add_shutdown_callback(_release_clients)
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+    timer.mark("connected")
     participant = await ctx.wait_for_participant()
+    timer.mark("participant")
 
     metadata = participant.metadata or "{}"
     config = parse_session_config(json.loads(metadata))
     namespace = config.namespace
-    fnc_ctx = RAGFnc(namespace) if config.mode == "rag" and namespace else AssistantFnc()
+    if config.mode == "rag" and namespace:
+        # building a service blocks (index handles, snapshot files), keep it off the loop
+        rag_service = await asyncio.to_thread(clients.get, "rag")
+        # a retrieval that got no response drops the shared service, the
+        # next session builds a new one
+        fnc_ctx = RAGFnc(namespace, rag_service, on_connection_error=lambda: clients.reset("rag"))
+    else:
+        cinema_service = await asyncio.to_thread(clients.get, "cinema")
+
+        async def _persist_catalog():
+            # the service is shared with other jobs, this one only saves what it learned
+            await cinema_service.persist()
+
+        ctx.add_shutdown_callback(_persist_catalog)
+        cinema_service.ensure_catalog()
+        fnc_ctx = AssistantFnc(cinema_service)
 
     if config.mode == "rag":
         initial_chat_ctx = llm.ChatContext().append(
@@ -315,48 +563,69 @@ async def entrypoint(ctx: JobContext):
     
     logger.info(f"connecting to room {ctx.room.name}")
     
-    stt = deepgram.STT(api_key=os.getenv("DEEPGRAM_API_KEY", ""))
-    tts = deepgram.TTS(api_key=os.getenv("DEEPGRAM_API_KEY", ""))
-    # tts = elevenlabs.TTS(api_key=os.getenv("ELEVENLABS_API_KEY", ""))
-    # tts = cartesia.TTS(api_key=os.getenv('CARTESIA_API_KEY', ""))
-    # tts = openai.TTS(api_key=os.getenv("OPENAI_API_KEY", ""),voice='nova')
+    # keep the history sent to the LLM within a token budget, see context_policy.py
+    compactor = ContextCompactor.from_env()
+
+    def _before_llm(agent: VoicePipelineAgent, chat_ctx: llm.ChatContext):
+        result = compactor.compact(chat_ctx.messages)
+        chat_ctx.messages[:] = result.messages
+        logger.info(
+            f"chat context for {ctx.room.name}: {result.tokens_before} -> {result.tokens_after} tokens, "
+            f"{len(result.messages)} messages"
+            + (f", {'; '.join(result.decisions)}" if result.decisions else "")
+        )
+        # None lets the agent create the default LLM stream from chat_ctx
 
     agent = VoicePipelineAgent(
         vad=ctx.proc.userdata["vad"],
-        stt=stt,
-        # llm=openai.LLM.with_azure(
-        #     azure_endpoint=os.getenv("AZURE_URL", ""),
-        #     azure_deployment=os.getenv("AZURE_DEPLOYMENT", ""),
-        #     api_key=os.getenv("AZURE_API_KEY", ""),
-        #     api_version=os.getenv("AZURE_API_VERSION", ""),
-        # ),
-        llm=openai.LLM(model="gpt-4o-mini", api_key=os.getenv("OPENAI_API_KEY", "")),
-        # llm=openai.LLM.with_groq(model="llama-3.1-8b-instant",api_key=os.getenv("GROQ_API_KEY", "")),
-        # llm=openai.LLM.with_groq(
-        #     model="llama-3.3-70b-versatile", api_key=os.getenv("GROQ_API_KEY", "")
-        # ),
-        tts=tts,
+        stt=clients.get("stt"),
+        llm=clients.get("llm"),
+        tts=clients.get("tts"),
         fnc_ctx=fnc_ctx,
         chat_ctx=initial_chat_ctx,
         max_nested_fnc_calls=2,
+        before_llm_cb=_before_llm,
+        **({"before_tts_cb": before_tts} if TTS_SEGMENTATION else {}),
     )
+    timer.mark("agent_built")
+
+    async def _close_tools():
+        logger.info(f"tool latency budget for {ctx.room.name}: {fnc_ctx.budget.stats()}")
+        tts = clients.get("tts")
+        if hasattr(tts, "hits"):
+            logger.info(f"phrase audio cache: {tts.hits} hits, {tts.misses} misses")
+        fnc_ctx.budget.cancel()
+
+    ctx.add_shutdown_callback(_close_tools)
+
+    # per-turn latency spans, logged as JSON and kept as histograms
+    tracer = TurnTracer(config.mode, ctx.room.name)
+    tracer.attach(agent)
+
+    @agent.on("agent_started_speaking")
+    def _on_first_speech():
+        if "first_greeting" not in timer.marks:
+            timer.mark("first_greeting")
+            logger.info(f"session start timings for {ctx.room.name} ({config.mode}): {timer.report()}")
 
     # Start the assistant. This will automatically publish a microphone track and listen to the participant.
     agent.start(ctx.room, participant)
+    timer.mark("agent_started")
 
     if config.mode == "rag":
-        await agent.say(
-            "Hi, I'm Alice, your personal document assistant. How can I help you today?",
-            allow_interruptions=True,
-        )
+        await agent.say(RAG_GREETING, allow_interruptions=True)
     else:
-        await agent.say(
-            "Hi This is Emma from CineLounge! How can I help ?",
-            allow_interruptions=True,
-        )
+        await agent.say(RESERVATIONS_GREETING, allow_interruptions=True)
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["profile-imports"]:
+        from startup_profile import main as profile_imports
+
+        sys.exit(profile_imports(sys.argv[2:], plugin_modules()))
+    # also how download-files finds the assets to fetch, plugins register
+    # them on import
+    import_plugins()
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
@@ -0,0 +1,226 @@
+import os
+import mmap
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from livekit import rtc
+from livekit.agents import tokenize, tts, utils
+from livekit.agents.types import APIConnectOptions
+
+logger = logging.getLogger("phrase-cache")
+
+
+def phrase_key(text: str) -> str:
+    return " ".join(text.split())
+
+
+def voice_of(provider: tts.TTS) -> str:
+    # plugins keep their voice/model settings in `_opts`, names differ per plugin
+    opts = getattr(provider, "_opts", None)
+    for attr in ("voice", "voice_id", "model", "model_name"):
+        value = getattr(opts, attr, None)
+        if value:
+            return str(getattr(value, "id", value))
+    return ""
+
+
+class PhraseAudioStore:
+    """
+    Raw 16-bit PCM of fixed phrases, one file per (text, voice, provider,
+    sample rate, channels) under `root`, read back memory-mapped.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, text: str, voice: str, provider: str, sample_rate: int, channels: int) -> str:
+        key = "\0".join((phrase_key(text), voice, provider, str(sample_rate), str(channels)))
+        return os.path.join(self.root, hashlib.sha1(key.encode()).hexdigest() + ".pcm")
+
+    def get(self, path: str) -> Optional[mmap.mmap]:
+        with self._lock:
+            if path in self._maps:
+                return self._maps[path]
+            try:
+                with open(path, "rb") as f:
+                    self._maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                # ValueError: empty file
+                return None
+            return self._maps[path]
+
+    def put(self, path: str, pcm: bytes):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pcm)
+        os.replace(tmp_path, path)
+
+
+class PhraseCacheTTS(tts.TTS):
+    """
+    TTS wrapper that plays known phrases from PhraseAudioStore instead of
+    synthesizing them.
+
+    A stream keeps buffering text while it could still be a known phrase (the
+    greetings sent with `agent.say`, PHRASE_CACHE_PHRASES). When the segment
+    ends on an exact match the stored audio is played; a known phrase that is
+    not stored yet is synthesized once and saved. Anything else goes live to
+    the wrapped TTS as soon as it stops matching, so LLM replies are not delayed.
+    """
+
+    def __init__(self, wrapped: tts.TTS, store: PhraseAudioStore, phrases: Iterable[str], provider: str):
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=True),
+            sample_rate=wrapped.sample_rate,
+            num_channels=wrapped.num_channels,
+        )
+        self.wrapped = wrapped
+        if not wrapped.capabilities.streaming:
+            wrapped = tts.StreamAdapter(tts=wrapped, sentence_tokenizer=tokenize.basic.SentenceTokenizer())
+        self._live = wrapped
+        self.store = store
+        self.phrases = {phrase_key(phrase) for phrase in phrases if phrase.strip()}
+        self.provider = provider
+        self.voice = voice_of(self.wrapped)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, text: str) -> str:
+        return self.store.path(text, self.voice, self.provider, self.sample_rate, self.num_channels)
+
+    def lookup(self, text: str) -> Optional[mmap.mmap]:
+        return self.store.get(self.path(text))
+
+    def could_match(self, text: str) -> bool:
+        text = phrase_key(text)
+        return any(phrase.startswith(text) for phrase in self.phrases)
+
+    def frames(self, pcm: mmap.mmap) -> List[rtc.AudioFrame]:
+        # 100ms frames
+        samples = self.sample_rate // 10
+        step = samples * self.num_channels * 2
+        view = memoryview(pcm)
+        return [
+            rtc.AudioFrame(
+                data=view[i : i + step],
+                sample_rate=self.sample_rate,
+                num_channels=self.num_channels,
+                samples_per_channel=len(view[i : i + step]) // (2 * self.num_channels),
+            )
+            for i in range(0, len(view), step)
+        ]
+
+    async def _record(self, text: str, conn_options: Optional[APIConnectOptions] = None):
+        pcm = bytearray()
+        async for audio in self.wrapped.synthesize(text, conn_options=conn_options):
+            pcm += audio.frame.data.tobytes()
+            yield audio
+        if pcm:
+            self.store.put(self.path(text), bytes(pcm))
+            logger.info(f"cached audio for '{text}' ({len(pcm)} bytes)")
+
+    async def _phrase_audio(self, text: str, conn_options: Optional[APIConnectOptions] = None):
+        """Audio for one whole segment, from the store when it has it."""
+        request_id = utils.shortuuid()
+        pcm = self.lookup(text)
+        if pcm is not None:
+            self.hits += 1
+            frames = self.frames(pcm)
+            for i, frame in enumerate(frames):
+                yield tts.SynthesizedAudio(frame=frame, request_id=request_id, is_final=i == len(frames) - 1)
+            return
+
+        self.misses += 1
+        last = None
+        # known phrases are saved for next time, anything else is only spoken
+        source = (
+            self._record(text, conn_options)
+            if phrase_key(text) in self.phrases
+            else self.wrapped.synthesize(text, conn_options=conn_options)
+        )
+        async for audio in source:
+            if last is not None:
+                yield last
+            last = tts.SynthesizedAudio(frame=audio.frame, request_id=request_id)
+        if last is not None:
+            last.is_final = True
+            yield last
+
+    def synthesize(self, text: str, *, conn_options: Optional[APIConnectOptions] = None) -> "PhraseCacheChunkedStream":
+        # `agent.say` with a plain string lands here rather than in stream()
+        return PhraseCacheChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+    def stream(self, *, conn_options: Optional[APIConnectOptions] = None) -> "PhraseCacheStream":
+        return PhraseCacheStream(tts=self, conn_options=conn_options)
+
+    def prewarm(self) -> None:
+        self.wrapped.prewarm()
+
+    async def aclose(self) -> None:
+        await self.wrapped.aclose()
+
+
+class PhraseCacheChunkedStream(tts.ChunkedStream):
+    def __init__(self, *, tts: PhraseCacheTTS, input_text: str, conn_options: Optional[APIConnectOptions]):
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+        self._cache = tts
+
+    async def _run(self) -> None:
+        async for audio in self._cache._phrase_audio(self._input_text, self._conn_options):
+            self._event_ch.send_nowait(audio)
+
+
+class PhraseCacheStream(tts.SynthesizeStream):
+    def __init__(self, *, tts: PhraseCacheTTS, conn_options: Optional[APIConnectOptions]):
+        super().__init__(tts=tts, conn_options=conn_options)
+        self._cache = tts
+
+    async def _play_phrase(self, text: str):
+        async for audio in self._cache._phrase_audio(text, self._conn_options):
+            self._event_ch.send_nowait(audio)
+
+    async def _run(self) -> None:
+        pending = ""
+        live: Optional[tts.SynthesizeStream] = None
+        forward_task: Optional[asyncio.Task] = None
+
+        async def _forward(stream: tts.SynthesizeStream):
+            async for audio in stream:
+                self._event_ch.send_nowait(audio)
+
+        try:
+            async for data in self._input_ch:
+                if live is not None:
+                    if isinstance(data, self._FlushSentinel):
+                        live.flush()
+                    else:
+                        live.push_text(data)
+                    continue
+
+                if isinstance(data, self._FlushSentinel):
+                    if pending.strip():
+                        await self._play_phrase(pending)
+                    pending = ""
+                    continue
+
+                pending += data
+                if not self._cache.could_match(pending):
+                    # not a known phrase, hand this and everything after it to the real TTS
+                    live = self._cache._live.stream()
+                    forward_task = asyncio.create_task(_forward(live))
+                    live.push_text(pending)
+
+            if live is not None:
+                live.end_input()
+                await forward_task
+        finally:
+            if forward_task is not None:
+                await utils.aio.gracefully_cancel(forward_task)
+            if live is not None:
+                await live.aclose()
@@ -0,0 +1,154 @@
+import time
+import inspect
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("prewarm")
+
+
+def parse_client_names(value: str) -> list[str]:
+    # "stt, tts,,llm" -> ["stt", "tts", "llm"]
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def client_is_open(client: Any) -> bool:
+    """
+    Health check for the provider clients: False once the client holds a
+    closed aiohttp session or a closed OpenAI client. Plugins keep the session
+    of the job that first used them, which is closed when that job ends.
+    """
+    client = getattr(client, "wrapped", client)
+    session = getattr(client, "_session", None)
+    if session is not None and getattr(session, "closed", False):
+        return False
+    is_closed = getattr(getattr(client, "_client", None), "is_closed", None)
+    if callable(is_closed) and is_closed():
+        return False
+    return True
+
+
+@dataclass
+class _Entry:
+    factory: Callable[[], Any]
+    check: Optional[Callable[[Any], bool]] = None
+    close: Optional[Callable[[Any], Any]] = None
+    instance: Any = None
+    built_at: float = 0.0
+    build_time: float = 0.0
+    failures: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ClientRegistry:
+    """
+    Per-process registry of shared clients, kept in JobProcess.userdata.
+
+    Clients are built on first `get` and reused by every job the process runs.
+    An optional `check(client)` runs on each `get`; when it returns False or
+    raises, the client is dropped and rebuilt. `reset(name)` forces a rebuild,
+    e.g. after a call through the client failed.
+
+    Jobs `hold()` the registry while they run and `release()` it when they
+    end; when the last one does, `close(client)` runs for every built client
+    that registered one. Clients stay registered and must be usable again
+    after a close, the process may still be given another job.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._jobs = 0
+        self._jobs_lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        check: Optional[Callable[[Any], bool]] = None,
+        close: Optional[Callable[[Any], Any]] = None,
+    ):
+        self._entries[name] = _Entry(factory=factory, check=check, close=close)
+
+    def get(self, name: str) -> Any:
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.instance is not None and entry.check is not None:
+                try:
+                    healthy = entry.check(entry.instance)
+                except Exception:
+                    healthy = False
+                if not healthy:
+                    logger.warning(f"{name} client failed its health check, rebuilding")
+                    entry.instance = None
+                    entry.failures += 1
+
+            if entry.instance is None:
+                start = time.perf_counter()
+                entry.instance = entry.factory()
+                entry.build_time = time.perf_counter() - start
+                entry.built_at = time.time()
+                logger.info(f"built {name} client in {entry.build_time * 1000:.1f}ms")
+            return entry.instance
+
+    def warm(self, *names: str):
+        for name in names:
+            if name not in self._entries:
+                logger.warning(f"not prewarming unknown client {name!r}, known: {', '.join(self._entries)}")
+                continue
+            self.get(name)
+
+    def reset(self, name: str):
+        entry = self._entries[name]
+        with entry.lock:
+            entry.instance = None
+            entry.failures += 1
+
+    def hold(self):
+        with self._jobs_lock:
+            self._jobs += 1
+
+    async def release(self):
+        with self._jobs_lock:
+            self._jobs -= 1
+            if self._jobs > 0:
+                return
+        for name, entry in self._entries.items():
+            if entry.close is None or entry.instance is None:
+                continue
+            try:
+                result = entry.close(entry.instance)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"could not close {name} client: {e}")
+
+    def is_built(self, name: str) -> bool:
+        return self._entries[name].instance is not None
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "built": entry.instance is not None,
+                "build_ms": round(entry.build_time * 1000, 1),
+                "failures": entry.failures,
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+class SessionTimer:
+    """Records named milestones of a session start relative to the job start."""
+
+    def __init__(self, room: str = ""):
+        self.room = room
+        self.start = time.perf_counter()
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str) -> float:
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.marks.setdefault(name, elapsed)
+        return elapsed
+
+    def report(self) -> str:
+        return ", ".join(f"{name}={ms:.0f}ms" for name, ms in self.marks.items())
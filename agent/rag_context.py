@@ -0,0 +1,145 @@
+"""
+Builds the document context returned by `query_info` from index matches.
+
+Chunks are split with a 200 character overlap and carry their `start_index`
+within the page, so matches from the same page that touch or overlap are
+merged into one span and the repeated text is dropped. Spans are ranked by
+their best score, optionally filtered by a minimum score, and added until the
+token budget is spent, then printed in document order.
+
+Compare with the verbatim concatenation on saved query results:
+
+    python rag_context.py results.json [--budget 1200] [--min-score 0.3]
+
+where each file holds a {"matches": [{"score", "metadata"}, ...]} response.
+"""
+import sys
+import json
+import argparse
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from context_policy import count_tokens, opening
+
+NO_MATCHES = "No matches found in the results."
+
+
+@dataclass
+class Span:
+    source: str
+    page: Optional[int]
+    start: Optional[int]
+    text: str
+    score: float
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+
+def _field(match, name: str):
+    # Pinecone responses support item access but not .get
+    try:
+        return match[name]
+    except (KeyError, TypeError):
+        return None
+
+
+def _span(match) -> Optional[Span]:
+    metadata = _field(match, "metadata") or {}
+    text = (metadata.get("text") or "").strip()
+    if not text:
+        return None
+    page = metadata.get("page")
+    start = metadata.get("start_index")
+    return Span(
+        source=str(metadata.get("source", "")),
+        page=int(page) if page is not None else None,
+        start=int(start) if start is not None else None,
+        text=text,
+        score=float(_field(match, "score") or 0.0),
+    )
+
+
+def merge_spans(spans: Iterable[Span]) -> List[Span]:
+    """Merge spans of the same page that overlap or touch, keeping the best score."""
+    merged: List[Span] = []
+    ordered = sorted(
+        spans, key=lambda span: (span.source, span.page or 0, span.start is None, span.start or 0)
+    )
+    for span in ordered:
+        last = merged[-1] if merged else None
+        if (
+            last is not None
+            and span.start is not None
+            and last.start is not None
+            and (span.source, span.page) == (last.source, last.page)
+            and span.start <= last.end + 1
+        ):
+            if span.start > last.end:
+                last.text = f"{last.text} {span.text}"
+            elif span.end > last.end:
+                last.text = last.text + span.text[last.end - span.start :]
+            last.score = max(last.score, span.score)
+            continue
+        merged.append(Span(span.source, span.page, span.start, span.text, span.score))
+    return merged
+
+
+def assemble_context(matches, token_budget: int = 1200, min_score: Optional[float] = None) -> str:
+    spans = [span for span in map(_span, matches or []) if span is not None]
+    if min_score is not None:
+        spans = [span for span in spans if span.score >= min_score]
+    if not spans:
+        return NO_MATCHES
+
+    chosen: List[Span] = []
+    remaining = token_budget
+    for span in sorted(merge_spans(spans), key=lambda span: -span.score):
+        cost = count_tokens(span.text) + 4
+        if cost > remaining:
+            # the best span always goes in, cut down to whatever the budget allows
+            if chosen:
+                continue
+            span.text = opening(span.text, max(remaining - 4, 1) * 4)
+            cost = remaining
+        chosen.append(span)
+        remaining -= cost
+
+    chosen.sort(key=lambda span: (span.source, span.page or 0, span.start or 0))
+    return "\n---\n".join(
+        f"Page {span.page}: {span.text}\n" if span.page is not None else f"{span.text}\n"
+        for span in chosen
+    )
+
+
+def verbatim(matches) -> str:
+    return "\n---\n".join(
+        f"Page {int(_field(match, 'metadata').get('page', 0))}: {_field(match, 'metadata').get('text', '').strip()}\n"
+        for match in matches
+    )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="rag_context")
+    parser.add_argument("results", nargs="+", help="JSON query responses")
+    parser.add_argument("--budget", type=int, default=1200)
+    parser.add_argument("--min-score", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    total_before = total_after = 0
+    print(f"{'before':>7} {'after':>7} {'saved':>6}  results")
+    for path in args.results:
+        with open(path) as f:
+            matches = json.load(f)["matches"]
+        before = count_tokens(verbatim(matches))
+        after = count_tokens(assemble_context(matches, args.budget, args.min_score))
+        total_before += before
+        total_after += after
+        print(f"{before:>7} {after:>7} {1 - after / max(before, 1):>6.0%}  {path}")
+    print(f"{total_before:>7} {total_after:>7} {1 - total_after / max(total_before, 1):>6.0%}  total")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,14 @@
 import os
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
 from pinecone.grpc import PineconeGRPC as Pinecone
-from openai import OpenAI
+from openai import APIConnectionError, OpenAI, AsyncOpenAI
+from cache import EmbeddingCache, TTLCache, normalize_text
+from local_index import LocalIndex
+from rag_context import assemble_context
+from tracing import latency_metrics
 
 logger = logging.getLogger("RAG")
 
@@ -10,38 +17,163 @@ class RAGService:
         self.index_name = os.getenv("PINECONE_INDEX_NAME")
         self.pinecone_api_key = os.getenv("PINECONE_API_KEY")
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.top_k = 4
+        self.top_k = int(os.getenv("RAG_TOP_K", "4"))
+        # overlapping chunks are merged and the context fit to this many tokens
+        self.context_tokens = int(os.getenv("RAG_CONTEXT_TOKENS", "1200"))
+        min_score = os.getenv("RAG_MIN_SCORE")
+        self.min_score = float(min_score) if min_score else None
+        self.embedding_model = "text-embedding-3-small"
+        self.embedding_cache = EmbeddingCache(
+            maxsize=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "2048")),
+            ttl=float(os.getenv("RAG_EMBEDDING_CACHE_TTL", "86400")) or None,
+            db_path=os.getenv("RAG_EMBEDDING_CACHE_PATH") or None,
+        )
+        # serialized top-k results per (namespace, query), dropped for a
+        # namespace once its version changes, i.e. the reservations service
+        # re-ingested into it. The local index version is the manifest mtime,
+        # the Pinecone one the namespace's vector count, fetched at most every
+        # RAG_NAMESPACE_CHECK_INTERVAL seconds
+        self.result_cache = TTLCache(
+            maxsize=int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("RAG_RESULT_CACHE_TTL", "3600")) or None,
+            maxweight=int(os.getenv("RAG_RESULT_CACHE_MAX_CHARS", "8000000")),
+        )
+        self.namespace_versions = TTLCache(
+            maxsize=int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("RAG_NAMESPACE_CHECK_INTERVAL", "60")) or None,
+        )
+        self._seen_versions: Dict[str, Any] = {}
+        self.metrics = latency_metrics
         self.openai_client = OpenAI(api_key=self.openai_api_key)
-        self.pc = Pinecone(api_key=self.pinecone_api_key)
-        self.index = self.pc.Index(self.index_name)
+        self.async_openai_client = AsyncOpenAI(api_key=self.openai_api_key)
+        # "pinecone" or "local"; the local backend reads the namespaces the
+        # reservations service writes into LOCAL_INDEX_DIR
+        self.vector_store = os.getenv("VECTOR_STORE", "pinecone")
+        if self.vector_store == "local":
+            self.local_index = LocalIndex(
+                os.getenv("LOCAL_INDEX_DIR", "local_index"),
+                dtype=os.getenv("LOCAL_INDEX_DTYPE", "float32"),
+                ivf_threshold=int(os.getenv("LOCAL_INDEX_IVF_THRESHOLD", "20000")),
+                nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", "8")),
+            )
+        else:
+            self.pc = Pinecone(api_key=self.pinecone_api_key)
+            self.index = self.pc.Index(self.index_name)
+        # both index clients are blocking, so queries run on a small bounded
+        # pool instead of the agent's event loop
+        self.query_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_QUERY_WORKERS", "4")),
+            thread_name_prefix="rag-query",
+        )
+
+    def is_open(self) -> bool:
+        # health check for the shared service, see prewarm.ClientRegistry
+        return not (
+            self.query_executor._shutdown
+            or self.openai_client.is_closed()
+            or self.async_openai_client.is_closed()
+        )
+
+    @staticmethod
+    def is_connection_error(error: BaseException) -> bool:
+        # no response from OpenAI or the index, as opposed to a bad request
+        return isinstance(error, (APIConnectionError, OSError))
 
     def get_embeddings(self, query: str):
+        cached = self.embedding_cache.get(query, self.embedding_model)
+        if cached is not None:
+            return cached
         res = self.openai_client.embeddings.create(
-            input=query, model="text-embedding-3-small"
+            input=query, model=self.embedding_model
         )
-        return res.data[0].embedding
+        embedding = res.data[0].embedding
+        self.embedding_cache.set(query, self.embedding_model, embedding)
+        return embedding
+
+    async def aget_embeddings(self, query: str):
+        cached = await self.embedding_cache.aget(query, self.embedding_model, self.query_executor)
+        if cached is not None:
+            logger.debug(f"Embedding cache hit: {self.embedding_cache.stats()}")
+            return cached
+        res = await self.async_openai_client.embeddings.create(
+            input=query, model=self.embedding_model
+        )
+        embedding = res.data[0].embedding
+        self.embedding_cache.aset(query, self.embedding_model, embedding, self.query_executor)
+        return embedding
 
     def serialize_results(self, results):
         if not results or "matches" not in results:
             return "No matches found in the results."
+        return assemble_context(results["matches"], self.context_tokens, self.min_score)
 
-        formatted_results = []
-
-        for match in results["matches"]:
-            page = int(match["metadata"].get("page", "Unknown"))
-            text = match["metadata"].get("text", "").strip()
-            formatted_results.append(f"Page {page}: {text}\n")
-
-        return "\n---\n".join(formatted_results)
-
-    def retrieve_docs(self, query: str, namespace: str) -> str:
-        vector = self.get_embeddings(query)
-        results = self.index.query(
+    def query_index(self, vector, namespace: str):
+        if self.vector_store == "local":
+            return {"matches": self.local_index.query(namespace, vector, self.top_k)}
+        return self.index.query(
             vector=vector,
             top_k=self.top_k,
             namespace=namespace,
             include_values=False,
             include_metadata=True,
         )
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        return self.result_cache.discard_where(lambda key: key[0] == namespace)
+
+    def namespace_version(self, namespace: str):
+        if self.vector_store == "local":
+            return self.local_index.version(namespace)
+        version = self.namespace_versions.get(namespace)
+        if version is None:
+            summary = self.index.describe_index_stats().namespaces.get(namespace)
+            version = summary.vector_count if summary else 0
+            self.namespace_versions.set(namespace, version)
+        return version
+
+    def check_namespace(self, namespace: str):
+        try:
+            version = self.namespace_version(namespace)
+        except Exception as e:
+            # keep serving the cache, the next check may get through
+            logger.warning(f"Could not check the version of namespace {namespace}: {e}")
+            return
+        previous = self._seen_versions.setdefault(namespace, version)
+        if previous != version:
+            removed = self.invalidate_namespace(namespace)
+            self._seen_versions[namespace] = version
+            logger.info(f"Namespace {namespace} changed, dropped {removed} cached results")
+
+    def cached_result(self, key: tuple):
+        cached = self.result_cache.get(key)
+        self.metrics.cache_lookup("rag_result", cached is not None)
+        return cached
+
+    def retrieve_docs(self, query: str, namespace: str) -> str:
+        self.check_namespace(namespace)
+        key = (namespace, normalize_text(query))
+        cached = self.cached_result(key)
+        if cached is not None:
+            return cached
+        vector = self.get_embeddings(query)
+        results = self.query_index(vector, namespace)
+        serialized = self.serialize_results(results)
+        self.result_cache.set(key, serialized)
+        return serialized
+
+    async def aretrieve_docs(self, query: str, namespace: str) -> str:
+        loop = asyncio.get_running_loop()
+        # a stat of the manifest or a Pinecone stats call, off the loop either way
+        await loop.run_in_executor(self.query_executor, self.check_namespace, namespace)
+        key = (namespace, normalize_text(query))
+        cached = self.cached_result(key)
+        if cached is not None:
+            return cached
+        vector = await self.aget_embeddings(query)
+        results = await loop.run_in_executor(
+            self.query_executor, self.query_index, vector, namespace
+        )
         serialized = self.serialize_results(results)
+        self.result_cache.set(key, serialized)
         return serialized
+
@@ -0,0 +1,153 @@
+"""
+Text segmentation between the LLM stream and TTS.
+
+Tokens are buffered into segments that end on a clause or sentence boundary,
+normalized for speech and handed to TTS one segment at a time. The first
+segment is flushed at the first clause boundary so audio starts early; later
+segments wait for a sentence end, and nothing grows past `max_chars`.
+
+Replay recorded token streams to tune the knobs:
+
+    python speech_text.py tokens.jsonl [--first-chars 20] [--min-chars 60] [--max-chars 200]
+
+where each line is {"t": seconds since the request, "text": "token"}.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+from typing import AsyncIterable, Iterable, List, Union
+
+_CLAUSE_END = re.compile(r"[,;!?.—](?=\s)")
+_SENTENCE_END = re.compile(r"[.!?](?=\s)")
+_PAGE_MARKER = re.compile(r"(?im)^\s*page (\d+):\s*")
+_SEPARATOR = re.compile(r"(?m)^\s*(?:---+|\*\*\*+)\s*$")
+# paired emphasis and code only, a lone "*" or "snack_package" is left alone
+_EMPHASIS = re.compile(r"(\*\*|\*|`+|(?<!\w)__|(?<!\w)_)(?=\S)(.+?)(?<=\S)\1(?!\w)")
+_LINE_MARKUP = re.compile(r"^[ \t]*(?:#{1,6}|>+|[-*•])[ \t]+", re.MULTILINE)
+# the domain stops before trailing punctuation so a sentence's final period survives
+_DOMAIN = r"([\w-]+(?:\.[\w-]+)*)"
+_URL = re.compile(
+    rf"\bhttps?://(?:www\.)?{_DOMAIN}\S*?(?=[.,;!?]?(?:\s|$))|\bwww\.{_DOMAIN}\S*?(?=[.,;!?]?(?:\s|$))"
+)
+_RESERVATION_ID = re.compile(r"(?i)\b((?:reservation|confirmation|booking) (?:id|number)(?: is)?[:#\s]*)(\d{2,})")
+
+
+def _speak_domain(match: re.Match) -> str:
+    return (match.group(1) or match.group(2)).replace(".", " dot ")
+
+
+def normalize_for_speech(text: str) -> str:
+    """Rewrite text TTS would read badly: page markers, markup, URLs and IDs."""
+    text = _PAGE_MARKER.sub(r"On page \1, ", text)
+    text = _SEPARATOR.sub(" ", text)
+    text = _URL.sub(_speak_domain, text)
+    text = _LINE_MARKUP.sub("", text)
+    text = _EMPHASIS.sub(r"\2", text)
+    # read reservation IDs digit by digit, "1 0 4 2" not "one thousand forty two"
+    text = _RESERVATION_ID.sub(lambda m: m.group(1) + " ".join(m.group(2)), text)
+    return re.sub(r"\s+", " ", text)
+
+
+class SpeechSegmenter:
+    def __init__(self, first_chars: int = 20, min_chars: int = 60, max_chars: int = 200):
+        self.first_chars = first_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.segments = 0
+
+    def _cut(self) -> int:
+        """Length of the next segment in the buffer, 0 when it should keep waiting."""
+        if self.segments == 0:
+            pattern, minimum = _CLAUSE_END, self.first_chars
+        else:
+            pattern, minimum = _SENTENCE_END, self.min_chars
+        for match in pattern.finditer(self.buffer):
+            if minimum <= match.end() <= self.max_chars:
+                return match.end()
+        if len(self.buffer) <= self.max_chars:
+            return 0
+        # too long without a boundary, break at the last clause or space
+        head = self.buffer[: self.max_chars]
+        ends = [m.end() for m in _CLAUSE_END.finditer(head)]
+        return ends[-1] if ends else (head.rfind(" ") if " " in head.strip() else self.max_chars)
+
+    def push(self, text: str) -> List[str]:
+        self.buffer += text
+        ready = []
+        while True:
+            cut = self._cut()
+            if not cut:
+                return ready
+            segment, self.buffer = self.buffer[:cut], self.buffer[cut:].lstrip()
+            segment = normalize_for_speech(segment).strip()
+            if segment:
+                self.segments += 1
+                ready.append(segment + " ")
+
+    def flush(self) -> List[str]:
+        segment, self.buffer = normalize_for_speech(self.buffer).strip(), ""
+        return [segment] if segment else []
+
+
+def segmenter_from_env() -> SpeechSegmenter:
+    return SpeechSegmenter(
+        first_chars=int(os.getenv("TTS_FIRST_SEGMENT_CHARS", "20")),
+        min_chars=int(os.getenv("TTS_MIN_SEGMENT_CHARS", "60")),
+        max_chars=int(os.getenv("TTS_MAX_SEGMENT_CHARS", "200")),
+    )
+
+
+async def segment_stream(source: AsyncIterable[str], segmenter: SpeechSegmenter) -> AsyncIterable[str]:
+    async for token in source:
+        for segment in segmenter.push(token):
+            yield segment
+    for segment in segmenter.flush():
+        yield segment
+
+
+def before_tts(agent, source: Union[str, AsyncIterable[str]]):
+    """`before_tts_cb` for VoicePipelineAgent."""
+    if isinstance(source, str):
+        return normalize_for_speech(source)
+    return segment_stream(source, segmenter_from_env())
+
+
+def replay(tokens: Iterable[dict], segmenter: SpeechSegmenter) -> List[tuple]:
+    """Feed a recorded stream, returning (seconds, segment) for each emitted segment."""
+    emitted, last = [], 0.0
+    for token in tokens:
+        last = token["t"]
+        emitted.extend((last, segment) for segment in segmenter.push(token["text"]))
+    emitted.extend((last, segment) for segment in segmenter.flush())
+    return emitted
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="speech_text")
+    parser.add_argument("streams", nargs="+", help="JSONL token streams")
+    parser.add_argument("--first-chars", type=int, default=20)
+    parser.add_argument("--min-chars", type=int, default=60)
+    parser.add_argument("--max-chars", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    # first ms: since the request, wait ms: since the first token arrived
+    print(f"{'first ms':>9} {'wait ms':>8} {'segments':>9} {'max len':>8}  stream")
+    for path in args.streams:
+        with open(path) as f:
+            tokens = [json.loads(line) for line in f if line.strip()]
+        emitted = replay(tokens, SpeechSegmenter(args.first_chars, args.min_chars, args.max_chars))
+        if not emitted:
+            continue
+        first_token = tokens[0]["t"]
+        print(
+            f"{emitted[0][0] * 1000:>9.0f} {(emitted[0][0] - first_token) * 1000:>8.0f} "
+            f"{len(emitted):>9} {max(len(s) for _, s in emitted):>8}  {os.path.basename(path)}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
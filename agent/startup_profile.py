@@ -0,0 +1,89 @@
+"""
+Reports import-time cost by module for an agent worker.
+
+    python main.py profile-imports [--mode reservations|rag] [--top 20]
+
+Imports run in a fresh interpreter with `-X importtime`, so the numbers match
+what a cold worker process pays for the configured providers and mode.
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def configured_provider_modules() -> list[str]:
+    from main import STT_PROVIDERS, TTS_PROVIDERS, LLM_PROVIDERS, STT_PROVIDER, TTS_PROVIDER, LLM_PROVIDER
+
+    return [
+        STT_PROVIDERS[STT_PROVIDER][0],
+        TTS_PROVIDERS[TTS_PROVIDER][0],
+        LLM_PROVIDERS[LLM_PROVIDER][0],
+    ]
+
+
+def modules_for_mode(mode: str, provider_modules: list[str]) -> list[str]:
+    modules = ["main", "livekit.plugins.silero", *provider_modules]
+    if mode == "rag":
+        modules.append("rag_service")
+    return list(dict.fromkeys(modules))
+
+
+def package_of(module: str) -> str:
+    parts = module.split(".")
+    # group livekit by plugin, everything else by top level package
+    return ".".join(parts[:3]) if parts[0] == "livekit" else parts[0]
+
+
+def profile(modules: list[str]) -> tuple[list[tuple[str, int, int]], float]:
+    code = "; ".join(f"import {module}" for module in modules)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=AGENT_DIR,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows, wall
+
+
+def main(argv: list[str] | None = None, provider_modules: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="profile-imports")
+    parser.add_argument("--mode", default="reservations", choices=["reservations", "rag"])
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    modules = modules_for_mode(args.mode, provider_modules or configured_provider_modules())
+    rows, wall = profile(modules)
+
+    by_package = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[package_of(name)] += self_us
+
+    print(f"mode={args.mode} modules={', '.join(modules)}")
+    print(f"interpreter wall time: {wall * 1000:.0f}ms, imported modules: {len(rows)}\n")
+    print(f"{'self ms':>10}  package")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{self_us / 1000:>10.1f}  {package}")
+    print(f"\n{'cumul ms':>10}  module")
+    for name, _, cumulative_us in sorted(rows, key=lambda row: -row[2])[: args.top]:
+        print(f"{cumulative_us / 1000:>10.1f}  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import EmbeddingCache, TTLCache
+
+
+def test_ttl_cache_evicts_by_size_and_weight():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert "b" not in cache and "a" in cache and "c" in cache
+
+    weighted = TTLCache(maxsize=10, maxweight=5)
+    weighted.set("a", "abc")
+    weighted.set("b", "abc")
+    assert "a" not in weighted and weighted.weight == 3
+
+
+def test_embedding_cache_is_shared_through_sqlite(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    EmbeddingCache(db_path=path).set("Where do I park?", "m", [0.5, 0.25])
+    other = EmbeddingCache(db_path=path)
+    assert other.get("where do i park", "m") == [0.5, 0.25]
+    assert other.stats()["disk_hits"] == 1
+
+
+def test_embedding_cache_prunes_every_n_inserts(tmp_path):
+    cache = EmbeddingCache(db_path=str(tmp_path / "embeddings.db"), max_rows=5, prune_every=4)
+    count = lambda: cache._db.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+    for i in range(7):
+        cache.set(f"query {i}", "m", [float(i)])
+    # over max_rows until the next multiple of prune_every
+    assert count() == 7
+    cache.set("query 7", "m", [7.0])
+    assert count() == 5
+    assert cache.get("query 7", "m") == [7.0]
+
+
+def test_embedding_cache_disk_tier_runs_on_the_executor(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    EmbeddingCache(db_path=path).set("Where do I park?", "m", [1.0])
+    cache = EmbeddingCache(db_path=path)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk")
+    threads = []
+    disk_get, disk_set = cache._disk_get, cache._disk_set
+    cache._disk_get = lambda *args: threads.append(threading.current_thread().name) or disk_get(*args)
+    cache._disk_set = lambda *args: threads.append(threading.current_thread().name) or disk_set(*args)
+
+    async def run():
+        hit = await cache.aget("Where do I park?", "m", executor)
+        await cache.aset("When are you open?", "m", [2.0], executor)
+        return hit
+
+    assert asyncio.run(run()) == [1.0]
+    executor.shutdown()
+    assert len(threads) == 2 and all(name.startswith("disk") for name in threads)
+    assert EmbeddingCache(db_path=path).get("When are you open?", "m") == [2.0]
@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from cinema_service import CinemaService
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    monkeypatch.setenv("TMDB_CATALOG_PATH", str(tmp_path / "catalog.json"))
+    return CinemaService()
+
+
+def _availability(monkeypatch, service, rooms=None, error=None):
+    async def get_room_availability(date_str, time_str, people_count):
+        if error:
+            raise error
+        return [room for room in rooms if room["capacity"] >= people_count]
+
+    monkeypatch.setattr(service, "get_room_availability", get_room_availability)
+
+
+ROOMS = [
+    {"room": "Small Room", "capacity": 4, "available": False},
+    {"room": "Medium Room", "capacity": 7, "available": True},
+    {"room": "Large Room", "capacity": 10, "available": False},
+]
+
+
+def test_recommends_smallest_free_room(service, monkeypatch):
+    _availability(monkeypatch, service, ROOMS)
+    assert asyncio.run(service.recommend_available_room(3, "2030-01-01", "19:00")) == "Medium Room"
+
+
+def test_no_room_when_every_fitting_room_is_booked(service, monkeypatch):
+    _availability(monkeypatch, service, ROOMS)
+    assert asyncio.run(service.recommend_available_room(9, "2030-01-01", "19:00")) is None
+    assert "booked" in service.no_room_message(9)
+
+
+def test_no_room_for_a_party_that_fits_nowhere(service, monkeypatch):
+    _availability(monkeypatch, service, ROOMS)
+    assert asyncio.run(service.recommend_available_room(12, "2030-01-01", "19:00")) is None
+    assert "largest room" in service.no_room_message(12)
+
+
+def test_falls_back_to_size_when_availability_fails(service, monkeypatch):
+    _availability(monkeypatch, service, error=RuntimeError("down"))
+    assert asyncio.run(service.recommend_available_room(5, "2030-01-01", "19:00")) == "Medium Room"
+    assert asyncio.run(service.recommend_available_room(11, "2030-01-01", "19:00")) is None
+
+
+def test_fuzzy_title_hits_are_cached_briefly(service):
+    service.title_index.add({"id": 1, "title": "The Shawshank Redemption", "popularity": 10.0})
+    assert asyncio.run(service.retrieve_movie("shawshank redemption"))["id"] == 1
+    assert asyncio.run(service.retrieve_movie("shawshank redemtion"))["id"] == 1
+    ttls = {key: ttl for key, _, ttl in service.movie_cache.items()}
+    assert ttls["shawshank redemption"] > service.fuzzy_ttl
+    assert ttls["shawshank redemtion"] <= service.fuzzy_ttl
+
+
+def test_calls_on_one_loop_reuse_one_session(monkeypatch, tmp_path):
+    from aiohttp import web
+
+    peers = []
+
+    async def reservation(request):
+        peers.append(request.transport.get_extra_info("peername"))
+        return web.json_response({"id": int(request.match_info["id"])})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/reservations/{id}", reservation)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        monkeypatch.setenv("RES_BASE_URL", f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+        monkeypatch.setenv("TMDB_CATALOG_PATH", str(tmp_path / "catalog.json"))
+        service = CinemaService()
+        try:
+            session = service.get_session()
+            for i in range(3):
+                assert (await service.get_reservation(i))["id"] == i
+            assert service.get_session() is session
+            await service.aclose()
+            assert session.closed and service.get_session() is not session
+            await service.aclose()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(main())
+    # one keep-alive connection served every call
+    assert len(peers) == 3 and len(set(peers)) == 1
+
+
+def test_each_loop_gets_its_own_session(service):
+    async def open_session():
+        return service.get_session()
+
+    async def close_own():
+        await service.aclose()
+
+    first = asyncio.run(open_session())
+    # another job's loop closing its session leaves this one alone
+    asyncio.run(close_own())
+    assert not first.closed
+
+
+def test_unanswered_requests_mark_the_service_unhealthy(monkeypatch, tmp_path):
+    from aiohttp import web
+
+    async def reservation(request):
+        return web.json_response({"id": int(request.match_info["id"])})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/reservations/{id}", reservation)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setenv("TMDB_CATALOG_PATH", str(tmp_path / "catalog.json"))
+        monkeypatch.setenv("CINEMA_MAX_CONNECTION_FAILURES", "2")
+        service = CinemaService()
+        try:
+            # nothing listens on the port once the stub is stopped
+            service.base_url = f"http://127.0.0.1:{port}"
+            await service.get_reservation(1)
+            await runner.cleanup()
+            for expected in (1, 2):
+                with pytest.raises(Exception):
+                    await service.get_reservation(1)
+                assert service.connection_failures == expected
+            assert not service.is_open()
+        finally:
+            await service.aclose()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_any_response_resets_the_failure_count(service, monkeypatch):
+    service.connection_failures = 2
+    assert service.is_open()
+
+    from aiohttp import web
+
+    async def broken(request):
+        return web.Response(status=500)
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/reservations/{id}", broken)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        service.base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        try:
+            with pytest.raises(Exception, match="500"):
+                await service.get_reservation(1)
+        finally:
+            await service.aclose()
+            await runner.cleanup()
+
+    asyncio.run(main())
+    assert service.connection_failures == 0
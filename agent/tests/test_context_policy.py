@@ -0,0 +1,74 @@
+from livekit.agents import llm
+
+from context_policy import ContextCompactor, count_tokens, estimate_tokens, opening
+
+
+def _message(role, text):
+    return llm.ChatMessage.create(text=text, role=role)
+
+
+def _tool(text, name="query_info"):
+    return llm.ChatMessage(role="tool", name=name, content=text, tool_call_id="call")
+
+
+def _turn(question, chunk):
+    return [_message("user", question), _tool(chunk), _message("assistant", "Here is what I found.")]
+
+
+def test_token_estimates_and_opening():
+    assert count_tokens("x" * 40) == 10
+    assert estimate_tokens(_message("user", "x" * 40)) == 14
+    assert opening("First sentence. Second sentence runs on.", 25) == "First sentence."
+    assert opening("short", 25) == "short"
+
+
+def test_stale_tool_outputs_are_trimmed_and_the_latest_kept():
+    compactor = ContextCompactor(budget=100_000, keep_tool_outputs=1, stub_chars=50)
+    messages = [_message("system", "You are a cinema assistant.")]
+    messages += _turn("Where do I park?", "Parking is behind the building. " * 20)
+    messages += _turn("Can I bring food?", "Outside food is not allowed. " * 20)
+
+    result = compactor.compact(messages)
+    old, latest = messages[2], messages[5]
+    assert old.content.startswith("Parking is behind the building.")
+    assert "[earlier query_info output trimmed, 640 characters]" in old.content
+    assert latest.content == "Outside food is not allowed. " * 20
+    assert result.tokens_after < result.tokens_before
+    assert result.decisions == [f"trimmed query_info output {old.id} (640 chars)"]
+
+
+def test_oldest_turns_are_dropped_down_to_the_low_water_mark():
+    compactor = ContextCompactor(budget=300, low_water=0.5, keep_tool_outputs=10)
+    system = _message("system", "You are a cinema assistant.")
+    turns = [_turn(f"Question {i}?", "chunk text " * 40) for i in range(4)]
+    messages = [system] + [message for turn in turns for message in turn]
+
+    result = compactor.compact(messages)
+    assert result.messages[0] is system
+    assert result.messages[-3:] == turns[-1]
+    assert result.tokens_after <= 150
+    assert result.decisions and all(decision.startswith("dropped oldest turn") for decision in result.decisions)
+
+
+def test_latest_turn_is_kept_even_when_over_budget():
+    compactor = ContextCompactor(budget=10)
+    messages = [_message("system", "prompt")] + _turn("Question?", "chunk text " * 40)
+    result = compactor.compact(messages)
+    assert result.messages == messages
+    assert result.tokens_after > compactor.budget
+
+
+def test_decisions_are_reapplied_on_later_turns():
+    compactor = ContextCompactor(budget=300, low_water=0.5, keep_tool_outputs=1, stub_chars=50)
+    system = _message("system", "You are a cinema assistant.")
+    messages = [system]
+    for i in range(3):
+        messages += _turn(f"Question {i}?", "chunk text " * 40)
+    first = compactor.compact(messages)
+    assert first.decisions
+
+    # the pipeline hands over the full, uncompacted history again next turn
+    messages += [_message("user", "Thanks!")]
+    second = compactor.compact(messages)
+    assert second.decisions == []
+    assert second.messages == first.messages + [messages[-1]]
@@ -0,0 +1,70 @@
+import numpy as np
+
+from local_index import LocalIndex
+
+
+def _batches(rng, count: int, size: int, dim: int = 16):
+    for b in range(count):
+        vectors = rng.normal(size=(size, dim)).astype(np.float32)
+        ids = [f"{b}-{i}" for i in range(size)]
+        yield vectors, [{"text": id_} for id_ in ids], ids
+
+
+def test_add_appends_segments_and_query_spans_them(tmp_path):
+    index = LocalIndex(str(tmp_path))
+    rng = np.random.default_rng(1)
+    stored = []
+    for vectors, metadatas, ids in _batches(rng, 3, 10):
+        index.add("doc", vectors.tolist(), metadatas, ids)
+        stored.append(vectors)
+    assert index.count("doc") == 30
+    assert len(list(tmp_path.joinpath("doc").glob("*.npy"))) == 3
+
+    target = np.concatenate(stored)[17]
+    matches = index.query("doc", target.tolist(), top_k=3)
+    assert matches[0]["id"] == "1-7"
+    assert matches[0]["metadata"] == {"text": "1-7"}
+    assert [m["score"] for m in matches] == sorted((m["score"] for m in matches), reverse=True)
+
+
+def test_finalize_merges_segments_and_builds_ivf_once(tmp_path):
+    index = LocalIndex(str(tmp_path), ivf_threshold=100, nprobe=4)
+    rng = np.random.default_rng(2)
+    stored = []
+    for vectors, metadatas, ids in _batches(rng, 5, 40):
+        index.add("doc", vectors.tolist(), metadatas, ids)
+        stored.append(vectors)
+    # nothing is built while batches are still coming in
+    assert not list(tmp_path.joinpath("doc").glob("*.ivf.npz"))
+
+    index.finalize("doc")
+    assert len(list(tmp_path.joinpath("doc").glob("*.npy"))) == 1
+    assert len(list(tmp_path.joinpath("doc").glob("*.ivf.npz"))) == 1
+    assert index.count("doc") == 200
+    target = np.concatenate(stored)[123]
+    assert index.query("doc", target.tolist(), top_k=1)[0]["id"] == "3-3"
+
+    # a later batch is searched next to the merged segment
+    extra = rng.normal(size=(1, 16)).astype(np.float32)
+    index.add("doc", extra.tolist(), [{"text": "late"}], ["late"])
+    assert index.count("doc") == 201
+    assert index.query("doc", extra[0].tolist(), top_k=1)[0]["id"] == "late"
+
+
+def test_readers_see_whole_batches_only(tmp_path):
+    writer = LocalIndex(str(tmp_path))
+    reader = LocalIndex(str(tmp_path))
+    rng = np.random.default_rng(3)
+    batches = list(_batches(rng, 2, 5))
+    writer.add("doc", batches[0][0].tolist(), batches[0][1], batches[0][2])
+    assert reader.count("doc") == 5
+    # a segment written without its manifest entry is not visible
+    np.save(tmp_path / "doc" / "000099.npy", batches[1][0])
+    assert reader.count("doc") == 5
+    writer.add("doc", batches[1][0].tolist(), batches[1][1], batches[1][2])
+    assert reader.count("doc") == 10
+    assert reader.query("doc", batches[1][0][2].tolist(), top_k=1)[0]["id"] == "1-2"
+
+    writer.delete_namespace("doc")
+    assert reader.count("doc") == 0
+    assert reader.query("doc", batches[1][0][2].tolist()) == []
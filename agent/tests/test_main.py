@@ -0,0 +1,12 @@
+import main
+
+
+def test_import_plugins_imports_every_configured_provider_once(monkeypatch):
+    monkeypatch.setattr(main, "STT_PROVIDER", "deepgram")
+    monkeypatch.setattr(main, "TTS_PROVIDER", "deepgram")
+    monkeypatch.setattr(main, "LLM_PROVIDER", "groq")
+    imported = []
+    monkeypatch.setattr(main.importlib, "import_module", imported.append)
+
+    main.import_plugins()
+    assert imported == ["livekit.plugins.deepgram", "livekit.plugins.openai", "livekit.plugins.silero"]
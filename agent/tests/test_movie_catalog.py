@@ -0,0 +1,167 @@
+import json
+import time
+import asyncio
+
+from aiohttp import web
+
+from cinema_service import CinemaService
+
+CATALOG = {
+    "movie/now_playing": [
+        {"id": 1, "title": "Interstellar", "popularity": 90.0},
+        {"id": 2, "title": "The Matrix", "popularity": 80.0},
+    ],
+    "movie/popular": [
+        {"id": 3, "title": "Inception", "popularity": 95.0},
+    ],
+}
+SEARCH = {"Dune": {"id": 4, "title": "Dune", "popularity": 70.0}}
+
+
+def run_with_tmdb(monkeypatch, tmp_path, scenario):
+    """Run `scenario(make_service, requests)` against a stub TMDB server."""
+    requests = []
+
+    async def listing(request):
+        requests.append(request.path)
+        return web.json_response({"results": CATALOG[request.path.strip("/")]})
+
+    async def search(request):
+        requests.append(request.path)
+        movie = SEARCH.get(request.query["query"])
+        return web.json_response({"results": [movie] if movie else []})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/movie/now_playing", listing)
+        app.router.add_get("/movie/popular", listing)
+        app.router.add_get("/search/movie", search)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setenv("TMDB_BASE_URL", f"http://127.0.0.1:{port}")
+        monkeypatch.setenv("TMDB_CATALOG_PATH", str(tmp_path / "catalog.json"))
+        monkeypatch.setenv("TMDB_PREFETCH_PAGES", "1")
+        try:
+            await scenario(CinemaService, requests)
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+async def prefetched(service):
+    service.ensure_catalog()
+    if service._catalog_task:
+        await service._catalog_task
+
+
+def test_fresh_snapshot_skips_the_prefetch_in_the_next_process(monkeypatch, tmp_path):
+    async def scenario(make_service, requests):
+        first = make_service()
+        await prefetched(first)
+        assert len(requests) == 2
+        assert (await first.retrieve_movie("Dune"))["id"] == 4
+        await first.aclose()
+
+        # a new job process starts from the snapshot
+        requests.clear()
+        second = make_service()
+        second.ensure_catalog()
+        assert second._catalog_task is None
+        assert (await second.retrieve_movie("inception"))["id"] == 3
+        assert (await second.retrieve_movie("Dune"))["id"] == 4
+        assert requests == []
+        await second.aclose()
+
+    run_with_tmdb(monkeypatch, tmp_path, scenario)
+
+
+def test_stale_snapshot_is_refetched(monkeypatch, tmp_path):
+    async def scenario(make_service, requests):
+        first = make_service()
+        await prefetched(first)
+        await first.aclose()
+
+        snapshot = json.loads((tmp_path / "catalog.json").read_text())
+        snapshot["fetched_at"] = time.time() - 2 * first.catalog_refresh
+        (tmp_path / "catalog.json").write_text(json.dumps(snapshot))
+
+        requests.clear()
+        second = make_service()
+        await prefetched(second)
+        assert len(requests) == 2
+        await second.aclose()
+
+    run_with_tmdb(monkeypatch, tmp_path, scenario)
+
+
+def test_expired_cache_entries_are_not_loaded(monkeypatch, tmp_path):
+    (tmp_path / "catalog.json").write_text(
+        json.dumps(
+            {
+                "fetched_at": time.time(),
+                "movies": [],
+                "cache": {
+                    "dune": {"movie": SEARCH["Dune"], "expires_at": time.time() - 1},
+                    "heat": {"movie": {"id": 5, "title": "Heat"}, "expires_at": time.time() + 60},
+                },
+            }
+        )
+    )
+    monkeypatch.setenv("TMDB_CATALOG_PATH", str(tmp_path / "catalog.json"))
+    service = CinemaService()
+    assert "dune" not in service.movie_cache
+    assert service.movie_cache.get("heat")["id"] == 5
+
+
+def test_old_list_snapshots_still_load(monkeypatch, tmp_path):
+    (tmp_path / "catalog.json").write_text(json.dumps(CATALOG["movie/popular"]))
+    monkeypatch.setenv("TMDB_CATALOG_PATH", str(tmp_path / "catalog.json"))
+    service = CinemaService()
+    assert len(service.title_index) == 1
+    assert service._catalog_fetched_at == 0.0
+
+
+def test_snapshot_file_io_runs_off_the_event_loop(monkeypatch, tmp_path):
+    import threading
+
+    monkeypatch.setenv("TMDB_CATALOG_PATH", str(tmp_path / "catalog.json"))
+    service = CinemaService()
+    service.movie_cache.set("heat", {"id": 5, "title": "Heat"})
+    threads = []
+    read, write = service.read_catalog_snapshot, service.write_catalog_snapshot
+
+    def slow_read():
+        threads.append(threading.current_thread())
+        time.sleep(0.2)
+        return read()
+
+    def slow_write(snapshot):
+        threads.append(threading.current_thread())
+        time.sleep(0.2)
+        write(snapshot)
+
+    monkeypatch.setattr(service, "read_catalog_snapshot", slow_read)
+    monkeypatch.setattr(service, "write_catalog_snapshot", slow_write)
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick = asyncio.create_task(ticker())
+        await service.persist()
+        tick.cancel()
+        return ticks
+
+    # the loop kept running while the file was read and written
+    assert asyncio.run(main()) > 20
+    assert len(threads) == 2 and threading.main_thread() not in threads
+    assert json.loads((tmp_path / "catalog.json").read_text())["cache"]["heat"]["movie"]["id"] == 5
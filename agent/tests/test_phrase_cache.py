@@ -0,0 +1,140 @@
+import asyncio
+
+from livekit import rtc
+from livekit.agents import tts, utils
+
+from phrase_cache import PhraseAudioStore, PhraseCacheTTS
+
+SAMPLE_RATE = 16000
+
+
+class FakeChunkedStream(tts.ChunkedStream):
+    async def _run(self):
+        self._tts.calls.append(self._input_text)
+        request_id = utils.shortuuid()
+        for value in (1, 2):
+            data = value.to_bytes(2, "little", signed=True) * (SAMPLE_RATE // 10)
+            frame = rtc.AudioFrame(data=data, sample_rate=SAMPLE_RATE, num_channels=1, samples_per_channel=SAMPLE_RATE // 10)
+            self._event_ch.send_nowait(tts.SynthesizedAudio(frame=frame, request_id=request_id))
+
+
+class FakeTTS(tts.TTS):
+    def __init__(self):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=SAMPLE_RATE, num_channels=1)
+        self.calls = []
+
+    def synthesize(self, text, *, conn_options=None):
+        return FakeChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+
+def _collect(cache, text):
+    async def run():
+        return [audio async for audio in cache.synthesize(text)]
+
+    return asyncio.run(run())
+
+
+def _pcm(audios):
+    return b"".join(audio.frame.data.tobytes() for audio in audios)
+
+
+def test_known_phrase_is_recorded_then_played_from_the_store(tmp_path):
+    wrapped = FakeTTS()
+    cache = PhraseCacheTTS(wrapped, PhraseAudioStore(str(tmp_path)), ["Welcome to the cinema!"], "fake")
+
+    first = _collect(cache, "Welcome to the  cinema!")
+    assert wrapped.calls == ["Welcome to the  cinema!"]
+    assert cache.misses == 1 and first[-1].is_final
+    assert cache.lookup("Welcome to the cinema!") is not None
+
+    second = _collect(cache, "Welcome to the cinema!")
+    assert wrapped.calls == ["Welcome to the  cinema!"]
+    assert cache.hits == 1
+    assert _pcm(second) == _pcm(first)
+    assert [audio.is_final for audio in second] == [False, True]
+    assert all(audio.frame.sample_rate == SAMPLE_RATE for audio in second)
+
+
+def test_other_text_falls_back_to_live_synthesis(tmp_path):
+    wrapped = FakeTTS()
+    cache = PhraseCacheTTS(wrapped, PhraseAudioStore(str(tmp_path)), ["Welcome to the cinema!"], "fake")
+
+    for _ in range(2):
+        audios = _collect(cache, "Your room is booked.")
+        assert len(audios) == 2 and audios[-1].is_final
+    assert wrapped.calls == ["Your room is booked.", "Your room is booked."]
+    assert cache.lookup("Your room is booked.") is None
+    assert cache.hits == 0 and cache.misses == 2
+
+
+def _frame_values(audios):
+    # every fake frame is one repeated sample value
+    return [int.from_bytes(audio.frame.data.tobytes()[:2], "little", signed=True) for audio in audios]
+
+
+def _stream(cache, *segments):
+    """Push each segment as a few text chunks followed by a flush, like the agent does."""
+
+    async def run():
+        stream = cache.stream()
+        for segment in segments:
+            words = segment.split(" ")
+            for i, word in enumerate(words):
+                stream.push_text(word if i == len(words) - 1 else word + " ")
+            stream.flush()
+        stream.end_input()
+        audios = [audio async for audio in stream]
+        await stream.aclose()
+        return audios
+
+    return asyncio.run(run())
+
+
+def _store_phrase(cache, text, values):
+    pcm = b"".join(value.to_bytes(2, "little", signed=True) * (SAMPLE_RATE // 10) for value in values)
+    cache.store.put(cache.path(text), pcm)
+
+
+def test_stream_plays_a_stored_phrase_from_the_store(tmp_path):
+    wrapped = FakeTTS()
+    cache = PhraseCacheTTS(wrapped, PhraseAudioStore(str(tmp_path)), ["Welcome to the cinema!"], "fake")
+    _store_phrase(cache, "Welcome to the cinema!", [7, 8, 9])
+
+    audios = _stream(cache, "Welcome to the cinema!")
+    assert wrapped.calls == []
+    assert cache.hits == 1 and cache.misses == 0
+    assert _frame_values(audios) == [7, 8, 9]
+    assert [audio.is_final for audio in audios] == [False, False, True]
+
+
+def test_stream_hands_other_text_to_the_wrapped_tts(tmp_path):
+    wrapped = FakeTTS()
+    cache = PhraseCacheTTS(wrapped, PhraseAudioStore(str(tmp_path)), ["Welcome to the cinema!"], "fake")
+
+    audios = _stream(cache, "Your room is booked.")
+    # the non-streaming fake is driven through a StreamAdapter
+    assert wrapped.calls == ["Your room is booked."]
+    assert cache.hits == 0 and cache.misses == 0
+    assert _frame_values(audios) == [1, 2]
+    assert cache.lookup("Your room is booked.") is None
+
+
+def test_stream_keeps_frames_in_order_across_stored_and_live_segments(tmp_path):
+    wrapped = FakeTTS()
+    cache = PhraseCacheTTS(wrapped, PhraseAudioStore(str(tmp_path)), ["Welcome to the cinema!"], "fake")
+    _store_phrase(cache, "Welcome to the cinema!", [7, 8, 9])
+
+    audios = _stream(cache, "Welcome to the cinema!", "Your room is booked.")
+    assert _frame_values(audios) == [7, 8, 9, 1, 2]
+    assert wrapped.calls == ["Your room is booked."]
+
+
+def test_stream_records_a_known_phrase_that_is_not_stored_yet(tmp_path):
+    wrapped = FakeTTS()
+    cache = PhraseCacheTTS(wrapped, PhraseAudioStore(str(tmp_path)), ["Welcome to the cinema!"], "fake")
+
+    audios = _stream(cache, "Welcome to the cinema!")
+    assert wrapped.calls == ["Welcome to the cinema!"]
+    assert cache.misses == 1
+    assert _frame_values(audios) == [1, 2] and audios[-1].is_final
+    assert cache.lookup("Welcome to the cinema!") is not None
@@ -0,0 +1,83 @@
+import asyncio
+
+from prewarm import ClientRegistry, client_is_open, parse_client_names
+
+
+def test_parse_client_names_drops_blanks_and_spaces():
+    assert parse_client_names("stt, tts,,llm ") == ["stt", "tts", "llm"]
+    assert parse_client_names("") == []
+    assert parse_client_names(" , ") == []
+
+
+def test_clients_are_built_once_and_rebuilt_after_a_failed_check():
+    built = []
+    healthy = {"ok": True}
+    clients = ClientRegistry()
+    clients.register("stt", lambda: built.append("stt") or object(), check=lambda client: healthy["ok"])
+
+    first = clients.get("stt")
+    assert clients.get("stt") is first
+    healthy["ok"] = False
+    assert clients.get("stt") is not first
+    assert built == ["stt", "stt"]
+    assert clients.stats()["stt"]["failures"] == 1
+
+
+def test_warm_skips_unknown_names():
+    clients = ClientRegistry()
+    clients.register("tts", object)
+    clients.warm(*parse_client_names("tts, rga"))
+    assert clients.is_built("tts")
+
+
+def test_clients_are_closed_when_the_last_job_releases():
+    closed = []
+    clients = ClientRegistry()
+    clients.register("cinema", object, close=lambda client: closed.append(client))
+    clients.register("stt", object)
+    cinema = clients.get("cinema")
+
+    clients.hold()
+    clients.hold()
+    asyncio.run(clients.release())
+    assert closed == []
+    asyncio.run(clients.release())
+    assert closed == [cinema]
+    # the client stays usable for the next job
+    assert clients.get("cinema") is cinema
+
+
+class _Closable:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+
+def test_provider_clients_with_a_closed_session_or_client_fail_the_check():
+    from types import SimpleNamespace
+
+    session, api = _Closable(), _Closable()
+    stt = SimpleNamespace(_session=session)
+    llm = SimpleNamespace(_client=api)
+    # the phrase cache wrapper is judged by the TTS it wraps
+    tts = SimpleNamespace(wrapped=SimpleNamespace(_session=session))
+    assert client_is_open(stt) and client_is_open(llm) and client_is_open(tts)
+    assert client_is_open(object())
+
+    session.closed = True
+    api.closed = True
+    assert not client_is_open(stt)
+    assert not client_is_open(llm)
+    assert not client_is_open(tts)
+
+
+def test_reset_rebuilds_on_the_next_get():
+    clients = ClientRegistry()
+    clients.register("rag", object)
+    first = clients.get("rag")
+    clients.reset("rag")
+    assert not clients.is_built("rag")
+    assert clients.get("rag") is not first
+    assert clients.stats()["rag"]["failures"] == 1
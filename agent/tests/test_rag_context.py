@@ -0,0 +1,41 @@
+from rag_context import NO_MATCHES, assemble_context, merge_spans, Span
+
+
+def _match(text, score, page=1, start=0, source="faq.pdf"):
+    return {"score": score, "metadata": {"text": text, "page": page, "start_index": start, "source": source}}
+
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    spans = merge_spans([
+        Span("faq.pdf", 1, 0, "Parking is free after six.", 0.5),
+        Span("faq.pdf", 1, 11, "free after six. Bikes go in the rack.", 0.9),
+        Span("faq.pdf", 2, 0, "Snacks are sold at the bar.", 0.4),
+    ])
+    assert [(span.page, span.text, span.score) for span in spans] == [
+        (1, "Parking is free after six. Bikes go in the rack.", 0.9),
+        (2, "Snacks are sold at the bar.", 0.4),
+    ]
+
+
+def test_spans_are_ranked_by_score_and_printed_in_page_order():
+    matches = [
+        _match("Snacks are sold at the bar. " * 20, 0.4, page=2),
+        _match("Parking is free after six.", 0.9, page=1),
+        _match("Pets are not allowed inside. " * 40, 0.2, page=3),
+    ]
+    context = assemble_context(matches, token_budget=200)
+    assert context.startswith("Page 1: Parking is free after six.")
+    assert "Page 2: Snacks" in context and "Pets" not in context
+
+
+def test_best_span_is_cut_to_fit_a_small_budget():
+    text = "Parking is free after six. " * 40
+    for budget in (10, 30, 49, 100):
+        context = assemble_context([_match(text, 0.9)], token_budget=budget)
+        assert context.startswith("Page 1: Parking")
+        assert len(context) <= budget * 4 + len("Page 1: \n")
+
+
+def test_no_matches():
+    assert assemble_context([]) == NO_MATCHES
+    assert assemble_context([_match("Parking is free.", 0.1)], min_score=0.5) == NO_MATCHES
@@ -0,0 +1,181 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from rag_service import RAGService
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTOR_STORE", "local")
+    monkeypatch.setenv("LOCAL_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.delenv("RAG_EMBEDDING_CACHE_PATH", raising=False)
+    service = RAGService()
+    calls = []
+
+    async def create(input, model):
+        calls.append(input)
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2, 0.3])])
+
+    def query_index(vector, namespace):
+        # the local and Pinecone clients both block the calling thread
+        time.sleep(0.3)
+        return {"matches": [{"score": 0.9, "metadata": {"text": "Opening hours are 9 to 5.", "page": 1}}]}
+
+    monkeypatch.setattr(service.async_openai_client.embeddings, "create", create)
+    monkeypatch.setattr(service, "query_index", query_index)
+    service.embedding_calls = calls
+    yield service
+    service.query_executor.shutdown(wait=False)
+
+
+async def _max_loop_lag(coro, interval: float = 0.01):
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    tick = asyncio.create_task(ticker())
+    try:
+        result = await coro
+    finally:
+        done.set()
+        await tick
+    return result, max(lags)
+
+
+def test_aretrieve_docs_does_not_block_the_loop(service):
+    async def run():
+        return await asyncio.gather(
+            _max_loop_lag(service.aretrieve_docs("When are you open?", "ns")),
+            _max_loop_lag(service.aretrieve_docs("Where do I park?", "ns")),
+        )
+
+    results = asyncio.run(run())
+    for text, lag in results:
+        assert "Opening hours" in text
+        assert lag < 0.1
+
+
+def test_aretrieve_docs_caches_embeddings_and_results(service):
+    async def run():
+        first = await service.aretrieve_docs("When are you open?", "ns")
+        second = await service.aretrieve_docs("when are you open", "ns")
+        third = await service.aretrieve_docs("When are you open?", "other")
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == second == third
+    assert service.embedding_calls == ["When are you open?"]
+    assert service.result_cache.stats()["hits"] == 1
+
+
+def test_is_open_until_the_executor_or_a_client_is_closed(service):
+    import openai
+
+    assert service.is_open()
+    service.query_executor.shutdown(wait=False)
+    assert not service.is_open()
+
+    assert service.is_connection_error(openai.APIConnectionError(request=None))
+    assert service.is_connection_error(ConnectionRefusedError())
+    assert not service.is_connection_error(ValueError())
+
+
+def _reingest(service, namespace, text):
+    import os
+
+    service.local_index.add(namespace, [[0.1, 0.2, 0.3]], [{"text": text}], [text])
+    # mtimes can repeat on coarse clocks, make sure the manifest moved on
+    manifest = os.path.join(service.local_index.root, namespace, "manifest.json")
+    stat = os.stat(manifest)
+    os.utime(manifest, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_results_are_dropped_when_the_namespace_is_reingested(service):
+    _reingest(service, "ns", "first upload")
+
+    async def ask():
+        return await service.aretrieve_docs("When are you open?", "ns")
+
+    asyncio.run(ask())
+    asyncio.run(ask())
+    assert service.result_cache.stats()["hits"] == 1
+    # another namespace changing leaves this one cached
+    _reingest(service, "other", "unrelated")
+    asyncio.run(ask())
+    assert service.result_cache.stats()["hits"] == 2
+
+    _reingest(service, "ns", "second upload")
+    asyncio.run(ask())
+    assert service.result_cache.stats()["hits"] == 2
+    assert len(service.embedding_calls) == 1
+
+
+def _ask(service, query="When are you open?"):
+    return asyncio.run(service.aretrieve_docs(query, "ns"))
+
+
+def test_pinecone_namespace_version_is_checked_at_most_every_interval(service):
+    counts = {"ns": 10}
+    stats_calls = []
+
+    def describe_index_stats():
+        stats_calls.append(1)
+        return SimpleNamespace(namespaces={
+            name: SimpleNamespace(vector_count=count) for name, count in counts.items()
+        })
+
+    service.vector_store = "pinecone"
+    service.index = SimpleNamespace(describe_index_stats=describe_index_stats)
+    service.namespace_versions.ttl = 60
+
+    _ask(service)
+    _ask(service)
+    assert len(stats_calls) == 1
+    assert service.result_cache.stats()["hits"] == 1
+
+    counts["ns"] = 12
+    # still within the interval, the cached version is used
+    _ask(service)
+    assert service.result_cache.stats()["hits"] == 2
+    service.namespace_versions.clear()
+    _ask(service)
+    assert service.result_cache.stats()["hits"] == 2
+    assert len(stats_calls) == 2
+
+
+def test_a_failed_version_check_keeps_serving_the_cache(service):
+    def describe_index_stats():
+        raise ConnectionError("pinecone is down")
+
+    service.vector_store = "pinecone"
+    service.index = SimpleNamespace(describe_index_stats=describe_index_stats)
+    _ask(service)
+    _ask(service)
+    assert service.result_cache.stats()["hits"] == 1
+
+
+def test_result_cache_hit_rate_is_exported(service):
+    from tracing import LatencyMetrics
+
+    service.metrics = LatencyMetrics()
+
+    async def run():
+        await service.aretrieve_docs("When are you open?", "ns")
+        await service.aretrieve_docs("when are you open", "ns")
+        await service.aretrieve_docs("Where do I park?", "ns")
+
+    asyncio.run(run())
+    assert service.metrics.hit_rate("rag_result") == 1 / 3
+    rendered = service.metrics.render()
+    assert 'voice_agent_cache_lookups_total{cache="rag_result",result="hit"} 1' in rendered
+    assert 'voice_agent_cache_lookups_total{cache="rag_result",result="miss"} 2' in rendered
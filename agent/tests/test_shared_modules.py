@@ -0,0 +1,16 @@
+import os
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+AGENT = os.path.dirname(HERE)
+RESERVATIONS = os.path.join(os.path.dirname(AGENT), "reservations")
+
+
+@pytest.mark.skipif(not os.path.isdir(RESERVATIONS), reason="reservations service not checked out")
+@pytest.mark.parametrize("module", ["cache.py", "local_index.py"])
+def test_copies_shared_with_the_reservations_service_match(module):
+    # each service is built from its own directory, so the module is copied
+    # rather than imported from a common package
+    with open(os.path.join(AGENT, module)) as agent, open(os.path.join(RESERVATIONS, module)) as reservations:
+        assert agent.read() == reservations.read(), f"agent/{module} and reservations/{module} differ"
@@ -0,0 +1,64 @@
+import asyncio
+
+from speech_text import SpeechSegmenter, before_tts, normalize_for_speech, replay
+
+
+def test_urls_keep_the_sentence_punctuation():
+    assert normalize_for_speech("Book at www.cinema.com.") == "Book at cinema dot com."
+    assert normalize_for_speech("See https://www.cinema.com/faq?x=1, then call.") == "See cinema dot com, then call."
+    assert normalize_for_speech("Is it http://cinema.com/menu?") == "Is it cinema dot com?"
+
+
+def test_only_paired_emphasis_and_line_markup_is_stripped():
+    assert normalize_for_speech("**Parking** is _free_ after `6pm`") == "Parking is free after 6pm"
+    assert normalize_for_speech("5 * 3 > 12 and snack_package is set") == "5 * 3 > 12 and snack_package is set"
+    assert normalize_for_speech("# Hours\n> Open daily\n- Mon: 10\n* Tue: 11") == "Hours Open daily Mon: 10 Tue: 11"
+
+
+def test_page_markers_and_reservation_ids():
+    assert normalize_for_speech("Page 3: Snacks are sold.") == "On page 3, Snacks are sold."
+    assert normalize_for_speech("Your reservation number is 1042.") == "Your reservation number is 1 0 4 2."
+
+
+def test_first_segment_ends_at_the_first_clause():
+    segmenter = SpeechSegmenter(first_chars=10, min_chars=30, max_chars=200)
+    assert segmenter.push("Sure, let me check that") == []
+    assert segmenter.push(" for you, one moment. ") == ["Sure, let me check that for you, "]
+    # later segments wait for a sentence end past min_chars
+    assert segmenter.push("The large room fits ten, ") == []
+    assert segmenter.push("and it is free at seven. Anything else?") == [
+        "one moment. The large room fits ten, and it is free at seven. "
+    ]
+    assert segmenter.flush() == ["Anything else?"]
+    assert segmenter.flush() == []
+
+
+def test_long_text_without_boundaries_is_capped():
+    segmenter = SpeechSegmenter(first_chars=10, min_chars=30, max_chars=40)
+    segments = segmenter.push("word " * 30) + segmenter.flush()
+    assert len(segments) > 1
+    assert all(len(segment.strip()) <= 40 for segment in segments)
+    assert " ".join(segments).split() == ["word"] * 30
+
+
+def test_replay_reports_when_segments_leave():
+    tokens = [
+        {"t": 0.1, "text": "Hello there,"},
+        {"t": 0.2, "text": " welcome to the cinema. "},
+        {"t": 0.3, "text": "How can I help?"},
+    ]
+    emitted = replay(tokens, SpeechSegmenter(first_chars=5))
+    assert emitted == [(0.2, "Hello there, "), (0.3, "welcome to the cinema. How can I help?")]
+
+
+def test_before_tts_segments_streams_and_normalizes_strings():
+    assert before_tts(None, "**Hi** there") == "Hi there"
+
+    async def tokens():
+        for token in ["Sure, ", "the **large** room is free. ", "Enjoy!"]:
+            yield token
+
+    async def collect():
+        return [segment async for segment in before_tts(None, tokens())]
+
+    assert asyncio.run(collect()) == ["Sure, the large room is free. ", "Enjoy!"]
@@ -0,0 +1,52 @@
+from title_index import TitleIndex, title_key, title_numbers
+
+
+def _index(*titles):
+    index = TitleIndex()
+    for i, title in enumerate(titles):
+        index.add({"id": i, "title": title, "popularity": 10.0 - i})
+    return index
+
+
+def _best(index, query):
+    matches = index.search(query)
+    return matches[0][1]["title"] if matches else None
+
+
+def test_title_key_and_numbers():
+    assert title_key("The Lion King") == title_key("lion king")
+    assert title_key("Frozen II") == title_key("frozen two")
+    assert title_numbers("Toy Story Three") == ("3",)
+    assert title_numbers("Alien") == ()
+
+
+def test_sequel_numbers_are_decisive():
+    index = _index("Toy Story 4", "Frozen II", "Aliens")
+    assert _best(index, "Toy Story 3") is None
+    assert _best(index, "Toy Story") is None
+    assert _best(index, "Frozen") is None
+    assert _best(index, "toy story four") == "Toy Story 4"
+    assert _best(index, "frozen 2") == "Frozen II"
+
+
+def test_exact_key_beats_a_close_title():
+    index = _index("Aliens", "Alien", "Toy Story", "Toy Story 4")
+    assert index.exact("alien")["title"] == "Alien"
+    assert index.exact("Toy Story")["title"] == "Toy Story"
+    assert index.exact("Alien Romulus") is None
+
+
+def test_misspelled_titles_match():
+    index = _index("Interstellar", "Oppenheimer", "Dune: Part Two", "Deadpool & Wolverine")
+    assert _best(index, "inter stellar") == "Interstellar"
+    assert _best(index, "oppenhimer") == "Oppenheimer"
+    assert _best(index, "dune part 2") == "Dune: Part Two"
+    assert _best(index, "deadpool and wolverine") == "Deadpool & Wolverine"
+
+
+def test_remakes_go_to_the_more_popular_movie():
+    index = TitleIndex()
+    index.add({"id": 1, "title": "The Lion King", "popularity": 5.0})
+    index.add({"id": 2, "title": "The Lion King", "popularity": 50.0})
+    assert index.exact("lion king")["id"] == 2
+    assert index.search("lion kin")[0][1]["id"] == 2
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from tool_budget import PENDING, ToolBudget, parse_deadlines
+
+
+def test_parse_deadlines():
+    assert parse_deadlines("query_info=4, confirm_reservation=5.5,") == {
+        "query_info": 4.0,
+        "confirm_reservation": 5.5,
+    }
+    assert parse_deadlines("") == {}
+
+
+def test_fast_work_returns_its_result():
+    budget = ToolBudget(default_deadline=1)
+
+    async def work():
+        return "done"
+
+    assert asyncio.run(budget.run("query_info", "parking", work)) == "done"
+    assert budget.stats()["query_info"] == {"calls": 1, "deadline_hits": 0, "late_results": 0, "failures": 0}
+
+
+def test_slow_work_is_picked_up_by_the_next_call():
+    budget = ToolBudget(default_deadline=1, deadlines={"query_info": 0.05})
+    started = []
+
+    async def work():
+        started.append(1)
+        await asyncio.sleep(0.1)
+        return "late answer"
+
+    async def run():
+        first = await budget.run("query_info", "parking", work)
+        await asyncio.sleep(0.2)
+        second = await budget.run("query_info", "parking", work)
+        return first, second
+
+    assert asyncio.run(run()) == (PENDING, "late answer")
+    assert started == [1]
+    assert budget.pending == {}
+    counters = budget.stats()["query_info"]
+    assert counters["deadline_hits"] == 1 and counters["late_results"] == 1
+
+
+def test_next_call_resumes_work_that_is_still_running():
+    budget = ToolBudget(deadlines={"query_info": 0.05})
+    started = []
+
+    async def work():
+        started.append(1)
+        await asyncio.sleep(0.08)
+        return "answer"
+
+    async def run():
+        first = await budget.run("query_info", "parking", work)
+        second = await budget.run("query_info", "parking", work)
+        return first, second
+
+    assert asyncio.run(run()) == (PENDING, "answer")
+    assert started == [1]
+
+
+def test_keys_do_not_share_work():
+    budget = ToolBudget(deadlines={"query_info": 0.02})
+
+    async def run():
+        await budget.run("query_info", "parking", lambda: asyncio.sleep(0.2))
+        return await budget.run("query_info", "snacks", lambda: asyncio.sleep(0, result="snacks"))
+
+    assert asyncio.run(run()) == "snacks"
+
+
+def test_failures_are_counted_and_raised():
+    budget = ToolBudget(default_deadline=1)
+
+    async def work():
+        raise RuntimeError("reservation service down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(budget.run("confirm_reservation", 1, work))
+    assert budget.stats()["confirm_reservation"]["failures"] == 1
+
+
+def test_cancel_stops_background_work():
+    budget = ToolBudget(default_deadline=0.01)
+
+    async def run():
+        await budget.run("query_info", "parking", lambda: asyncio.sleep(1))
+        task = budget.pending[("query_info", "parking")]
+        budget.cancel()
+        await asyncio.sleep(0)
+        return task
+
+    task = asyncio.run(run())
+    assert task.cancelled() and budget.pending == {}
@@ -0,0 +1,94 @@
+import json
+import logging
+from types import SimpleNamespace
+
+from livekit.agents import metrics as agent_metrics
+from livekit.rtc import EventEmitter
+
+from tracing import LatencyMetrics, TurnTracer
+
+
+def _call(name):
+    return SimpleNamespace(function_info=SimpleNamespace(name=name))
+
+
+def _called(name):
+    return SimpleNamespace(call_info=_call(name))
+
+
+def _tracer(tmp_path=None):
+    agent = EventEmitter()
+    metrics = LatencyMetrics(str(tmp_path) if tmp_path else None)
+    tracer = TurnTracer("pipeline", room="room-1", metrics=metrics)
+    tracer.attach(agent)
+    return agent, tracer, metrics
+
+
+def test_turn_records_offsets_tools_and_pipeline_durations(tmp_path, caplog):
+    agent, tracer, metrics = _tracer(tmp_path)
+    with caplog.at_level(logging.INFO, logger="latency"):
+        agent.emit("user_stopped_speaking")
+        agent.emit("metrics_collected", agent_metrics.PipelineEOUMetrics(
+            sequence_id="1", timestamp=0.0, end_of_utterance_delay=0.4, transcription_delay=0.2
+        ))
+        agent.emit("user_speech_committed", None)
+        agent.emit("function_calls_collected", [_call("query_info")])
+        agent.emit("function_calls_finished", [_called("query_info")])
+        agent.emit("metrics_collected", agent_metrics.PipelineLLMMetrics(
+            request_id="r", timestamp=0.0, ttft=0.3, duration=1.0, label="llm", cancelled=False,
+            completion_tokens=1, prompt_tokens=1, total_tokens=2, tokens_per_second=1.0,
+            error=None, sequence_id="1",
+        ))
+        agent.emit("metrics_collected", agent_metrics.PipelineTTSMetrics(
+            request_id="r", timestamp=0.0, ttfb=0.15, duration=1.0, audio_duration=1.0, cancelled=False,
+            characters_count=10, label="tts", streamed=True, error=None, sequence_id="1",
+        ))
+        agent.emit("agent_started_speaking")
+        agent.emit("agent_stopped_speaking")
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["turn"] == 1 and record["room"] == "room-1" and not record["interrupted"]
+    spans = record["spans_ms"]
+    assert set(spans) == {
+        "eou_delay", "transcription_delay", "final_transcript", "tool:query_info",
+        "llm_first_token", "tts_first_byte", "playout_start",
+    }
+    assert spans["eou_delay"] == 400.0 and spans["llm_first_token"] == 300.0
+    assert spans["final_transcript"] <= spans["playout_start"]
+    assert tracer.end_of_speech is None and tracer.spans == {}
+
+    rendered = metrics.render()
+    assert 'voice_agent_span_seconds_count{span="tool:query_info",mode="pipeline"} 1' in rendered
+    assert 'voice_agent_span_seconds_bucket{span="eou_delay",mode="pipeline",le="0.5"} 1' in rendered
+    assert 'voice_agent_span_seconds_bucket{span="eou_delay",mode="pipeline",le="0.25"} 0' in rendered
+    assert list(tmp_path.glob("voice_agent_*.prom"))
+
+
+def test_first_duration_in_a_turn_wins():
+    _, tracer, _ = _tracer()
+    tracer.start_turn()
+    tracer.duration("llm_first_token", 0.3)
+    tracer.duration("llm_first_token", 0.9)
+    tracer.duration("tts_first_byte", -1)
+    assert tracer.spans == {"llm_first_token": 0.3}
+
+
+def test_events_outside_a_turn_are_ignored():
+    agent, tracer, metrics = _tracer()
+    agent.emit("user_speech_committed", None)
+    agent.emit("agent_stopped_speaking")
+    assert tracer.spans == {} and metrics.histograms == {}
+
+
+def test_new_turn_flushes_an_unfinished_one_and_interruptions_are_logged(caplog):
+    agent, tracer, metrics = _tracer()
+    with caplog.at_level(logging.INFO, logger="latency"):
+        agent.emit("user_stopped_speaking")
+        agent.emit("user_speech_committed", None)
+        agent.emit("user_stopped_speaking")
+        agent.emit("user_speech_committed", None)
+        agent.emit("agent_speech_interrupted")
+
+    records = [json.loads(record.getMessage()) for record in caplog.records]
+    assert [(r["turn"], r["interrupted"]) for r in records] == [(1, False), (2, True)]
+    assert metrics.histograms[("final_transcript", "pipeline")].count == 2
@@ -0,0 +1,184 @@
+"""
+Accuracy and latency of local title matching on misspelled, transcribed titles.
+
+    python title_bench.py [--size 5000] [--thresholds 0.75,0.8,0.85,0.9,0.95]
+
+Each query is resolved the way CinemaService.retrieve_movie does it: an exact
+title key match is accepted, otherwise the best fuzzy match is accepted at or
+above the threshold and anything else goes to TMDB. A query counts as wrong
+when it is accepted as another movie (or as any movie when the title is not
+in the catalog), deferred ones cost a TMDB round trip but are not wrong. The
+index is padded with `size` synthetic titles for the latency numbers.
+"""
+import sys
+import time
+import random
+import argparse
+from typing import List, Optional, Tuple
+
+from title_index import TitleIndex
+
+CATALOG = [
+    "Toy Story", "Toy Story 2", "Toy Story 3", "Toy Story 4", "Frozen", "Frozen II",
+    "Alien", "Aliens", "Alien: Romulus", "Interstellar", "Inception", "The Matrix",
+    "The Matrix Reloaded", "The Godfather", "The Godfather Part II", "Dune", "Dune: Part Two",
+    "Blade Runner", "Blade Runner 2049", "Inside Out", "Inside Out 2", "Despicable Me",
+    "Despicable Me 4", "Deadpool & Wolverine", "Gladiator", "Gladiator II", "Joker",
+    "Joker: Folie à Deux", "Oppenheimer", "Barbie", "Wicked", "Moana", "Moana 2",
+    "Kung Fu Panda 4", "The Lion King", "Mufasa: The Lion King", "Venom",
+    "Venom: The Last Dance", "Beetlejuice", "Beetlejuice Beetlejuice",
+    "Spider-Man: Across the Spider-Verse", "Guardians of the Galaxy Vol. 3",
+    "The Shawshank Redemption", "Pulp Fiction", "Forrest Gump", "Schindler's List",
+    "Ratatouille", "Coco", "Encanto", "Wonka", "Godzilla x Kong: The New Empire", "Twisters",
+    "Twister", "Mission: Impossible - Dead Reckoning Part One", "The Batman", "Avatar",
+    "Avatar: The Way of Water", "Jurassic Park", "Jurassic World", "The Wild Robot",
+    "Sonic the Hedgehog 3", "Smile", "Smile 2", "Top Gun", "Top Gun: Maverick",
+]
+
+# (what the transcript says, the title meant or None when it is not in the catalog)
+QUERIES: List[Tuple[str, Optional[str]]] = [
+    ("toy story", "Toy Story"),
+    ("toy story three", "Toy Story 3"),
+    ("toy story 3", "Toy Story 3"),
+    ("toy story four", "Toy Story 4"),
+    ("toy story for", "Toy Story 4"),
+    ("frozen", "Frozen"),
+    ("frozen two", "Frozen II"),
+    ("frozen 2", "Frozen II"),
+    ("alien", "Alien"),
+    ("aliens", "Aliens"),
+    ("alien romulus", "Alien: Romulus"),
+    ("interstellar", "Interstellar"),
+    ("inter stellar", "Interstellar"),
+    ("interstelar", "Interstellar"),
+    ("inseption", "Inception"),
+    ("the matrix reloded", "The Matrix Reloaded"),
+    ("matrix", "The Matrix"),
+    ("god father", "The Godfather"),
+    ("godfather part two", "The Godfather Part II"),
+    ("doon", "Dune"),
+    ("dune part 2", "Dune: Part Two"),
+    ("dune part two", "Dune: Part Two"),
+    ("blade runner", "Blade Runner"),
+    ("blade runner 2049", "Blade Runner 2049"),
+    ("inside out two", "Inside Out 2"),
+    ("despicable me four", "Despicable Me 4"),
+    ("deadpool and wolverine", "Deadpool & Wolverine"),
+    ("deadpool wolverine", "Deadpool & Wolverine"),
+    ("dead pool and wolverine", "Deadpool & Wolverine"),
+    ("gladiator two", "Gladiator II"),
+    ("gladiator", "Gladiator"),
+    ("joker folie a deux", "Joker: Folie à Deux"),
+    ("oppenhimer", "Oppenheimer"),
+    ("oppen heimer", "Oppenheimer"),
+    ("barbi", "Barbie"),
+    ("wicked", "Wicked"),
+    ("moana 2", "Moana 2"),
+    ("kung fu panda four", "Kung Fu Panda 4"),
+    ("lion king", "The Lion King"),
+    ("mufasa the lion king", "Mufasa: The Lion King"),
+    ("venom the last dance", "Venom: The Last Dance"),
+    ("venom last dance", "Venom: The Last Dance"),
+    ("beetle juice", "Beetlejuice"),
+    ("beetlejuice beetlejuice", "Beetlejuice Beetlejuice"),
+    ("spiderman across the spider verse", "Spider-Man: Across the Spider-Verse"),
+    ("guardians of the galaxy volume three", "Guardians of the Galaxy Vol. 3"),
+    ("shawshank redemption", "The Shawshank Redemption"),
+    ("the shawshank redemtion", "The Shawshank Redemption"),
+    ("pulp fiction", "Pulp Fiction"),
+    ("forest gump", "Forrest Gump"),
+    ("schindlers list", "Schindler's List"),
+    ("ratatouie", "Ratatouille"),
+    ("encanto", "Encanto"),
+    ("godzilla x kong the new empire", "Godzilla x Kong: The New Empire"),
+    ("twisters", "Twisters"),
+    ("twister", "Twister"),
+    ("the batman", "The Batman"),
+    ("avatar the way of water", "Avatar: The Way of Water"),
+    ("jurassic park", "Jurassic Park"),
+    ("jurasic world", "Jurassic World"),
+    ("the wild robot", "The Wild Robot"),
+    ("wild robot", "The Wild Robot"),
+    ("sonic the hedgehog three", "Sonic the Hedgehog 3"),
+    ("smile two", "Smile 2"),
+    ("top gun maverick", "Top Gun: Maverick"),
+    ("topgun", "Top Gun"),
+    ("the notebook", None),
+    ("titanic", None),
+    ("toy soldiers", None),
+    ("frozen planet", None),
+    ("alien nation", None),
+    ("inside man", None),
+    ("the mummy", None),
+    ("cars", None),
+    ("dunkirk", None),
+    ("shrek 2", None),
+    ("smile 3", None),
+    ("top gun 2", None),
+    ("avatar 3", None),
+    ("the godfather part three", None),
+]
+
+WORDS = (
+    "night day dark light last first lost city star river king queen house road "
+    "war love dead blue red iron silver shadow storm fire ice ghost island return"
+).split()
+
+
+def build_index(size: int, seed: int = 0) -> TitleIndex:
+    index = TitleIndex()
+    for i, title in enumerate(CATALOG):
+        index.add({"id": i, "title": title, "popularity": 100.0 - i})
+    rng = random.Random(seed)
+    for i in range(size):
+        words = rng.sample(WORDS, rng.randint(1, 4))
+        if rng.random() < 0.2:
+            words.append(str(rng.randint(2, 5)))
+        index.add({"id": 10_000 + i, "title": " ".join(words).title(), "popularity": rng.random()})
+    return index
+
+
+def resolve(index: TitleIndex, query: str, threshold: float) -> Tuple[Optional[dict], float]:
+    start = time.perf_counter()
+    movie = index.exact(query)
+    if movie is None:
+        matches = index.search(query)
+        if matches and matches[0][0] >= threshold:
+            movie = matches[0][1]
+    return movie, time.perf_counter() - start
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="title_bench")
+    parser.add_argument("--size", type=int, default=5000, help="synthetic titles added to the index")
+    parser.add_argument("--thresholds", default="0.75,0.8,0.85,0.9,0.95")
+    parser.add_argument("--verbose", action="store_true", help="print every wrong match")
+    args = parser.parse_args(argv)
+
+    index = build_index(args.size)
+    print(f"{len(QUERIES)} queries, {len(index)} titles indexed")
+    print(f"{'threshold':>9} {'local':>6} {'wrong':>6} {'tmdb':>5} {'p50 us':>7} {'p95 us':>7}")
+    for threshold in (float(value) for value in args.thresholds.split(",")):
+        right = wrong = deferred = 0
+        timings = []
+        for query, expected in QUERIES:
+            movie, elapsed = resolve(index, query, threshold)
+            timings.append(elapsed)
+            if movie is None:
+                deferred += 1
+            elif movie["title"] == expected:
+                right += 1
+            else:
+                wrong += 1
+                if args.verbose:
+                    print(f"  {threshold}: {query!r} -> {movie['title']!r}, meant {expected!r}")
+        timings.sort()
+        print(
+            f"{threshold:>9.2f} {right:>6} {wrong:>6} {deferred:>5} "
+            f"{timings[len(timings) // 2] * 1e6:>7.0f} {timings[int(len(timings) * 0.95)] * 1e6:>7.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# spelling variants STT tends to produce for the same sound
+_SOUND_RULES = [
+    (re.compile(r"^kn|(?<=\s)kn"), "n"),
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"ck"), "k"),
+    (re.compile(r"gh(?=t)"), ""),
+    (re.compile(r"(.)\1+"), r"\1"),
+]
+_NUMBERS = {
+    "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+    "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10",
+    "ii": "2", "iii": "3", "iv": "4", "and": "",
+}
+
+
+def _words(title: str) -> list:
+    text = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode().lower()
+    text = re.sub(r"[^a-z0-9 ]+", " ", text)
+    words = [_NUMBERS.get(word, word) for word in text.split()]
+    return [word for word in words if word]
+
+
+def title_key(title: str) -> str:
+    """Spacing-, accent- and spelling-insensitive form of a title."""
+    words = _words(title)
+    if words and words[0] in ("the", "a", "an") and len(words) > 1:
+        words = words[1:]
+    text = " ".join(words)
+    for pattern, replacement in _SOUND_RULES:
+        text = pattern.sub(replacement, text)
+    # "inter stellar" and "interstellar" should look the same
+    return text.replace(" ", "")
+
+
+def title_numbers(title: str) -> tuple:
+    """Sequel and other numbers of a title, "Toy Story Three" -> ("3",)."""
+    return tuple(sorted(word for word in _words(title) if word.isdigit()))
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """
+    In-memory trigram index over movie titles for matching noisy transcribed
+    titles. Scores are the Dice coefficient between the trigram sets of the
+    query and title keys; ties go to the more popular movie.
+
+    Numbers are decisive: a title is only a candidate when its numbers match
+    the query's exactly, so "Toy Story" never scores against "Toy Story 4"
+    and "Toy Story 3" never against either.
+    """
+
+    def __init__(self):
+        self.movies: List[Dict] = []
+        self.grams: List[set] = []
+        self.numbers: List[tuple] = []
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self._ids: Dict[int, int] = {}
+        self._keys: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.movies)
+
+    def add(self, movie: Dict):
+        title = movie.get("title") or ""
+        key = title_key(title)
+        movie_id = movie.get("id")
+        if not key or movie_id in self._ids:
+            return
+        position = len(self.movies)
+        self._ids[movie_id] = position
+        self.movies.append(movie)
+        self.numbers.append(title_numbers(title))
+        # remakes share a key, the more popular one answers exact lookups
+        current = self._keys.get(key)
+        if current is None or (movie.get("popularity") or 0) > (self.movies[current].get("popularity") or 0):
+            self._keys[key] = position
+        grams = trigrams(key)
+        self.grams.append(grams)
+        for gram in grams:
+            self.postings[gram].append(position)
+
+    def exact(self, query: str) -> Optional[Dict]:
+        """The movie whose title key equals the query's, if any."""
+        position = self._keys.get(title_key(query))
+        return None if position is None else self.movies[position]
+
+    def search(self, query: str, limit: int = 1) -> List[Tuple[float, Dict]]:
+        grams = trigrams(title_key(query))
+        numbers = title_numbers(query)
+        overlap: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for position in self.postings.get(gram, ()):
+                overlap[position] += 1
+
+        scored = [
+            (2 * shared / (len(grams) + len(self.grams[position])), position)
+            for position, shared in overlap.items()
+            if self.numbers[position] == numbers
+        ]
+        scored.sort(key=lambda item: (-item[0], -(self.movies[item[1]].get("popularity") or 0)))
+        return [(round(score, 3), self.movies[position]) for score, position in scored[:limit]]
@@ -0,0 +1,89 @@
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger("tool-budget")
+
+# returned by ToolBudget.run when the deadline passed before the work finished
+PENDING = object()
+
+INTERIM_REPLY = (
+    "This is taking a little longer than usual. Tell the customer you are still checking "
+    "and will have the answer in a moment, then call this tool again with the same arguments."
+)
+
+
+def parse_deadlines(value: str) -> Dict[str, float]:
+    # "query_info=4,confirm_reservation=5"
+    deadlines = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, seconds = item.partition("=")
+        deadlines[name.strip()] = float(seconds)
+    return deadlines
+
+
+class ToolBudget:
+    """
+    Per-session latency budget for agent tools.
+
+    `run(tool, key, work)` awaits `work()` for at most the tool's deadline. If
+    the deadline passes, the work keeps running in the background and PENDING
+    is returned so the tool can answer with an interim reply; the next call
+    with the same tool and key picks up the finished (or still running) task
+    instead of starting the work again.
+    """
+
+    def __init__(
+        self,
+        default_deadline: Optional[float] = None,
+        deadlines: Optional[Dict[str, float]] = None,
+    ):
+        if default_deadline is None:
+            default_deadline = float(os.getenv("TOOL_DEADLINE", "3"))
+        if deadlines is None:
+            deadlines = parse_deadlines(os.getenv("TOOL_DEADLINES", ""))
+        self.default_deadline = default_deadline
+        self.deadlines = deadlines
+        self.interim_reply = INTERIM_REPLY
+        self.pending: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "deadline_hits": 0, "late_results": 0, "failures": 0}
+        )
+
+    def deadline(self, tool: str) -> float:
+        return self.deadlines.get(tool, self.default_deadline)
+
+    async def run(self, tool: str, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Any:
+        counters = self.counters[tool]
+        counters["calls"] += 1
+        task = self.pending.pop((tool, key), None)
+        if task is not None and not task.done():
+            logger.info(f"{tool} resuming background work")
+        elif task is not None:
+            counters["late_results"] += 1
+        else:
+            task = asyncio.ensure_future(work())
+            # failures of work nobody comes back for should not be logged as unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        try:
+            # shielded so hitting the deadline does not cancel the work itself
+            return await asyncio.wait_for(asyncio.shield(task), self.deadline(tool))
+        except asyncio.TimeoutError:
+            counters["deadline_hits"] += 1
+            logger.warning(f"{tool} passed its {self.deadline(tool)}s deadline, finishing in the background")
+            self.pending[(tool, key)] = task
+            return PENDING
+        except Exception:
+            counters["failures"] += 1
+            raise
+
+    def cancel(self):
+        for task in self.pending.values():
+            task.cancel()
+        self.pending.clear()
+
+    def stats(self) -> dict:
+        return {tool: dict(counters) for tool, counters in self.counters.items()}
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("latency")
+
+# seconds, tuned for voice turns where anything above ~1.5s feels slow
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class LatencyMetrics:
+    """
+    Process-wide span histograms labelled by span name and session mode,
+    rendered in the Prometheus text format, along with hit/miss counters of
+    the agent's caches. With METRICS_TEXTFILE_DIR set the
+    metrics are written to `<dir>/voice_agent_<pid>.prom` after every turn,
+    for node_exporter's textfile collector.
+    """
+
+    name = "voice_agent_span_seconds"
+    cache_name = "voice_agent_cache_lookups_total"
+
+    def __init__(self, textfile_dir: Optional[str] = None):
+        self.histograms: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.cache_lookups: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.textfile_dir = textfile_dir
+        self._lock = threading.Lock()
+
+    def observe(self, span: str, mode: str, seconds: float):
+        with self._lock:
+            self.histograms[(span, mode)].observe(seconds)
+
+    def cache_lookup(self, cache: str, hit: bool):
+        with self._lock:
+            self.cache_lookups[(cache, "hit" if hit else "miss")] += 1
+
+    def hit_rate(self, cache: str) -> Optional[float]:
+        with self._lock:
+            hits = self.cache_lookups.get((cache, "hit"), 0)
+            total = hits + self.cache_lookups.get((cache, "miss"), 0)
+        return hits / total if total else None
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} Duration of voice pipeline spans per turn.",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for (span, mode), hist in sorted(self.histograms.items()):
+                labels = f'span="{span}",mode="{mode}"'
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"{self.name}_sum{{{labels}}} {hist.sum:.6f}")
+                lines.append(f"{self.name}_count{{{labels}}} {hist.count}")
+            if self.cache_lookups:
+                lines.append(f"# HELP {self.cache_name} Cache lookups by cache and result.")
+                lines.append(f"# TYPE {self.cache_name} counter")
+                for (cache, result), count in sorted(self.cache_lookups.items()):
+                    lines.append(f'{self.cache_name}{{cache="{cache}",result="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        if not self.textfile_dir:
+            return
+        path = os.path.join(self.textfile_dir, f"voice_agent_{os.getpid()}.prom")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+latency_metrics = LatencyMetrics(os.getenv("METRICS_TEXTFILE_DIR"))
+
+
+class TurnTracer:
+    """
+    Collects the spans of each user turn from VoicePipelineAgent events.
+
+    A turn starts when the user stops speaking and ends when the agent stops
+    (or is interrupted). Offsets are measured from end of speech:
+
+        final_transcript   user_speech_committed
+        tool:<name>        function_calls_collected -> function_calls_finished
+        playout_start      agent_started_speaking
+
+    and durations reported by the pipeline metrics are recorded as is:
+    eou_delay, transcription_delay, llm_first_token, tts_first_byte. Every
+    finished turn is logged as one JSON line and observed in `metrics`.
+    """
+
+    def __init__(self, mode: str, room: str = "", metrics: LatencyMetrics = latency_metrics):
+        self.mode = mode
+        self.room = room
+        self.metrics = metrics
+        self.turn = 0
+        self.end_of_speech: Optional[float] = None
+        self.spans: Dict[str, float] = {}
+        self._tool_starts: Dict[str, float] = {}
+
+    def attach(self, agent):
+        from livekit.agents import metrics as agent_metrics
+
+        agent.on("user_stopped_speaking", lambda *_: self.start_turn())
+        agent.on("user_speech_committed", lambda *_: self.offset("final_transcript"))
+        agent.on("function_calls_collected", lambda calls: self.tools_started(calls))
+        agent.on("function_calls_finished", lambda called: self.tools_finished(called))
+        agent.on("agent_started_speaking", lambda *_: self.offset("playout_start"))
+        agent.on("agent_stopped_speaking", lambda *_: self.finish_turn())
+        agent.on("agent_speech_interrupted", lambda *_: self.finish_turn(interrupted=True))
+
+        @agent.on("metrics_collected")
+        def _on_metrics(mtrcs):
+            if isinstance(mtrcs, agent_metrics.PipelineEOUMetrics):
+                self.duration("eou_delay", mtrcs.end_of_utterance_delay)
+                self.duration("transcription_delay", mtrcs.transcription_delay)
+            elif isinstance(mtrcs, agent_metrics.PipelineLLMMetrics):
+                self.duration("llm_first_token", mtrcs.ttft)
+            elif isinstance(mtrcs, agent_metrics.PipelineTTSMetrics):
+                self.duration("tts_first_byte", mtrcs.ttfb)
+
+    def start_turn(self):
+        if self.end_of_speech is not None and self.spans:
+            self.finish_turn()
+        self.turn += 1
+        self.end_of_speech = time.perf_counter()
+        self.spans = {}
+        self._tool_starts = {}
+
+    def offset(self, span: str):
+        if self.end_of_speech is not None:
+            self.spans.setdefault(span, time.perf_counter() - self.end_of_speech)
+
+    def duration(self, span: str, seconds: float):
+        # the first value in a turn wins, nested tool calls produce more
+        if self.end_of_speech is not None and seconds is not None and seconds >= 0:
+            self.spans.setdefault(span, seconds)
+
+    def tools_started(self, calls: List):
+        now = time.perf_counter()
+        for call in calls:
+            self._tool_starts[call.function_info.name] = now
+
+    def tools_finished(self, called: List):
+        now = time.perf_counter()
+        for result in called:
+            name = result.call_info.function_info.name
+            start = self._tool_starts.pop(name, None)
+            if start is not None:
+                self.spans[f"tool:{name}"] = self.spans.get(f"tool:{name}", 0.0) + now - start
+
+    def finish_turn(self, interrupted: bool = False):
+        if self.end_of_speech is None or not self.spans:
+            return
+        for span, seconds in self.spans.items():
+            self.metrics.observe(span, self.mode, seconds)
+        logger.info(
+            json.dumps(
+                {
+                    "event": "turn_latency",
+                    "room": self.room,
+                    "mode": self.mode,
+                    "turn": self.turn,
+                    "interrupted": interrupted,
+                    "spans_ms": {span: round(seconds * 1000, 1) for span, seconds in self.spans.items()},
+                }
+            )
+        )
+        self.end_of_speech = None
+        self.spans = {}
+        try:
+            self.metrics.export()
+        except OSError as e:
+            logger.warning(f"could not write latency metrics: {e}")
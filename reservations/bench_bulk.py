@@ -0,0 +1,108 @@
+"""
+Times N single reservation calls against one bulk call on the configured database.
+
+    python bench_bulk.py [--count 200] [--repeat 3]
+
+Bookings go to dates far in the future and are deleted afterwards. The create
+paths take advisory locks, so point DATABASE_URL (or the POSTGRES_* settings)
+at a Postgres, not production.
+"""
+import sys
+import time
+import argparse
+from datetime import date, time as dt_time, timedelta
+from typing import Callable, List
+
+import crud
+from models import Reservation, ReservationCreate, ReservationBulkUpdate, ReservationUpdate, SessionLocal
+
+BENCH_NAME = "bulk benchmark"
+
+
+def bookings(count: int, offset_days: int) -> List[ReservationCreate]:
+    # one booking per room and day, so none of them conflict
+    rooms = list(crud.ROOMS)
+    first_day = date.today() + timedelta(days=5000 + offset_days)
+    return [
+        ReservationCreate(
+            name=BENCH_NAME,
+            number="0000000000",
+            people_count=2,
+            date=first_day + timedelta(days=i // len(rooms)),
+            time=dt_time(19, 0),
+            room=rooms[i % len(rooms)],
+            movie_id=None,
+            movie_name=None,
+            movie_desc=None,
+            movie_image=None,
+            snack_package=False,
+            status="pending",
+        )
+        for i in range(count)
+    ]
+
+
+def timed(label: str, fn: Callable, results: dict):
+    start = time.perf_counter()
+    value = fn()
+    results.setdefault(label, []).append(time.perf_counter() - start)
+    return value
+
+
+def run_once(count: int, offset_days: int, results: dict):
+    db = SessionLocal()
+    try:
+        singles = timed(
+            "create x N", lambda: [crud.create_reservation(db, item) for item in bookings(count, offset_days)], results
+        )
+        bulk = timed(
+            "bulk create", lambda: crud.bulk_create_reservations(db, bookings(count, offset_days + count)), results
+        )
+        single_ids = [reservation.id for reservation in singles]
+        bulk_ids = [result["id"] for result in bulk if result["success"]]
+
+        timed(
+            "update x N",
+            lambda: [crud.update_reservation(db, id_, ReservationUpdate(time=dt_time(20, 0))) for id_ in single_ids],
+            results,
+        )
+        timed(
+            "bulk update",
+            lambda: crud.bulk_update_reservations(
+                db, [ReservationBulkUpdate(id=id_, changes=ReservationUpdate(time=dt_time(20, 0))) for id_ in bulk_ids]
+            ),
+            results,
+        )
+        timed(
+            "cancel x N",
+            lambda: [crud.update_reservation(db, id_, ReservationUpdate(status="cancelled")) for id_ in single_ids],
+            results,
+        )
+        timed("bulk cancel", lambda: crud.bulk_set_reservation_status(db, bulk_ids, "cancelled"), results)
+    finally:
+        db.rollback()
+        db.query(Reservation).filter(Reservation.name == BENCH_NAME).delete()
+        db.commit()
+        db.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench_bulk")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results: dict = {}
+    for i in range(args.repeat):
+        run_once(args.count, i * args.count * 2, results)
+
+    print(f"{args.count} reservations, best of {args.repeat}")
+    print(f"{'operation':<12} {'total ms':>9} {'per item ms':>12}")
+    for label, timings in results.items():
+        best = min(timings)
+        print(f"{label:<12} {best * 1000:>9.1f} {best * 1000 / args.count:>12.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Peak RSS and time to first vector when ingesting a large PDF, loading the
+whole document up front vs streaming it page by page.
+
+    python bench_ingest.py [--pages 2000] [--embed-ms 50]
+
+A synthetic text PDF with `pages` pages is written to a temp directory. Each
+mode runs in a fresh interpreter so the peak RSS is its own:
+
+    eager       loader.load(), split everything, then embed batch by batch
+    streaming   DocumentProcessor.iter_batches (lazy_load, one page at a time)
+
+Embedding is stubbed with a sleep of `embed-ms` per batch, nothing is sent to
+OpenAI or written to a vector store.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from itertools import islice
+from typing import List
+
+# importing vectors builds the app's DB engine and vector store, keep both
+# local since the benchmark touches neither
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/bench_ingest.db")
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("LOCAL_INDEX_DIR", os.path.join(tempfile.gettempdir(), "bench_ingest_index"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+LINE = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor."
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 45):
+    """A plain PDF with `pages` pages of Helvetica text."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for number in range(pages):
+        text = "".join(
+            f"({number + 1}.{i} {LINE}) Tj T* " for i in range(lines_per_page)
+        )
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text}ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def run_mode(mode: str, path: str, embed_seconds: float) -> dict:
+    from vectors import DocumentProcessor
+
+    doc = DocumentProcessor()
+    # what the imports and clients cost before any page is read
+    base_rss = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "eager":
+        chunks = iter(doc.text_splitter.split_documents(doc.get_loader(path).load()))
+        batches = iter(lambda: list(islice(chunks, doc.batch_size)), [])
+    else:
+        batches = doc.iter_batches(path)
+
+    first_vector = None
+    count = 0
+    for batch in batches:
+        time.sleep(embed_seconds)
+        count += len(batch)
+        if first_vector is None:
+            first_vector = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "chunks": count,
+        "first_vector": first_vector,
+        "total": time.perf_counter() - start,
+        "base_rss_mb": base_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench_ingest")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--embed-ms", type=float, default=50.0, help="stubbed embedding time per batch")
+    parser.add_argument("--mode", choices=("eager", "streaming"), help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.pdf, args.embed_ms / 1000)))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.pdf")
+        write_pdf(path, args.pages)
+        print(f"{args.pages} pages, {os.path.getsize(path) / 1e6:.1f} MB, {args.embed_ms:.0f}ms per embedding batch")
+        print(f"{'mode':<10} {'chunks':>7} {'first vector s':>15} {'total s':>8} {'peak RSS MB':>12} {'over base MB':>13}")
+        for mode in ("eager", "streaming"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--mode", mode, "--pdf", path, "--embed-ms", str(args.embed_ms)],
+                check=True,
+                capture_output=True,
+                text=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:<10} {result['chunks']:>7} {result['first_vector']:>15.2f} "
+                f"{result['total']:>8.2f} {result['peak_rss_mb']:>12.0f} "
+                f"{result['peak_rss_mb'] - result['base_rss_mb']:>13.0f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
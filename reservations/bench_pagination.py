@@ -0,0 +1,99 @@
+"""
+Times deep pages of the reservation listing, OFFSET vs keyset cursor.
+
+    python bench_pagination.py [--rows 1000000] [--limit 50] [--repeat 5] [--keep]
+
+`rows` cancelled reservations are inserted (skipped when a previous --keep
+run left them), then the page starting at each depth is fetched both ways
+through crud.list_reservations, unfiltered and filtered by status. The
+cursor for a depth is taken from the row just before it, outside the timing.
+Point DATABASE_URL (or the POSTGRES_* settings) at a Postgres, not production.
+"""
+import sys
+import time
+import argparse
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import List
+
+from sqlalchemy import func, insert, select
+
+import crud
+from models import Reservation, ReservationFilters, SessionLocal
+
+BENCH_NAME = "pagination benchmark"
+INSERT_CHUNK = 10_000
+
+
+def seed(db, rows: int):
+    existing = db.scalar(select(func.count()).select_from(Reservation).where(Reservation.name == BENCH_NAME))
+    if existing >= rows:
+        return
+    rooms = list(crud.ROOMS)
+    start = datetime(2000, 1, 1)
+    for offset in range(existing, rows, INSERT_CHUNK):
+        db.execute(
+            insert(Reservation),
+            [
+                {
+                    "name": BENCH_NAME,
+                    "number": f"{i % 10_000:010d}",
+                    "people_count": 2,
+                    "date": date(2100, 1, 1) + timedelta(days=i % 3650),
+                    "time": dt_time(10 + i % 12, 0),
+                    "room": rooms[i % len(rooms)],
+                    "snack_package": False,
+                    "status": "cancelled",
+                    # pairs of rows share a timestamp, like bulk inserts do
+                    "created_at": start + timedelta(seconds=i // 2),
+                }
+                for i in range(offset, min(offset + INSERT_CHUNK, rows))
+            ],
+        )
+        db.commit()
+        print(f"\rseeded {min(offset + INSERT_CHUNK, rows)}/{rows}", end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench_pagination")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded rows for the next run")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        seed(db, args.rows)
+        depths = [depth for depth in (0, 1_000, 10_000, 100_000, 500_000, args.rows - args.limit) if 0 <= depth < args.rows]
+        print(f"{args.rows} rows, pages of {args.limit}, best of {args.repeat}")
+        print(f"{'filter':<10} {'depth':>9} {'offset ms':>10} {'keyset ms':>10}")
+        for label, filters in (("none", None), ("cancelled", ReservationFilters(status="cancelled"))):
+            for depth in sorted(set(depths)):
+                cursor = None
+                if depth:
+                    previous = crud.list_reservations(db, skip=depth - 1, limit=1, filters=filters)
+                    cursor = crud.encode_cursor(previous[0])
+                offset = best_of(args.repeat, lambda: crud.list_reservations(db, skip=depth, limit=args.limit, filters=filters))
+                keyset = best_of(args.repeat, lambda: crud.list_reservations(db, limit=args.limit, cursor=cursor, filters=filters))
+                print(f"{label:<10} {depth:>9} {offset * 1000:>10.2f} {keyset * 1000:>10.2f}")
+    finally:
+        db.rollback()
+        if not args.keep:
+            db.query(Reservation).filter(Reservation.name == BENCH_NAME).delete()
+            db.commit()
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,398 @@
+import json
+import base64
+from array import array
+import os
+from datetime import datetime, date as dt_date, time as dt_time, timedelta
+from sqlalchemy import and_, or_, select, tuple_, text, update, delete, insert as sql_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from models import Reservation, ReservationCreate, ReservationUpdate, TextFile, TextFileCreate, TextFileUpdate
+from sqlalchemy.dialects.postgresql import insert
+from models import Reservation, ReservationCreate, ReservationUpdate, ReservationFilters, ReservationBulkUpdate, ReservationResponse, TextFile, TextFileCreate, TextFileUpdate, TextFileResponse, ChunkEmbedding
+
+# Rooms and their capacities, a booking holds its room for SLOT_MINUTES
+ROOMS = {"Small Room": 4, "Medium Room": 7, "Large Room": 10}
+SLOT_MINUTES = int(os.getenv("ROOM_SLOT_MINUTES", "180"))
+
+
+class BookingConflict(Exception):
+    pass
+
+
+class UnknownRoom(ValueError):
+    pass
+
+
+def check_room(room: str):
+    if room not in ROOMS:
+        raise UnknownRoom(f"Unknown room {room!r}, choose one of: {', '.join(ROOMS)}")
+
+
+def slot_window(date: dt_date, time: dt_time) -> tuple[datetime, datetime]:
+    # start times that would overlap a booking starting at `time`, a late
+    # booking's window runs into the next day and an early one's into the last
+    start = datetime.combine(date, time)
+    duration = timedelta(minutes=SLOT_MINUTES)
+    return start - duration, start + duration
+
+def slot_dates(date: dt_date, time: dt_time) -> list[dt_date]:
+    lower, upper = slot_window(date, time)
+    return [lower.date() + timedelta(days=i) for i in range((upper.date() - lower.date()).days + 1)]
+
+def booked_rooms_query(date: dt_date, time: dt_time, room: str | None = None, exclude_id: int | None = None):
+    # a range scan on ix_reservations_date_time per day the window touches
+    lower, upper = slot_window(date, time)
+    days = []
+    for day in slot_dates(date, time):
+        clause = [Reservation.date == day]
+        if day == lower.date():
+            clause.append(Reservation.time > lower.time())
+        if day == upper.date():
+            clause.append(Reservation.time < upper.time())
+        days.append(and_(*clause))
+    stmt = select(Reservation.room).where(or_(*days), Reservation.status != "cancelled")
+    if room:
+        stmt = stmt.where(Reservation.room == room)
+    if exclude_id is not None:
+        stmt = stmt.where(Reservation.id != exclude_id)
+    return stmt
+
+def booking_lock_statement(room: str, date: dt_date):
+    # serializes bookings of one room on one day until the transaction ends;
+    # a booking takes the lock of every day its slot window touches, so two
+    # overlapping bookings always share at least one
+    return text("SELECT pg_advisory_xact_lock(hashtext(:key))").bindparams(key=f"{room}|{date.isoformat()}")
+
+def room_availability(booked: set[str], party_size: int | None = None) -> list[dict]:
+    return [
+        {"room": room, "capacity": capacity, "available": room not in booked}
+        for room, capacity in ROOMS.items()
+        if party_size is None or capacity >= party_size
+    ]
+
+
+# Keyset pagination
+# Listings are ordered newest first by (created_at, id); a cursor is the
+# position of the last row of the previous page.
+def encode_cursor(row) -> str:
+    payload = json.dumps([row.created_at.isoformat(), row.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for a malformed or tampered cursor."""
+    try:
+        created_at, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at, id_ = datetime.fromisoformat(created_at), int(id_)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    # encode_cursor only writes naive timestamps and ids of an INTEGER column,
+    # anything else would fail in the database instead
+    if created_at.tzinfo is not None or not 0 <= id_ < 2 ** 31:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return created_at, id_
+
+def paginate(stmt, model, cursor: str | None, skip: int, limit: int):
+    if cursor:
+        stmt = stmt.where(tuple_(model.created_at, model.id) < decode_cursor(cursor))
+    elif skip:
+        stmt = stmt.offset(skip)
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+
+def reservations_query(filters: ReservationFilters | None = None, cursor: str | None = None, skip: int = 0, limit: int = 10):
+    stmt = select(Reservation)
+    if filters:
+        if filters.date_from:
+            stmt = stmt.where(Reservation.date >= filters.date_from)
+        if filters.date_to:
+            stmt = stmt.where(Reservation.date <= filters.date_to)
+        if filters.status:
+            stmt = stmt.where(Reservation.status == filters.status)
+        if filters.room:
+            stmt = stmt.where(Reservation.room == filters.room)
+        if filters.number:
+            stmt = stmt.where(Reservation.number == filters.number)
+    return paginate(stmt, Reservation, cursor, skip, limit)
+
+# Single-statement mutations
+# Updates and deletes go out as one UPDATE/DELETE ... RETURNING and the response
+# model is built from the returned row, so no SELECT before and no refresh after.
+def changed_fields(update_model) -> dict:
+    return {key: value for key, value in update_model.dict(exclude_unset=True).items() if value is not None}
+
+def needs_slot_check(changes: dict) -> bool:
+    return bool(changes.keys() & {"room", "date", "time"}) or changes.get("status", "cancelled") != "cancelled"
+
+def update_returning_statement(model, row_id: int, changes: dict):
+    return update(model).where(model.id == row_id).values(**changes).returning(model)
+
+def delete_returning_statement(model, row_id: int):
+    return delete(model).where(model.id == row_id).returning(model)
+
+MUTATION_OPTIONS = {"synchronize_session": False}
+
+def update_returning(db: Session, model, response_model, row_id: int, changes: dict):
+    if not changes:
+        row = db.get(model, row_id)
+        return response_model.model_validate(row) if row else None
+    row = db.execute(update_returning_statement(model, row_id, changes), execution_options=MUTATION_OPTIONS).scalar_one_or_none()
+    result = response_model.model_validate(row) if row else None
+    db.commit()
+    return result
+
+def delete_returning(db: Session, model, response_model, row_id: int):
+    row = db.execute(delete_returning_statement(model, row_id), execution_options=MUTATION_OPTIONS).scalar_one_or_none()
+    result = response_model.model_validate(row) if row else None
+    db.commit()
+    return result
 
 # Reservations
 def get_reservation(db: Session, reservation_id: int):
     return db.query(Reservation).filter(Reservation.id == reservation_id).first()
 
-def list_reservations(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(Reservation).offset(skip).limit(limit).all()
+def list_reservations(db: Session, skip: int = 0, limit: int = 10, cursor: str | None = None, filters: ReservationFilters | None = None):
+    return db.execute(reservations_query(filters, cursor, skip, limit)).scalars().all()
+
+def get_room_availability(db: Session, date: dt_date, time: dt_time, party_size: int | None = None):
+    booked = set(db.execute(booked_rooms_query(date, time)).scalars())
+    return room_availability(booked, party_size)
+
+def lock_and_check_slot(db: Session, room: str, date: dt_date, time: dt_time, exclude_id: int | None = None):
+    for day in slot_dates(date, time):
+        db.execute(booking_lock_statement(room, day))
+    if db.execute(booked_rooms_query(date, time, room, exclude_id).limit(1)).first():
+        db.rollback()
+        raise BookingConflict(f"{room} is already booked around {time.strftime('%H:%M')} on {date}")
 
 def create_reservation(db: Session, reservation: ReservationCreate):
+    """
+    Raises UnknownRoom for a room not in ROOMS and BookingConflict when the room
+    is already taken for an overlapping slot.
+    """
+    check_room(reservation.room)
     new_reservation = Reservation(**reservation.dict())
+    if new_reservation.status != "cancelled":
+        lock_and_check_slot(db, new_reservation.room, new_reservation.date, new_reservation.time)
     db.add(new_reservation)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise BookingConflict(f"{new_reservation.room} is already booked at that time") from e
     db.refresh(new_reservation)
     return new_reservation
 
 def delete_reservation(db: Session, reservation_id: int):
-    reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
-    if not reservation:
-        return None
-
-    db.delete(reservation)
-    db.commit()
-    return reservation
+    return delete_returning(db, Reservation, ReservationResponse, reservation_id)
 
 def update_reservation(db: Session, reservation_id: int, reservation: ReservationUpdate):
+    changes = changed_fields(reservation)
+    if "room" in changes:
+        check_room(changes["room"])
+    if not needs_slot_check(changes):
+        # cancellations and detail edits cannot create a conflict, one UPDATE ... RETURNING
+        return update_returning(db, Reservation, ReservationResponse, reservation_id, changes)
+
     existing_reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
     if not existing_reservation:
         return None
 
-    for key, value in reservation.dict(exclude_unset=True).items():
-        if value is not None:
-            setattr(existing_reservation, key, value)
+    for key, value in changes.items():
+        setattr(existing_reservation, key, value)
 
-    db.commit()
-    db.refresh(existing_reservation)
-    return existing_reservation
+    if existing_reservation.status != "cancelled":
+        lock_and_check_slot(
+            db, existing_reservation.room, existing_reservation.date, existing_reservation.time, reservation_id
+        )
+    # serialize from the updated object instead of refreshing it after the commit
+    result = ReservationResponse.model_validate(existing_reservation)
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise BookingConflict(f"{existing_reservation.room} is already booked at that time") from e
+    return result
+
+# Bulk reservations
+# Each bulk call runs in one transaction: one locking pass, one SELECT for the
+# existing bookings and one multi-row statement for the writes. Items that
+# conflict or are missing are reported per item and left out of the write. A
+# booking that races the locks trips the unique slot index instead, then the
+# write is rolled back and its items are reported as failed.
+def overlaps(a: datetime, b: datetime) -> bool:
+    return abs(a - b) < timedelta(minutes=SLOT_MINUTES)
+
+def find_conflicts(db: Session, slots: dict[int, tuple], exclude_ids: set[int] = frozenset()) -> dict[int, str]:
+    """`slots` maps item key (index or id) -> (room, date, time), returns key -> error."""
+    if not slots:
+        return {}
+    days = {
+        (room, day) for room, date, time in slots.values() for day in slot_dates(date, time)
+    }
+    # lock in a stable order so concurrent bulk calls cannot deadlock
+    for room, day in sorted(days):
+        db.execute(booking_lock_statement(room, day))
+    booked = db.execute(
+        select(Reservation.id, Reservation.room, Reservation.date, Reservation.time).where(
+            Reservation.date.in_({day for _, day in days}),
+            Reservation.status != "cancelled",
+            Reservation.id.notin_(exclude_ids),
+        )
+    ).all()
+    taken: dict[str, list[datetime]] = {}
+    for _, room, date, time in booked:
+        taken.setdefault(room, []).append(datetime.combine(date, time))
+
+    errors = {}
+    for index, (room, date, time) in slots.items():
+        start = datetime.combine(date, time)
+        starts = taken.setdefault(room, [])
+        if any(overlaps(start, other) for other in starts):
+            errors[index] = f"{room} is already booked around {time.strftime('%H:%M')} on {date}"
+        else:
+            starts.append(start)
+    return errors
+
+RACE_ERROR = "Conflicts with a booking made at the same time, try again"
+
+def bulk_create_reservations(db: Session, reservations: list[ReservationCreate]) -> list[dict]:
+    rows = [reservation.dict() for reservation in reservations]
+    errors = {i: f"Unknown room {row['room']!r}" for i, row in enumerate(rows) if row["room"] not in ROOMS}
+    errors.update(
+        find_conflicts(
+            db,
+            {
+                i: (row["room"], row["date"], row["time"])
+                for i, row in enumerate(rows)
+                if row["status"] != "cancelled" and i not in errors
+            },
+        )
+    )
+    accepted = [i for i in range(len(rows)) if i not in errors]
+    created = []
+    try:
+        if accepted:
+            created = db.execute(
+                sql_insert(Reservation).returning(Reservation, sort_by_parameter_order=True),
+                [rows[i] for i in accepted],
+            ).scalars().all()
+        # serialize before the commit expires the returned rows
+        created = [ReservationResponse.model_validate(reservation) for reservation in created]
+        db.commit()
+    except IntegrityError:
+        # the unique slot index caught a booking that raced the lock
+        db.rollback()
+        errors.update({i: RACE_ERROR for i in accepted})
+        accepted, created = [], []
+
+    results = [{"index": i, "success": False, "error": error} for i, error in errors.items()]
+    results += [
+        {"index": i, "id": reservation.id, "success": True, "reservation": reservation}
+        for i, reservation in zip(accepted, created)
+    ]
+    return sorted(results, key=lambda result: result["index"])
+
+def bulk_update_reservations(db: Session, items: list[ReservationBulkUpdate]) -> list[dict]:
+    ids = {item.id for item in items}
+    existing = {
+        reservation.id: reservation
+        for reservation in db.execute(select(Reservation).where(Reservation.id.in_(ids))).scalars()
+    }
+    errors, params, slots = {}, {}, {}
+    for i, item in enumerate(items):
+        reservation = existing.get(item.id)
+        if reservation is None:
+            errors[i] = "Reservation not found"
+            continue
+        changes = {key: value for key, value in item.changes.dict(exclude_unset=True).items() if value is not None}
+        if "room" in changes and changes["room"] not in ROOMS:
+            errors[i] = f"Unknown room {changes['room']!r}"
+            continue
+        params[i] = {"id": item.id, **changes}
+        merged = {key: changes.get(key, getattr(reservation, key)) for key in ("room", "date", "time", "status")}
+        if merged["status"] != "cancelled" and changes.keys() & merged.keys():
+            slots[i] = (merged["room"], merged["date"], merged["time"])
+    errors.update(find_conflicts(db, slots, exclude_ids={params[i]["id"] for i in slots}))
+
+    accepted = [i for i in params if i not in errors and len(params[i]) > 1]
+    try:
+        if accepted:
+            db.execute(update(Reservation), [params[i] for i in accepted])
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        errors.update({i: RACE_ERROR for i in accepted})
+    updated = {
+        reservation.id: reservation
+        for reservation in db.execute(
+            select(Reservation).where(Reservation.id.in_({params[i]["id"] for i in params}))
+        ).scalars()
+    }
+
+    return [
+        {"index": i, "id": item.id, "success": False, "error": errors[i]}
+        if i in errors
+        else {"index": i, "id": item.id, "success": True, "reservation": updated[item.id]}
+        for i, item in enumerate(items)
+    ]
+
+def bulk_set_reservation_status(db: Session, reservation_ids: list[int], status: str) -> list[dict]:
+    errors: dict[int, str] = {}
+    if status != "cancelled":
+        # reactivating a cancelled booking can collide with one made since
+        rows = db.execute(
+            select(Reservation.id, Reservation.room, Reservation.date, Reservation.time).where(
+                Reservation.id.in_(reservation_ids)
+            )
+        ).all()
+        slots = {row.id: (row.room, row.date, row.time) for row in rows}
+        errors = find_conflicts(db, slots, exclude_ids=set(slots))
+    accepted = [reservation_id for reservation_id in reservation_ids if reservation_id not in errors]
+    updated = {}
+    try:
+        if accepted:
+            updated = {
+                reservation.id: ReservationResponse.model_validate(reservation)
+                for reservation in db.execute(
+                    update(Reservation)
+                    .where(Reservation.id.in_(accepted))
+                    .values(status=status)
+                    .returning(Reservation),
+                    execution_options=MUTATION_OPTIONS,
+                ).scalars()
+            }
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        errors.update({reservation_id: RACE_ERROR for reservation_id in accepted})
+        updated = {}
+    return [
+        {"index": i, "id": reservation_id, "success": False, "error": errors[reservation_id]}
+        if reservation_id in errors
+        else {"index": i, "id": reservation_id, "success": True, "reservation": updated[reservation_id]}
+        if reservation_id in updated
+        else {"index": i, "id": reservation_id, "success": False, "error": "Reservation not found"}
+        for i, reservation_id in enumerate(reservation_ids)
+    ]
 
 # TextFiles
 def get_textfile(db: Session, textfile_id: int):
     return db.query(TextFile).filter(TextFile.id == textfile_id).first()
 
-def list_textfiles(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(TextFile).offset(skip).limit(limit).all()
+def get_textfile_by_job(db: Session, job_id: str):
+    return db.query(TextFile).filter(TextFile.job_id == job_id).first()
+
+def get_textfile_by_hash(db: Session, content_hash: str):
+    return (
+        db.query(TextFile)
+        .filter(TextFile.content_hash == content_hash, TextFile.status == "ready")
+        .order_by(TextFile.id.desc())
+        .first()
+    )
+
+def list_textfiles(db: Session, skip: int = 0, limit: int = 10, cursor: str | None = None, status: str | None = None):
+    stmt = select(TextFile)
+    if status:
+        stmt = stmt.where(TextFile.status == status)
+    return db.execute(paginate(stmt, TextFile, cursor, skip, limit)).scalars().all()
 
 def create_textfile(db: Session, textfile: TextFileCreate):
     new_textfile = TextFile(**textfile.dict())
@@ -52,23 +402,31 @@ def create_textfile(db: Session, textfile: TextFileCreate):
     return new_textfile
 
 def delete_textfile(db: Session, textfile_id: int):
-    textfile = db.query(TextFile).filter(TextFile.id == textfile_id).first()
-    if not textfile:
-        return None
-
-    db.delete(textfile)
-    db.commit()
-    return textfile
+    return delete_returning(db, TextFile, TextFileResponse, textfile_id)
 
 def update_textfile(db: Session, textfile_id: int, textfile: TextFileUpdate):
-    existing_textfile = db.query(TextFile).filter(TextFile.id == textfile_id).first()
-    if not existing_textfile:
-        return None
+    return update_returning(db, TextFile, TextFileResponse, textfile_id, changed_fields(textfile))
 
-    for key, value in textfile.dict(exclude_unset=True).items():
-        if value is not None:
-            setattr(existing_textfile, key, value)
+# Chunk embeddings
+def get_chunk_embeddings(db: Session, chunk_hashes: list[str], model: str) -> dict[str, list[float]]:
+    if not chunk_hashes:
+        return {}
+    rows = db.query(ChunkEmbedding.chunk_hash, ChunkEmbedding.vector).filter(
+        ChunkEmbedding.model == model, ChunkEmbedding.chunk_hash.in_(chunk_hashes)
+    )
+    return {chunk_hash: array("f", vector).tolist() for chunk_hash, vector in rows}
 
+def add_chunk_embeddings(db: Session, embeddings: dict[str, list[float]], model: str):
+    if not embeddings:
+        return
+    db.execute(
+        insert(ChunkEmbedding)
+        .values(
+            [
+                {"chunk_hash": chunk_hash, "model": model, "vector": array("f", vector).tobytes()}
+                for chunk_hash, vector in embeddings.items()
+            ]
+        )
+        .on_conflict_do_nothing()
+    )
     db.commit()
-    db.refresh(existing_textfile)
-    return existing_textfile
\ No newline at end of file
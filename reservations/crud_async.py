@@ -0,0 +1,99 @@
+from datetime import date as dt_date, time as dt_time
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Reservation, ReservationCreate, ReservationUpdate, ReservationFilters, ReservationResponse
+from crud import (
+    MUTATION_OPTIONS,
+    BookingConflict,
+    check_room,
+    booked_rooms_query,
+    booking_lock_statement,
+    slot_dates,
+    changed_fields,
+    delete_returning_statement,
+    needs_slot_check,
+    reservations_query,
+    room_availability,
+    update_returning_statement,
+)
+
+# Reservations
+async def get_reservation(db: AsyncSession, reservation_id: int):
+    return await db.get(Reservation, reservation_id)
+
+async def list_reservations(db: AsyncSession, skip: int = 0, limit: int = 10, cursor: str | None = None, filters: ReservationFilters | None = None):
+    result = await db.execute(reservations_query(filters, cursor, skip, limit))
+    return result.scalars().all()
+
+async def get_room_availability(db: AsyncSession, date: dt_date, time: dt_time, party_size: int | None = None):
+    booked = set((await db.execute(booked_rooms_query(date, time))).scalars())
+    return room_availability(booked, party_size)
+
+async def lock_and_check_slot(db: AsyncSession, room: str, date: dt_date, time: dt_time, exclude_id: int | None = None):
+    for day in slot_dates(date, time):
+        await db.execute(booking_lock_statement(room, day))
+    if (await db.execute(booked_rooms_query(date, time, room, exclude_id).limit(1))).first():
+        await db.rollback()
+        raise BookingConflict(f"{room} is already booked around {time.strftime('%H:%M')} on {date}")
+
+async def create_reservation(db: AsyncSession, reservation: ReservationCreate):
+    """
+    Raises UnknownRoom for a room not in ROOMS and BookingConflict when the room
+    is already taken for an overlapping slot.
+    """
+    check_room(reservation.room)
+    new_reservation = Reservation(**reservation.dict())
+    if new_reservation.status != "cancelled":
+        await lock_and_check_slot(db, new_reservation.room, new_reservation.date, new_reservation.time)
+    db.add(new_reservation)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise BookingConflict(f"{new_reservation.room} is already booked at that time") from e
+    await db.refresh(new_reservation)
+    return new_reservation
+
+async def delete_reservation(db: AsyncSession, reservation_id: int):
+    row = (
+        await db.execute(delete_returning_statement(Reservation, reservation_id), execution_options=MUTATION_OPTIONS)
+    ).scalar_one_or_none()
+    result = ReservationResponse.model_validate(row) if row else None
+    await db.commit()
+    return result
+
+async def update_reservation(db: AsyncSession, reservation_id: int, reservation: ReservationUpdate):
+    changes = changed_fields(reservation)
+    if "room" in changes:
+        check_room(changes["room"])
+    if not changes:
+        row = await db.get(Reservation, reservation_id)
+        return ReservationResponse.model_validate(row) if row else None
+    if not needs_slot_check(changes):
+        row = (
+            await db.execute(
+                update_returning_statement(Reservation, reservation_id, changes), execution_options=MUTATION_OPTIONS
+            )
+        ).scalar_one_or_none()
+        result = ReservationResponse.model_validate(row) if row else None
+        await db.commit()
+        return result
+
+    existing_reservation = await db.get(Reservation, reservation_id)
+    if not existing_reservation:
+        return None
+
+    for key, value in changes.items():
+        setattr(existing_reservation, key, value)
+
+    if existing_reservation.status != "cancelled":
+        await lock_and_check_slot(
+            db, existing_reservation.room, existing_reservation.date, existing_reservation.time, reservation_id
+        )
+    result = ReservationResponse.model_validate(existing_reservation)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise BookingConflict(f"{existing_reservation.room} is already booked at that time") from e
+    return result
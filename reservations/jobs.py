@@ -0,0 +1,82 @@
+import os
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+logger = logging.getLogger("api")
+
+
+class IngestionQueue:
+    """
+    Bounded in-process job queue drained by a pool of worker threads.
+
+    `handler(job_id, progress, **payload)` does the work; it reports progress by
+    calling `progress(stage, fraction)`. With `workers=0` jobs run inline in
+    `submit`, which keeps the upload path usable without background threads.
+    """
+
+    def __init__(self, handler: Callable, workers: int = 2, maxsize: int = 16, history: int = 1000):
+        self.handler = handler
+        self.workers = workers
+        self.history = history
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.jobs: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers - len(self._threads)):
+            thread = threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, textfile_id: int | None = None, job_id: str | None = None, **payload) -> str:
+        """Queue a job and return its id, raises queue.Full when the queue is at capacity."""
+        job_id = job_id or os.urandom(8).hex()
+        self._update(job_id, textfile_id=textfile_id, status="pending", stage="queued", progress=0.0, error=None)
+        job = (job_id, {"textfile_id": textfile_id, **payload})
+        if self.workers == 0:
+            self._run(*job)
+            return job_id
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.jobs.pop(job_id, None)
+            raise
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self.jobs.setdefault(job_id, {"job_id": job_id})
+            job.update(fields)
+            self.jobs.move_to_end(job_id)
+            while len(self.jobs) > self.history:
+                self.jobs.popitem(last=False)
+
+    def _run(self, job_id: str, payload: dict):
+        def progress(stage: str, fraction: float):
+            self._update(job_id, stage=stage, progress=round(fraction, 3))
+
+        self._update(job_id, status="processing", stage="started")
+        try:
+            self.handler(job_id, progress, **payload)
+            self._update(job_id, status="ready", stage="done", progress=1.0)
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e))
+
+    def _worker(self):
+        while True:
+            job_id, payload = self.queue.get()
+            try:
+                self._run(job_id, payload)
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,139 @@
+"""
+Load test for the reservation endpoints, to compare DB_MODE=sync and async.
+
+Start the API once per mode against the same database, e.g.
+
+    DB_MODE=sync uvicorn main:app --port 8000 --workers 2
+    DB_MODE=async uvicorn main:app --port 8001 --workers 2
+
+then run
+
+    python load_test.py http://localhost:8000 http://localhost:8001 [--concurrency 64] [--requests 2000]
+
+Every target gets the same request mix (listing, single reads and room
+availability, plus bookings with --writes) from `concurrency` clients, and
+throughput and latency percentiles are printed per endpoint. Bookings go to
+dates far in the future and are cancelled afterwards.
+"""
+import sys
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List
+
+import httpx
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run_target(base_url: str, concurrency: int, requests: int, writes: float, seed: int) -> Dict:
+    rng = random.Random(seed)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    created: List[int] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        listing = (await client.get("/reservations", params={"limit": 50})).json()
+        ids = [reservation["id"] for reservation in listing]
+        today = date.today()
+
+        def next_request():
+            roll = rng.random()
+            if roll < writes:
+                day = today + timedelta(days=rng.randint(3650, 7300))
+                return "book", "POST", "/reservations", {
+                    "json": {
+                        "name": "load test",
+                        "number": "0000000000",
+                        "people_count": 2,
+                        "date": day.isoformat(),
+                        "time": f"{rng.randint(10, 21):02d}:00:00",
+                        "room": "Small Room",
+                        "movie_id": None,
+                        "movie_name": None,
+                        "movie_desc": None,
+                        "movie_image": None,
+                        "snack_package": False,
+                        "status": "pending",
+                    }
+                }
+            roll = rng.random()
+            if roll < 0.4 or (roll < 0.7 and not ids):
+                return "list", "GET", "/reservations", {"params": {"limit": 10}}
+            if roll < 0.7:
+                return "get", "GET", f"/reservations/{rng.choice(ids)}", {}
+            day = today + timedelta(days=rng.randint(0, 30))
+            return "availability", "GET", "/rooms/availability", {
+                "params": {"date": day.isoformat(), "time": "19:00:00", "party_size": 2}
+            }
+
+        plan = [next_request() for _ in range(requests)]
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in plan:
+            queue.put_nowait(item)
+
+        async def worker():
+            while not queue.empty():
+                name, method, url, kwargs = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.HTTPError:
+                    errors[name] += 1
+                    continue
+                latencies[name].append(time.perf_counter() - start)
+                if name == "book" and response.status_code == 200:
+                    created.append(response.json()["id"])
+                elif response.status_code >= 500 or (name != "book" and response.status_code >= 400):
+                    errors[name] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        if created:
+            await client.post("/reservations/bulk/status", json={"ids": created, "status": "cancelled"})
+
+    return {"elapsed": elapsed, "latencies": latencies, "errors": errors}
+
+
+def report(base_url: str, result: Dict):
+    latencies, errors = result["latencies"], result["errors"]
+    total = sum(len(values) for values in latencies.values())
+    print(f"\n{base_url}: {total} requests in {result['elapsed']:.1f}s, {total / result['elapsed']:.0f} req/s")
+    print(f"{'endpoint':<13} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    rows = sorted(latencies.items()) + [("all", [v for values in latencies.values() for v in values])]
+    for name, values in rows:
+        failed = sum(errors.values()) if name == "all" else errors.get(name, 0)
+        print(
+            f"{name:<13} {len(values):>6} {percentile(values, 0.5) * 1000:>8.1f} "
+            f"{percentile(values, 0.95) * 1000:>8.1f} {percentile(values, 0.99) * 1000:>8.1f} {failed:>7}"
+        )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="load_test")
+    parser.add_argument("targets", nargs="+", help="base URLs, e.g. one per DB_MODE")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--writes", type=float, default=0.0, help="fraction of requests that book a room")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    for target in args.targets:
+        result = asyncio.run(run_target(target, args.concurrency, args.requests, args.writes, args.seed))
+        report(target, result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
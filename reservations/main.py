@@ -1,19 +1,32 @@
 import os
+import queue
 import logging
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile
+from datetime import date as dt_date, time as dt_time
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, File, Response, UploadFile
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import (
     ReservationCreate,
     ReservationUpdate,
     ReservationResponse,
+    ReservationFilters,
+    RoomAvailability,
+    ReservationBulkUpdate,
+    ReservationBulkStatus,
+    BulkItemResult,
     TextFileResponse,
     TextFileCreate,
     TextFileUpdate,
+    IngestionJobResponse,
     SessionLocal,
+    AsyncSessionLocal,
+    DB_MODE,
 )
 from starlette.middleware.cors import CORSMiddleware
 from vectors import DocumentProcessor
+from jobs import IngestionQueue
 import crud
+import crud_async
 logger = logging.getLogger("api")
 logger.setLevel(logging.INFO)
 
@@ -26,10 +39,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 doc = DocumentProcessor()
 
+
+def ingest_textfile(job_id: str, progress, textfile_id: int, file_path: str, namespace: str):
+    db = SessionLocal()
+    try:
+        crud.update_textfile(db, textfile_id, TextFileUpdate(status="processing"))
+        try:
+            overview = doc.process_file(file_path, namespace, progress, db=db)
+        except Exception:
+            crud.update_textfile(db, textfile_id, TextFileUpdate(status="failed"))
+            # the namespace is new for this upload, drop the partial index
+            doc.delete_namespace(namespace)
+            raise
+        logger.info(f"Processed file {file_path} with overview: \n {overview}\n")
+        crud.update_textfile(db, textfile_id, TextFileUpdate(overview=overview, status="ready"))
+        doc.invalidate_namespace(namespace)
+    finally:
+        db.close()
+
+
+ingestion = IngestionQueue(
+    ingest_textfile,
+    workers=int(os.getenv("INGEST_WORKERS", "2")),
+    maxsize=int(os.getenv("INGEST_QUEUE_SIZE", "16")),
+)
+ingestion.start()
+
 # Dependency to get the database session
 def get_db():
     db = SessionLocal()
@@ -39,38 +79,161 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# The cursor of the next page goes in a header so list responses keep their shape.
+# Listings fetch one row more than the limit, so the last page has no cursor
+# even when it is full.
+def next_page(response: Response, rows: list, limit: int) -> list:
+    if limit > 0 and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = crud.encode_cursor(rows[-1])
+    return rows
+
+
 # Endpoints
 
-@app.get("/reservations", response_model=list[ReservationResponse], tags=["reservations"])
-def list_reservations(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    reservations = crud.list_reservations(db, skip, limit)
-    return reservations
+reservations_router = APIRouter(tags=["reservations"])
 
+@reservations_router.get("/reservations", response_model=list[ReservationResponse])
+def list_reservations(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: str | None = None,
+    filters: ReservationFilters = Depends(),
+    db: Session = Depends(get_db),
+):
+    try:
+        reservations = crud.list_reservations(db, skip, limit + 1, cursor, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return next_page(response, reservations, limit)
 
-@app.post("/reservations", response_model=ReservationResponse, tags=["reservations"])
+
+@reservations_router.post("/reservations", response_model=ReservationResponse)
 def create_reservation(reservation: ReservationCreate, db: Session = Depends(get_db)):
-    new_reservation = crud.create_reservation(db, reservation)
+    try:
+        new_reservation = crud.create_reservation(db, reservation)
+    except crud.UnknownRoom as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except crud.BookingConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     return new_reservation
 
 
-@app.get("/reservations/{reservation_id}", response_model=ReservationResponse, tags=["reservations"])
+@reservations_router.get("/rooms/availability", response_model=list[RoomAvailability])
+def get_room_availability(date: dt_date, time: dt_time, party_size: int | None = None, db: Session = Depends(get_db)):
+    return crud.get_room_availability(db, date, time, party_size)
+
+
+@reservations_router.get("/reservations/{reservation_id}", response_model=ReservationResponse)
 def get_reservation(reservation_id: int, db: Session = Depends(get_db)):
     reservation = crud.get_reservation(db, reservation_id)
     if not reservation:
         raise HTTPException(status_code=404, detail="Reservation not found")
     return reservation
 
-@app.put("/reservations/{reservation_id}", response_model=ReservationResponse, tags=["reservations"])
+@reservations_router.put("/reservations/{reservation_id}", response_model=ReservationResponse)
 def update_reservation(
     reservation_id: int, reservation: ReservationUpdate, db: Session = Depends(get_db)
 ):
-    updated_reservation = crud.update_reservation(db, reservation_id, reservation)
+    try:
+        updated_reservation = crud.update_reservation(db, reservation_id, reservation)
+    except crud.UnknownRoom as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except crud.BookingConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     return updated_reservation
 
+
+# Async variants of the reservation endpoints, served when DB_MODE=async
+async_reservations_router = APIRouter(tags=["reservations"])
+
+@async_reservations_router.get("/reservations", response_model=list[ReservationResponse])
+async def list_reservations_async(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: str | None = None,
+    filters: ReservationFilters = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        reservations = await crud_async.list_reservations(db, skip, limit + 1, cursor, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return next_page(response, reservations, limit)
+
+
+@async_reservations_router.post("/reservations", response_model=ReservationResponse)
+async def create_reservation_async(reservation: ReservationCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        new_reservation = await crud_async.create_reservation(db, reservation)
+    except crud.UnknownRoom as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except crud.BookingConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return new_reservation
+
+
+@async_reservations_router.get("/rooms/availability", response_model=list[RoomAvailability])
+async def get_room_availability_async(date: dt_date, time: dt_time, party_size: int | None = None, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_room_availability(db, date, time, party_size)
+
+
+@async_reservations_router.get("/reservations/{reservation_id}", response_model=ReservationResponse)
+async def get_reservation_async(reservation_id: int, db: AsyncSession = Depends(get_async_db)):
+    reservation = await crud_async.get_reservation(db, reservation_id)
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return reservation
+
+@async_reservations_router.put("/reservations/{reservation_id}", response_model=ReservationResponse)
+async def update_reservation_async(
+    reservation_id: int, reservation: ReservationUpdate, db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        updated_reservation = await crud_async.update_reservation(db, reservation_id, reservation)
+    except crud.UnknownRoom as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except crud.BookingConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return updated_reservation
+
+
+app.include_router(async_reservations_router if DB_MODE == "async" else reservations_router)
+
+# Bulk endpoints run on the sync engine in both DB modes
+@app.post("/reservations/bulk", response_model=list[BulkItemResult], tags=["reservations"])
+def bulk_create_reservations(reservations: list[ReservationCreate], db: Session = Depends(get_db)):
+    return crud.bulk_create_reservations(db, reservations)
+
+@app.post("/reservations/bulk/update", response_model=list[BulkItemResult], tags=["reservations"])
+def bulk_update_reservations(items: list[ReservationBulkUpdate], db: Session = Depends(get_db)):
+    return crud.bulk_update_reservations(db, items)
+
+@app.post("/reservations/bulk/status", response_model=list[BulkItemResult], tags=["reservations"])
+def bulk_set_reservation_status(body: ReservationBulkStatus, db: Session = Depends(get_db)):
+    return crud.bulk_set_reservation_status(db, body.ids, body.status)
+
 @app.get("/textfiles", response_model=list[TextFileResponse], tags=["textfiles"])
-def list_textfiles(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    textfiles = crud.list_textfiles(db, skip, limit)
-    return textfiles
+def list_textfiles(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: str | None = None,
+    status: str | None = None,
+    db: Session = Depends(get_db),
+):
+    try:
+        textfiles = crud.list_textfiles(db, skip, limit + 1, cursor, status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return next_page(response, textfiles, limit)
 
 @app.post("/textfiles", response_model=TextFileResponse, tags=["textfiles"])
 def upload_textfile(name: str | None = None, file: UploadFile = File(...), db: Session = Depends(get_db)):
@@ -86,27 +249,63 @@ def upload_textfile(name: str | None = None, file: UploadFile = File(...), db: S
             detail=f"Unsupported file type. Allowed types are: {', '.join(allowed_extensions)}",
         )
     
+    file_path, content_hash = doc.save_upload(file, namespace)
+    existing = crud.get_textfile_by_hash(db, content_hash)
+    if existing:
+        # identical bytes were already ingested, reuse that namespace and overview
+        os.remove(file_path)
+        textfile = TextFileCreate(
+            file_name=file_name, name=name, namespace=existing.namespace, type=file_extension,
+            overview=existing.overview, status="ready", content_hash=content_hash,
+        )
+        file_obj = crud.create_textfile(db, textfile)
+        logger.info(f"Reused namespace {existing.namespace} of textfile {existing.id} for {file_name}")
+        return file_obj
+
+    job_id = os.urandom(8).hex()
     textfile = TextFileCreate(
-        file_name=file_name, name=name, namespace=namespace, type=file_extension
+        file_name=file_name, name=name, namespace=namespace, type=file_extension,
+        status="pending", job_id=job_id, content_hash=content_hash,
     )
     file_obj = crud.create_textfile(db, textfile)
     logger.info(f"Created textfile with id {file_obj.id}")
-    try :
-        overview = doc.process_file_upload(file, namespace)
-        logger.info(f"Processed file {file_name} with overview: \n {overview}\n")
-        updated_file = crud.update_textfile(db, file_obj.id, TextFileUpdate(overview=overview))
-        logger.info(f"Updated textfile with the overview")
-        return updated_file
-    except Exception as e:
+    try:
+        ingestion.submit(
+            textfile_id=file_obj.id, job_id=job_id, file_path=file_path, namespace=namespace
+        )
+    except queue.Full:
+        os.remove(file_path)
         crud.delete_textfile(db, file_obj.id)
-        logger.error(f"Failed to process file {file_name}: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, try again later")
+    logger.info(f"Queued ingestion job {job_id} for {file_name}")
+    db.refresh(file_obj)
+    return file_obj
+
+@app.get("/textfiles/jobs/{job_id}", response_model=IngestionJobResponse, tags=["textfiles"])
+def get_ingestion_job(job_id: str, db: Session = Depends(get_db)):
+    job = ingestion.get(job_id)
+    if job:
+        return job
+    # the job is no longer in memory (e.g. after a restart), fall back to the row
+    textfile = crud.get_textfile_by_job(db, job_id)
+    if not textfile:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return IngestionJobResponse(
+        job_id=job_id,
+        textfile_id=textfile.id,
+        status=textfile.status,
+        progress=1.0 if textfile.status == "ready" else 0.0,
+    )
 
 # get endpoint with query parameter
 @app.get("/textfiles/retrieve", response_model=str, tags=["textfiles"])
 async def retrieve_doc(query: str, namespace: str):
     return await doc.retrieve_docs(query, namespace)
 
+@app.get("/textfiles/retrieve/stats", tags=["textfiles"])
+def retrieve_cache_stats():
+    return doc.result_cache.stats()
+
 @app.get("/textfiles/{textfile_id}", response_model=TextFileResponse, tags=["textfiles"])
 def get_textfile(textfile_id: int, db: Session = Depends(get_db)):
     textfile = crud.get_textfile(db, textfile_id)
@@ -116,7 +315,14 @@ def get_textfile(textfile_id: int, db: Session = Depends(get_db)):
 def update_textfile(
     textfile_id: int, textfile: TextFileUpdate, db: Session = Depends(get_db)
 ):
+    if textfile.namespace:
+        # the old namespace is only known before the update
+        existing_textfile = crud.get_textfile(db, textfile_id)
+        if existing_textfile:
+            doc.invalidate_namespace(existing_textfile.namespace)
     updated_textfile = crud.update_textfile(db, textfile_id, textfile)
+    if updated_textfile:
+        doc.invalidate_namespace(updated_textfile.namespace)
     return updated_textfile
 
 
@@ -1,17 +1,38 @@
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, Integer, String, Date, Time, Text, DateTime, Sequence, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Date, Time, Text, DateTime, Sequence, Boolean, LargeBinary, Index, text
 from datetime import datetime, date as dt_date,time as dt_time
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from typing import Optional
 load_dotenv('.env')
 
 # Database setup
-DATABASE_URL = f"postgresql+psycopg2://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
-engine = create_engine(DATABASE_URL)
+DB_CREDENTIALS = f"{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
+# DATABASE_URL overrides the POSTGRES_* settings, e.g. sqlite:// for the tests
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql+psycopg2://{DB_CREDENTIALS}"
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or f"postgresql+asyncpg://{DB_CREDENTIALS}"
+# "sync" serves the reservation endpoints from the threadpool, "async" from asyncpg
+DB_MODE = os.getenv("DB_MODE", "sync")
+POOL_SETTINGS = dict(
+    pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    pool_pre_ping=True,
+)
+engine = create_engine(DATABASE_URL, **(POOL_SETTINGS if DATABASE_URL.startswith("postgresql") else {}))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if DB_MODE == "async":
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, **(POOL_SETTINGS if ASYNC_DATABASE_URL.startswith("postgresql") else {})
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
 Base = declarative_base()
 
 
@@ -34,6 +55,23 @@ class Reservation(Base):
     status = Column(String, nullable=False, default="pending")
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # keyset pagination is ordered by (created_at, id), the filtered listings
+    # lead with the filter column
+    __table_args__ = (
+        Index("ix_reservations_created_at_id", "created_at", "id"),
+        Index("ix_reservations_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_reservations_number_created_at_id", "number", "created_at", "id"),
+        Index("ix_reservations_room_date", "room", "date"),
+        Index("ix_reservations_date_time", "date", "time"),
+        # backstop against two active bookings of the same room and start time
+        Index(
+            "uq_reservations_room_slot", "room", "date", "time",
+            unique=True,
+            postgresql_where=text("status <> 'cancelled'"),
+            sqlite_where=text("status <> 'cancelled'"),
+        ),
+    )
+
 class TextFile(Base):
     __tablename__ = "text_files"
 
@@ -43,6 +81,24 @@ class TextFile(Base):
     namespace = Column(String, nullable=False)
     type = Column(String, nullable=False)
     overview = Column(Text, nullable=True)
+    # ingestion state: pending -> processing -> ready | failed
+    status = Column(String, nullable=False, default="ready", server_default="ready")
+    job_id = Column(String, nullable=True, index=True)
+    # sha256 of the uploaded bytes, identical re-uploads reuse the namespace
+    content_hash = Column(String, nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_text_files_created_at_id", "created_at", "id"),
+    )
+
+class ChunkEmbedding(Base):
+    __tablename__ = "chunk_embeddings"
+
+    # sha256 of the chunk text, so unchanged chunks of a re-upload skip embedding
+    chunk_hash = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    vector = Column(LargeBinary, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 # Create the table
@@ -70,6 +126,21 @@ class TextFileBase(BaseModel):
     namespace: str
     type: str
     overview: str | None = None
+    status: str = "ready"
+    job_id: str | None = None
+    content_hash: str | None = None
+
+class ReservationFilters(BaseModel):
+    date_from: Optional[dt_date] = None
+    date_to: Optional[dt_date] = None
+    status: Optional[str] = None
+    room: Optional[str] = None
+    number: Optional[str] = None
+
+class RoomAvailability(BaseModel):
+    room: str
+    capacity: int
+    available: bool
 
 class ReservationCreate(ReservationBase):
     pass
@@ -91,12 +162,21 @@ class ReservationUpdate(BaseModel):
     snack_package: Optional[bool] = None
     status: Optional[str] = None
 
+class ReservationBulkUpdate(BaseModel):
+    id: int
+    changes: ReservationUpdate
+
+class ReservationBulkStatus(BaseModel):
+    ids: list[int]
+    status: str
+
 class TextFileUpdate(BaseModel):
     file_name: Optional[str] = None
     name: Optional[str] = None
     namespace: Optional[str] = None
     type: Optional[str] = None
     overview: Optional[str] = None
+    status: Optional[str] = None
 
 class ReservationResponse(ReservationBase):
     id: int
@@ -106,9 +186,26 @@ class ReservationResponse(ReservationBase):
         from_attributes = True
 
 
+class BulkItemResult(BaseModel):
+    index: int
+    id: int | None = None
+    success: bool
+    error: str | None = None
+    reservation: ReservationResponse | None = None
+
+
 class TextFileResponse(TextFileBase):
     id: int
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    textfile_id: int | None = None
+    status: str
+    stage: str | None = None
+    progress: float = 0.0
+    error: str | None = None
\ No newline at end of file
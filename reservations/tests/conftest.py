@@ -0,0 +1,12 @@
+import os
+import tempfile
+
+# models builds its engine at import; the tests run against a throwaway
+# SQLite file unless TEST_DATABASE_URL points at a Postgres
+os.environ["DATABASE_URL"] = os.getenv(
+    "TEST_DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='reservations_')}/test.db"
+)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("INGEST_WORKERS", "0")
+os.environ.setdefault("LOCAL_INDEX_DIR", tempfile.mkdtemp(prefix="local_index_"))
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import text
+
+import crud
+from models import DATABASE_URL, Reservation, ReservationCreate, SessionLocal
+from test_reservations import reservation
+
+
+@pytest.fixture
+def db(monkeypatch):
+    if not DATABASE_URL.startswith("postgresql"):
+        # SQLite has no advisory locks and a single writer anyway
+        monkeypatch.setattr(crud, "booking_lock_statement", lambda room, date: text("SELECT 1"))
+    db = SessionLocal()
+    yield db
+    db.rollback()
+    db.query(Reservation).delete()
+    db.commit()
+    db.close()
+
+
+def create(**fields):
+    return ReservationCreate(**reservation(**fields))
+
+
+def test_bulk_create_reports_unknown_rooms_and_conflicts(db):
+    results = crud.bulk_create_reservations(
+        db,
+        [
+            create(time="18:00:00"),
+            create(room="Huge Room"),
+            create(time="19:00:00"),
+            create(room="Large Room"),
+        ],
+    )
+    assert [result["success"] for result in results] == [True, False, False, True]
+    assert "Unknown room" in results[1]["error"]
+    assert "already booked" in results[2]["error"]
+
+
+def test_bulk_create_survives_a_racing_booking(db, monkeypatch):
+    # a booking that slipped past the locks only shows up as an IntegrityError
+    monkeypatch.setattr(crud, "find_conflicts", lambda db, slots, exclude_ids=frozenset(): {})
+    results = crud.bulk_create_reservations(db, [create(), create(name="Grace")])
+    assert [result["success"] for result in results] == [False, False]
+    assert all(result["error"] == crud.RACE_ERROR for result in results)
+    assert db.query(Reservation).count() == 0
+
+
+def test_bulk_status_checks_reactivated_bookings_for_conflicts(db):
+    cancelled, active, other = crud.bulk_create_reservations(
+        db,
+        [create(status="cancelled"), create(name="Grace"), create(room="Medium Room", status="cancelled")],
+    )
+    results = crud.bulk_set_reservation_status(db, [cancelled["id"], other["id"], 999_999], "confirmed")
+
+    assert results[0]["success"] is False and "already booked" in results[0]["error"]
+    assert results[1]["success"] is True and results[1]["reservation"].status == "confirmed"
+    assert results[2] == {"index": 2, "id": 999_999, "success": False, "error": "Reservation not found"}
+    assert db.get(Reservation, cancelled["id"]).status == "cancelled"
+
+
+def test_bulk_status_cancels_without_locking(db, monkeypatch):
+    first, second = crud.bulk_create_reservations(db, [create(), create(time="22:00:00")])
+    monkeypatch.setattr(crud, "find_conflicts", lambda *args, **kwargs: pytest.fail("cancel needs no check"))
+    results = crud.bulk_set_reservation_status(db, [first["id"], second["id"]], "cancelled")
+    assert all(result["success"] for result in results)
+    assert db.query(Reservation).filter(Reservation.status == "cancelled").count() == 2
+
+
+def test_bulk_create_finds_conflicts_across_midnight(db):
+    crud.create_reservation(db, create(date="2031-05-01", time="22:00:00"))
+    results = crud.bulk_create_reservations(
+        db,
+        [create(date="2031-05-02", time="00:30:00"), create(date="2031-05-02", time="01:00:00")],
+    )
+    assert [result["success"] for result in results] == [False, True]
+    assert "already booked" in results[0]["error"]
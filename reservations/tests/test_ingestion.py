@@ -0,0 +1,296 @@
+import os
+import time
+import threading
+
+import httpx
+import pytest
+from openai import RateLimitError
+from langchain_core.documents import Document
+
+import main
+from models import TextFileCreate
+import crud
+
+
+class PagesLoader:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def lazy_load(self):
+        for number, text in enumerate(self.pages):
+            yield Document(page_content=text, metadata={"page": number})
+
+
+@pytest.fixture
+def doc(monkeypatch, tmp_path):
+    doc = main.doc
+    pages = [f"Page {i} " + "lorem ipsum dolor sit amet " * 60 for i in range(40)]
+    monkeypatch.setattr(doc, "batch_size", 4)
+    monkeypatch.setattr(doc, "embed_concurrency", 1)
+    monkeypatch.setattr(doc, "get_loader", lambda path: PagesLoader(pages))
+    monkeypatch.setattr(doc, "page_count", lambda path: len(pages))
+    monkeypatch.setattr(doc, "embed_batch", lambda texts: [[1.0, float(len(t)), 0.5] for t in texts])
+    monkeypatch.setattr(doc, "document_overview", lambda documents: "overview")
+    return doc
+
+
+def _upload(tmp_path):
+    path = tmp_path / "temp_upload.pdf"
+    path.write_bytes(b"%PDF")
+    return str(path)
+
+
+def test_progress_follows_pages_parsed(doc, tmp_path):
+    reports = []
+    overview = doc.process_file(_upload(tmp_path), "progress-ns", lambda *args: reports.append(args))
+
+    assert overview == "overview"
+    fractions = [fraction for stage, fraction in reports if stage.startswith("embedding")]
+    assert len(set(fractions)) > 2
+    assert fractions == sorted(fractions)
+    assert 0.1 < fractions[0] and fractions[-1] == pytest.approx(0.8)
+    assert reports[-1] == ("summarizing", 0.8)
+
+
+def test_failed_job_deletes_its_namespace(doc, monkeypatch, tmp_path):
+    index = doc.vectorstore.index
+    upsert_batch = doc.upsert_batch
+    calls = []
+
+    def failing_upsert(documents, vectors, namespace):
+        calls.append(namespace)
+        if len(calls) == 3:
+            raise RuntimeError("upsert failed")
+        return upsert_batch(documents, vectors, namespace)
+
+    monkeypatch.setattr(doc, "upsert_batch", failing_upsert)
+    db = main.SessionLocal()
+    textfile = crud.create_textfile(
+        db,
+        TextFileCreate(file_name="a.pdf", name="a", namespace="failed-ns", type=".pdf", status="pending"),
+    )
+
+    with pytest.raises(Exception):
+        main.ingest_textfile("job", lambda *args: None, textfile.id, _upload(tmp_path), "failed-ns")
+
+    assert len(calls) >= 3
+    assert index.count("failed-ns") == 0
+    db.close()
+    db = main.SessionLocal()
+    assert crud.get_textfile(db, textfile.id).status == "failed"
+    db.close()
+
+
+def test_first_batch_is_embedded_before_the_last_page_is_read(doc, monkeypatch, tmp_path):
+    pages_read = []
+
+    class ManyPagesLoader:
+        def lazy_load(self):
+            for number in range(500):
+                pages_read.append(number)
+                yield Document(page_content=f"Page {number} " + "lorem ipsum " * 150, metadata={"page": number})
+
+        def load(self):
+            raise AssertionError("the whole document was loaded at once")
+
+    monkeypatch.setattr(doc, "get_loader", lambda path: ManyPagesLoader())
+    monkeypatch.setattr(doc, "page_count", lambda path: 500)
+
+    first = next(doc.iter_batches("big.pdf"))
+    assert len(first) == doc.batch_size
+    assert len(pages_read) < 5
+
+    pages_read.clear()
+    read_at_embed = []
+    embed_batch = doc.embed_batch
+    monkeypatch.setattr(doc, "embed_batch", lambda texts: read_at_embed.append(len(pages_read)) or embed_batch(texts))
+    doc.process_file(_upload(tmp_path), "streaming-ns")
+    assert read_at_embed[0] < 5 and len(pages_read) == 500
+
+
+def test_pinecone_writes_go_through_our_index_handle(doc, monkeypatch):
+    class StubIndex:
+        def __init__(self):
+            self.calls = []
+
+        def upsert(self, vectors, namespace):
+            self.calls.append(("upsert", namespace, vectors))
+
+        def delete(self, delete_all, namespace):
+            self.calls.append(("delete", namespace, delete_all))
+
+    index = StubIndex()
+    monkeypatch.setattr(doc, "vectorstore", object())
+    monkeypatch.setattr(doc, "pinecone_index", index, raising=False)
+    monkeypatch.setattr(doc, "text_key", "body", raising=False)
+
+    ids = doc.upsert_batch([Document(page_content="Parking is free.", metadata={"page": 1})], [[0.5, 0.5]], "ns")
+    doc.delete_namespace("ns")
+
+    (_, namespace, vectors), delete = index.calls
+    assert namespace == "ns" and vectors == [(ids[0], [0.5, 0.5], {"page": 1, "body": "Parking is free."})]
+    assert delete == ("delete", "ns", True)
+
+
+def _batches(count, size=2):
+    return [
+        [Document(page_content=f"batch {b} chunk {c}", metadata={"page": b}) for c in range(size)]
+        for b in range(count)
+    ]
+
+
+def test_embed_calls_run_up_to_the_concurrency_limit(doc, monkeypatch):
+    monkeypatch.setattr(doc, "embed_concurrency", 3)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def embed_batch(texts):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+    monkeypatch.setattr(doc, "embed_batch", embed_batch)
+    ids = doc.index_batches(_batches(12), "concurrency-ns")
+    assert len(ids) == 24
+    assert max(peak) == 3
+
+
+def test_rate_limited_embeddings_back_off_and_retry(doc, monkeypatch):
+    import vectors
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    attempts = []
+    sleeps = []
+
+    class FlakyEmbeddings:
+        def embed_documents(self, texts):
+            attempts.append(len(texts))
+            if len(attempts) <= 2:
+                raise RateLimitError("slow down", response=httpx.Response(429, request=request), body=None)
+            return [[1.0] for _ in texts]
+
+    monkeypatch.setattr(doc, "embed_batch", vectors.DocumentProcessor.embed_batch.__get__(doc))
+    monkeypatch.setattr(doc, "embeddings", FlakyEmbeddings())
+    monkeypatch.setattr(vectors.time, "sleep", sleeps.append)
+
+    assert doc.embed_batch(["a", "b"]) == [[1.0], [1.0]]
+    assert len(attempts) == 3
+    # exponential backoff with jitter: 1-2s, then 2-4s
+    assert 1 <= sleeps[0] <= 2 and 2 <= sleeps[1] <= 4
+
+    attempts.clear()
+    monkeypatch.setattr(doc, "embed_retries", 2)
+    with pytest.raises(RateLimitError):
+        doc.embed_batch(["a"])
+    assert len(attempts) == 2
+
+
+def test_upserts_overlap_with_embedding(doc, monkeypatch):
+    monkeypatch.setattr(doc, "embed_concurrency", 2)
+    events = []
+    lock = threading.Lock()
+
+    def log(event):
+        with lock:
+            events.append(event)
+
+    def embed_batch(texts):
+        time.sleep(0.05)
+        log(("embedded", texts[0]))
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+    upsert_batch = doc.upsert_batch
+
+    def logged_upsert(documents, vectors, namespace):
+        log(("upsert", documents[0].page_content))
+        return upsert_batch(documents, vectors, namespace)
+
+    monkeypatch.setattr(doc, "embed_batch", embed_batch)
+    monkeypatch.setattr(doc, "upsert_batch", logged_upsert)
+    doc.index_batches(_batches(6), "overlap-ns")
+
+    first_upsert = events.index(("upsert", "batch 0 chunk 0"))
+    last_embed = events.index(("embedded", "batch 5 chunk 0"))
+    assert first_upsert < last_embed
+
+
+def _counting_embedder(doc, monkeypatch):
+    embedded = []
+    embed_batch = doc.embed_batch
+
+    def counting(texts):
+        embedded.extend(texts)
+        return embed_batch(texts)
+
+    monkeypatch.setattr(doc, "embed_batch", counting)
+    return embedded
+
+
+def test_same_file_uploaded_twice_reuses_the_first_ingestion(doc, monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.chdir(tmp_path)
+    embedded = _counting_embedder(doc, monkeypatch)
+    client = TestClient(main.app)
+    content = b"%PDF same bytes " + os.urandom(8).hex().encode()
+
+    first = client.post("/textfiles", params={"name": "first"}, files={"file": ("first.pdf", content)}).json()
+    assert first["status"] == "ready"
+    embedded_once = len(embedded)
+    assert embedded_once > 0
+
+    second = client.post("/textfiles", params={"name": "second"}, files={"file": ("second.pdf", content)}).json()
+    assert second["status"] == "ready"
+    assert second["namespace"] == first["namespace"]
+    assert second["overview"] == first["overview"]
+    assert second["job_id"] is None
+    assert len(embedded) == embedded_once
+    # nothing of the second upload is left behind
+    assert not list(tmp_path.glob("temp_*"))
+
+
+def test_changed_file_embeds_only_its_new_chunks(doc, monkeypatch, tmp_path):
+    marker = os.urandom(8).hex()
+    pages = [f"Page {i} {marker} " + "lorem ipsum dolor sit amet " * 60 for i in range(12)]
+    monkeypatch.setattr(doc, "get_loader", lambda path: PagesLoader(pages))
+    embedded = _counting_embedder(doc, monkeypatch)
+    db = main.SessionLocal()
+    try:
+        doc.process_file(_upload(tmp_path), f"v1-{marker}", db=db)
+        first_texts = set(embedded)
+        embedded.clear()
+
+        pages[3] = f"Page 3 {marker} rewritten " + "consectetur adipiscing elit " * 60
+        doc.process_file(_upload(tmp_path), f"v2-{marker}", db=db)
+    finally:
+        db.close()
+
+    assert embedded and all("consectetur" in text for text in embedded)
+    assert not set(embedded) & first_texts
+    # the new namespace still holds every chunk of the changed file
+    chunks = [document for batch in doc.iter_batches("changed.pdf") for document in batch]
+    assert doc.vectorstore.index.count(f"v2-{marker}") == len(chunks)
+
+
+def test_chunk_embeddings_are_stored_once_per_hash_and_model():
+    from models import ChunkEmbedding
+
+    chunk_hash = os.urandom(16).hex()
+    db = main.SessionLocal()
+    try:
+        crud.add_chunk_embeddings(db, {chunk_hash: [1.0, 2.0]}, "model-a")
+        # a second writer racing on the same chunk keeps the first vector
+        crud.add_chunk_embeddings(db, {chunk_hash: [3.0, 4.0]}, "model-a")
+        crud.add_chunk_embeddings(db, {chunk_hash: [5.0, 6.0]}, "model-b")
+
+        rows = db.query(ChunkEmbedding).filter(ChunkEmbedding.chunk_hash == chunk_hash).count()
+        assert rows == 2
+        assert crud.get_chunk_embeddings(db, [chunk_hash], "model-a") == {chunk_hash: [1.0, 2.0]}
+        assert crud.get_chunk_embeddings(db, [chunk_hash], "model-b") == {chunk_hash: [5.0, 6.0]}
+    finally:
+        db.close()
@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import date, datetime, time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import crud
+import main
+from models import Reservation, SessionLocal
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.query(Reservation).delete()
+    db.commit()
+    db.close()
+
+
+def seed(db, count, **fields):
+    # created_at repeats every three rows, so pages have to break ties by id
+    rows = [
+        Reservation(
+            name=f"guest {i}",
+            number=fields.get("number", "5550100"),
+            people_count=2,
+            date=fields.get("date", date(2031, 5, 1 + i % 20)),
+            time=time(10 + i % 12, 0),
+            room=fields.get("room", list(crud.ROOMS)[i % 3]),
+            status=fields.get("status", "cancelled"),
+            snack_package=False,
+            created_at=datetime(2030, 1, 1, 12, 0, i // 3),
+        )
+        for i in range(count)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in rows]
+
+
+def pages(client, limit, **params):
+    ids, cursors, cursor = [], [], None
+    while True:
+        response = client.get("/reservations", params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids.extend(row["id"] for row in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        cursors.append(cursor)
+        if cursor is None:
+            return ids, cursors
+
+
+def test_pages_cover_every_row_once_in_order_despite_ties(client, db):
+    seed(db, 25)
+    expected = [
+        row.id
+        for row in db.query(Reservation).order_by(Reservation.created_at.desc(), Reservation.id.desc())
+    ]
+    for limit in (1, 4, 5, 7):
+        ids, _ = pages(client, limit)
+        assert ids == expected
+
+
+def test_last_page_has_no_cursor(client, db):
+    seed(db, 10)
+    # 10 rows in pages of 5: the second page is full and still the last one
+    ids, cursors = pages(client, 5)
+    assert len(ids) == 10 and len(cursors) == 2 and cursors[-1] is None
+    response = client.get("/reservations", params={"limit": 20})
+    assert len(response.json()) == 10 and "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.parametrize(
+    "params, fields",
+    [
+        ({"status": "pending"}, {"status": "pending", "room": "Large Room", "date": date(2031, 7, 1)}),
+        ({"room": "Medium Room"}, {"room": "Medium Room", "date": date(2031, 7, 2)}),
+        ({"number": "5550199"}, {"number": "5550199"}),
+        ({"date_from": "2031-08-01"}, {"date": date(2031, 8, 1)}),
+        ({"date_to": "2031-04-30"}, {"date": date(2031, 4, 30)}),
+    ],
+)
+def test_each_filter_narrows_the_listing(client, db, params, fields):
+    seed(db, 12, room="Small Room")
+    wanted = seed(db, 3, **fields)
+    ids, _ = pages(client, 2, **params)
+    assert sorted(ids) == sorted(wanted)
+
+
+def _cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor",
+        "e30=",  # {}
+        _cursor(["2030-01-01T12:00:00", "abc"]),
+        _cursor(["yesterday", 5]),
+        _cursor(["2030-01-01T12:00:00", 5, 6]),
+        _cursor(["2030-01-01T12:00:00+02:00", 5]),
+        _cursor(["2030-01-01T12:00:00", 10 ** 30]),
+        _cursor(None),
+        "%%%",
+    ],
+)
+def test_malformed_or_tampered_cursor_is_a_bad_request(client, db, cursor):
+    seed(db, 3)
+    for path in ("/reservations", "/textfiles"):
+        response = client.get(path, params={"cursor": cursor})
+        assert response.status_code == 400, (path, cursor, response.text)
@@ -0,0 +1,129 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import crud
+import main
+from models import DATABASE_URL, Reservation, ReservationCreate, SessionLocal
+
+postgres_only = pytest.mark.skipif(
+    not DATABASE_URL.startswith("postgresql"),
+    reason="advisory locks need Postgres, set TEST_DATABASE_URL",
+)
+
+
+def reservation(**fields) -> dict:
+    return {
+        "name": "Ada",
+        "number": "5550100",
+        "people_count": 2,
+        "date": "2031-05-01",
+        "time": "19:00:00",
+        "room": "Small Room",
+        "movie_id": None,
+        "movie_name": None,
+        "movie_desc": None,
+        "movie_image": None,
+        "snack_package": False,
+        "status": "pending",
+        **fields,
+    }
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.query(Reservation).delete()
+    db.commit()
+    db.close()
+
+
+def test_unknown_room_is_rejected_on_create(client, db):
+    response = client.post("/reservations", json=reservation(room="I'm sorry, all rooms are booked"))
+    assert response.status_code == 400
+    assert "Unknown room" in response.json()["detail"]
+    assert db.query(Reservation).count() == 0
+
+
+def test_unknown_room_is_rejected_on_update(client, db):
+    existing = crud.create_reservation(db, ReservationCreate(**reservation(status="cancelled")))
+    response = client.put(f"/reservations/{existing.id}", json={"room": "Huge Room"})
+    assert response.status_code == 400
+    db.expire_all()
+    assert db.get(Reservation, existing.id).room == "Small Room"
+
+
+@postgres_only
+def test_simultaneous_bookings_of_one_slot(db):
+    attempts = 300
+
+    def book(i: int) -> str:
+        session = SessionLocal()
+        try:
+            crud.create_reservation(session, ReservationCreate(**reservation(name=f"guest {i}")))
+            return "booked"
+        except crud.BookingConflict:
+            return "conflict"
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=int(os.getenv("TEST_BOOKING_THREADS", "24"))) as pool:
+        outcomes = list(pool.map(book, range(attempts)))
+
+    assert outcomes.count("booked") == 1
+    assert outcomes.count("conflict") == attempts - 1
+    active = db.query(Reservation).filter(
+        Reservation.room == "Small Room",
+        Reservation.date == date(2031, 5, 1),
+        Reservation.time == time(19, 0),
+        Reservation.status != "cancelled",
+    )
+    assert active.count() == 1
+
+
+@pytest.fixture
+def locks(monkeypatch):
+    taken = []
+    booking_lock_statement = crud.booking_lock_statement
+
+    def record(room, day):
+        taken.append((room, day))
+        if DATABASE_URL.startswith("postgresql"):
+            return booking_lock_statement(room, day)
+        return text("SELECT 1")
+
+    monkeypatch.setattr(crud, "booking_lock_statement", record)
+    return taken
+
+
+def test_bookings_across_midnight_conflict(db, locks):
+    crud.create_reservation(db, ReservationCreate(**reservation(date="2031-05-01", time="22:00:00")))
+    with pytest.raises(crud.BookingConflict):
+        crud.create_reservation(db, ReservationCreate(**reservation(date="2031-05-02", time="00:30:00")))
+    # the late booking locked both days it touches
+    assert locks[0:2] == [("Small Room", date(2031, 5, 1)), ("Small Room", date(2031, 5, 2))]
+
+    rooms = crud.get_room_availability(db, date(2031, 5, 2), time(0, 30))
+    assert {room["room"]: room["available"] for room in rooms}["Small Room"] is False
+
+
+def test_early_booking_conflicts_with_the_evening_before(db, locks):
+    crud.create_reservation(db, ReservationCreate(**reservation(date="2031-05-02", time="00:30:00")))
+    with pytest.raises(crud.BookingConflict):
+        crud.create_reservation(db, ReservationCreate(**reservation(date="2031-05-01", time="22:00:00")))
+
+
+def test_a_full_slot_apart_across_midnight_is_free(db, locks):
+    crud.create_reservation(db, ReservationCreate(**reservation(date="2031-05-01", time="22:00:00")))
+    crud.create_reservation(db, ReservationCreate(**reservation(date="2031-05-02", time="01:00:00")))
+    assert db.query(Reservation).count() == 2
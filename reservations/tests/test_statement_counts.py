@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import crud
+from models import Base, Reservation, ReservationCreate, ReservationUpdate, TextFile, TextFileUpdate
+from test_reservations import reservation
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    db.statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        db.statements.append(" ".join(statement.split()))
+
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def add(db, model, **fields):
+    row = model(**fields)
+    db.add(row)
+    db.commit()
+    row_id = row.id
+    db.expunge_all()
+    db.statements.clear()
+    return row_id
+
+
+def test_cancel_is_one_update_returning(db):
+    reservation_id = add(db, Reservation, **ReservationCreate(**reservation()).dict())
+    result = crud.update_reservation(db, reservation_id, ReservationUpdate(status="cancelled"))
+
+    assert result.status == "cancelled"
+    assert len(db.statements) == 1
+    assert db.statements[0].startswith("UPDATE reservations SET status=?")
+    assert "RETURNING" in db.statements[0]
+
+
+def test_delete_is_one_delete_returning(db):
+    reservation_id = add(db, Reservation, **ReservationCreate(**reservation()).dict())
+    result = crud.delete_reservation(db, reservation_id)
+
+    assert result.id == reservation_id
+    assert len(db.statements) == 1
+    assert db.statements[0].startswith("DELETE FROM reservations")
+    assert "RETURNING" in db.statements[0]
+
+
+def test_missing_rows_cost_one_statement(db):
+    assert crud.update_reservation(db, 12345, ReservationUpdate(status="cancelled")) is None
+    assert crud.delete_reservation(db, 12345) is None
+    assert len(db.statements) == 2
+
+
+def test_textfile_update_and_delete_are_single_statements(db):
+    textfile_id = add(db, TextFile, file_name="a.pdf", name="a", namespace="ns", type=".pdf")
+    assert crud.update_textfile(db, textfile_id, TextFileUpdate(status="failed")).status == "failed"
+    assert crud.delete_textfile(db, textfile_id).id == textfile_id
+    assert [statement.split()[0] for statement in db.statements] == ["UPDATE", "DELETE"]
+    assert all("RETURNING" in statement for statement in db.statements)
@@ -1,7 +1,15 @@
 import os
+import time
+import uuid
+import random
 import logging
-import shutil
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from openai import RateLimitError
 from fastapi import HTTPException, UploadFile
+from pinecone import Pinecone
 from langchain_pinecone import PineconeVectorStore
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -11,12 +19,85 @@ from langchain_community.document_loaders import (
     UnstructuredHTMLLoader,
 )
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import PromptTemplate
+from langchain_core.vectorstores import VectorStore
 
-from typing import List
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
 from sqlalchemy.orm import Session
+from cache import TTLCache, normalize_text
+from local_index import LocalIndex
+import crud
 
 logger = logging.getLogger("api")
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain wrapper around LocalIndex, used in place of PineconeVectorStore."""
+
+    def __init__(self, embedding: Embeddings, index: LocalIndex):
+        self.embedding = embedding
+        self.index = index
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        namespace: Optional[str] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas, ids, namespace)
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        vectors: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        namespace: Optional[str] = None,
+    ) -> List[str]:
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = [{**metadata, "text": text} for metadata, text in zip(metadatas, texts)]
+        return self.index.add(namespace, vectors, metadatas, ids)
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, namespace: Optional[str] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        vector = self.embedding.embed_query(query)
+        results = []
+        for match in self.index.query(namespace, vector, k):
+            metadata = dict(match["metadata"])
+            text = metadata.pop("text", "")
+            results.append((Document(id=match["id"], page_content=text, metadata=metadata), match["score"]))
+        return results
+
+    def similarity_search(
+        self, query: str, k: int = 4, namespace: Optional[str] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, namespace)]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        namespace: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding, LocalIndex(kwargs.pop("root", "local_index"), **kwargs))
+        store.add_texts(texts, metadatas, namespace=namespace)
+        return store
+
+
 class DocumentProcessor:
     def __init__(self):
         self.index_name = os.getenv("PINECONE_INDEX_NAME")
@@ -24,30 +105,178 @@ class DocumentProcessor:
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.top_k = 4
         self.llm = ChatOpenAI(api_key=self.openai_api_key, model="gpt-4o-mini")
+        self.embedding_model = "text-embedding-3-small"
         self.embeddings = OpenAIEmbeddings(
-            api_key=self.openai_api_key, model="text-embedding-3-small"
-        )
-        self.vectorstore = PineconeVectorStore(
-            index_name=self.index_name,
-            embedding=self.embeddings,
-            pinecone_api_key=self.pinecone_api_key,
+            api_key=self.openai_api_key, model=self.embedding_model
         )
+        # "pinecone" or "local"; the agent reads the same LOCAL_INDEX_DIR
+        if os.getenv("VECTOR_STORE", "pinecone") == "local":
+            self.vectorstore = LocalVectorStore(
+                self.embeddings,
+                LocalIndex(
+                    os.getenv("LOCAL_INDEX_DIR", "local_index"),
+                    dtype=os.getenv("LOCAL_INDEX_DTYPE", "float32"),
+                    ivf_threshold=int(os.getenv("LOCAL_INDEX_IVF_THRESHOLD", "20000")),
+                    nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", "8")),
+                ),
+            )
+        else:
+            # our own index handle, the raw upserts and deletes below go
+            # through it rather than the vector store's private attributes
+            self.text_key = os.getenv("PINECONE_TEXT_KEY", "text")
+            self.pinecone_index = Pinecone(api_key=self.pinecone_api_key).Index(self.index_name)
+            self.vectorstore = PineconeVectorStore(
+                index=self.pinecone_index,
+                embedding=self.embeddings,
+                text_key=self.text_key,
+            )
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000, chunk_overlap=200, add_start_index=True
         )
+        self.batch_size = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+        self.embed_concurrency = int(os.getenv("EMBED_CONCURRENCY", "4"))
+        self.embed_retries = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+        self.result_cache = TTLCache(
+            maxsize=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+            maxweight=int(os.getenv("RESULT_CACHE_MAX_CHARS", "8000000")),
+        )
 
-    def load_and_split_document(self, file_path: str) -> List[Document]:
+    def get_loader(self, file_path: str):
         if file_path.endswith(".pdf"):
-            loader = PyPDFLoader(file_path)
+            return PyPDFLoader(file_path)
         elif file_path.endswith(".docx"):
-            loader = Docx2txtLoader(file_path)
+            return Docx2txtLoader(file_path)
         elif file_path.endswith(".html"):
-            loader = UnstructuredHTMLLoader(file_path)
+            return UnstructuredHTMLLoader(file_path)
         else:
             raise ValueError(f"Unsupported file type: {file_path}")
 
-        documents = loader.load()
-        return self.text_splitter.split_documents(documents)
+    def page_count(self, file_path: str) -> int:
+        if file_path.endswith(".pdf"):
+            from pypdf import PdfReader
+
+            return max(len(PdfReader(file_path).pages), 1)
+        # docx and html files load as a single document
+        return 1
+
+    def iter_chunks(
+        self, file_path: str, on_page: Optional[Callable[[int], None]] = None
+    ) -> Iterator[Document]:
+        # pages are loaded and split one at a time, so only the current page
+        # is held in memory
+        for number, page in enumerate(self.get_loader(file_path).lazy_load(), start=1):
+            yield from self.text_splitter.split_documents([page])
+            if on_page:
+                on_page(number)
+
+    def iter_batches(
+        self, file_path: str, on_page: Optional[Callable[[int], None]] = None
+    ) -> Iterator[List[Document]]:
+        chunks = self.iter_chunks(file_path, on_page)
+        while batch := list(islice(chunks, self.batch_size)):
+            yield batch
+
+    def load_and_split_document(self, file_path: str) -> List[Document]:
+        return list(self.iter_chunks(file_path))
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        delay = 1.0
+        for attempt in range(self.embed_retries):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except RateLimitError:
+                if attempt == self.embed_retries - 1:
+                    raise
+                logger.warning(f"Embedding rate limited, retrying in {delay:.1f}s")
+                time.sleep(delay + random.uniform(0, delay))
+                delay = min(delay * 2, 30.0)
+
+    def upsert_batch(
+        self, documents: List[Document], vectors: List[List[float]], namespace: str
+    ) -> List[str]:
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata for doc in documents]
+        ids = [str(uuid.uuid4()) for _ in documents]
+        if isinstance(self.vectorstore, LocalVectorStore):
+            return self.vectorstore.add_embeddings(texts, vectors, metadatas, ids, namespace)
+
+        self.pinecone_index.upsert(
+            vectors=[
+                (id_, vector, {**metadata, self.text_key: text})
+                for id_, vector, metadata, text in zip(ids, vectors, metadatas, texts)
+            ],
+            namespace=namespace,
+        )
+        return ids
+
+    def index_batches(
+        self,
+        batches: Iterable[List[Document]],
+        namespace: str,
+        on_batch: Optional[Callable[[int], None]] = None,
+        db: Optional[Session] = None,
+    ) -> List[str]:
+        """
+        Embed up to `embed_concurrency` batches at a time while a single writer
+        upserts finished batches, so upserts overlap the next embedding calls.
+        At most `embed_concurrency` batches are held in memory. With a `db`
+        session, chunks whose text hash is already in `chunk_embeddings` reuse
+        the stored vector and only new chunks are sent to the embedding API.
+        """
+        ids = []
+        reused = 0
+        with ThreadPoolExecutor(self.embed_concurrency, thread_name_prefix="embed") as embed_pool, \
+                ThreadPoolExecutor(1, thread_name_prefix="upsert") as upsert_pool:
+            in_flight = deque()
+            upserts = deque()
+
+            def collect(limit: int):
+                while len(upserts) > limit or (upserts and upserts[0].done()):
+                    ids.extend(upserts.popleft().result())
+                    if on_batch:
+                        on_batch(len(ids))
+
+            def drain(limit: int):
+                while len(in_flight) > limit:
+                    batch, hashes, vectors, missing, future = in_flight.popleft()
+                    if future is not None:
+                        new = dict(zip(missing, future.result()))
+                        if db is not None:
+                            crud.add_chunk_embeddings(db, new, self.embedding_model)
+                        vectors.update(new)
+                    upserts.append(
+                        upsert_pool.submit(
+                            self.upsert_batch, batch, [vectors[h] for h in hashes], namespace
+                        )
+                    )
+                collect(self.embed_concurrency)
+
+            for batch in batches:
+                texts = {self.chunk_hash(doc.page_content): doc.page_content for doc in batch}
+                hashes = [self.chunk_hash(doc.page_content) for doc in batch]
+                vectors = (
+                    crud.get_chunk_embeddings(db, list(texts), self.embedding_model)
+                    if db is not None
+                    else {}
+                )
+                reused += sum(1 for h in hashes if h in vectors)
+                missing = [h for h in texts if h not in vectors]
+                future = (
+                    embed_pool.submit(self.embed_batch, [texts[h] for h in missing])
+                    if missing
+                    else None
+                )
+                in_flight.append((batch, hashes, vectors, missing, future))
+                drain(self.embed_concurrency - 1)
+            drain(0)
+            collect(0)
+        if reused:
+            logger.info(f"Reused {reused} stored chunk embeddings for namespace {namespace}")
+        return ids
+
+    @staticmethod
+    def chunk_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
     def serialize_docs(self, docs: List[Document]) -> str:
         return "\n\n".join(
@@ -55,40 +284,106 @@ class DocumentProcessor:
         )
 
     async def retrieve_docs(self, query: str, namespace: str) -> str:
+        key = (namespace, normalize_text(query))
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return cached
         results = await self.vectorstore.asimilarity_search(
             query, k=self.top_k, namespace=namespace
         )
         serialized = self.serialize_docs(results)
+        self.result_cache.set(key, serialized)
         return serialized
 
-    def process_file_upload(
-        self, file: UploadFile, namespace: str
-    ):
+    def delete_namespace(self, namespace: str):
+        """Drop the vectors of a namespace, e.g. what a failed job indexed so far."""
+        try:
+            if isinstance(self.vectorstore, LocalVectorStore):
+                self.vectorstore.index.delete_namespace(namespace)
+            else:
+                self.pinecone_index.delete(delete_all=True, namespace=namespace)
+        except Exception as e:
+            # Pinecone answers 404 for a namespace nothing was written to
+            logger.warning(f"Could not delete namespace {namespace}: {str(e)}")
+        self.invalidate_namespace(namespace)
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        removed = self.result_cache.discard_where(lambda key: key[0] == namespace)
+        if removed:
+            logger.info(f"Dropped {removed} cached results for namespace {namespace}")
+        return removed
+
+    def save_upload(self, file: UploadFile, namespace: str) -> Tuple[str, str]:
+        """Save the upload to a temporary file and return its path and sha256."""
+        temp_file_path = f"temp_{namespace}_{file.filename}"
+        digest = hashlib.sha256()
+        with open(temp_file_path, "wb") as buffer:
+            while data := file.file.read(1024 * 1024):
+                digest.update(data)
+                buffer.write(data)
+        logger.info(f"Saved file to {temp_file_path}")
+        return temp_file_path, digest.hexdigest()
 
-        temp_file_path = f"temp_{file.filename}"
+    def process_file(
+        self,
+        temp_file_path: str,
+        namespace: str,
+        progress: Optional[Callable] = None,
+        db: Optional[Session] = None,
+    ):
+        progress = progress or (lambda stage, fraction: None)
+        file_name = os.path.basename(temp_file_path)
 
         try:
-            # Save the uploaded file to a temporary file
-            with open(temp_file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            logger.info(f"Saved file to {temp_file_path}")
-            # Load and split the document
-            documents = self.load_and_split_document(temp_file_path)
-            logger.info(f"Loaded and split {len(documents)} documents")
-            ids = self.vectorstore.add_documents(documents, namespace=namespace)
-            logger.info(f"Indexed {len(ids)} documents and added to pinecone with the namespace {namespace}")
+            # Load, split and index the document batch by batch
+            progress("parsing", 0.1)
+            first_documents = []
+            total_pages = self.page_count(temp_file_path)
+            pages_parsed = 0
+
+            def on_page(number: int):
+                nonlocal pages_parsed
+                pages_parsed = number
+
+            def batches():
+                for batch in self.iter_batches(temp_file_path, on_page):
+                    if not first_documents:
+                        first_documents.extend(batch[:4])
+                    yield batch
+
+            def on_batch(count: int):
+                # parsing, embedding and upserting of a page finish close
+                # together, so pages parsed stands in for the indexing progress
+                parsed = min(pages_parsed, total_pages)
+                progress(
+                    f"embedding ({count} chunks, page {parsed} of {total_pages})",
+                    0.1 + 0.7 * parsed / total_pages,
+                )
+
+            ids = self.index_batches(batches(), namespace, on_batch=on_batch, db=db)
+            if isinstance(self.vectorstore, LocalVectorStore):
+                # merge the per-batch segments and build the IVF lists once
+                self.vectorstore.index.finalize(namespace)
+            logger.info(f"Indexed {len(ids)} documents and added to the vector store with the namespace {namespace}")
             if ids:
-                overview = self.document_overview(documents)
+                progress("summarizing", 0.8)
+                overview = self.document_overview(first_documents)
                 return overview
         except Exception as e:
             raise HTTPException(
-                status_code=500, detail=f"Failed to index {file.filename}, {str(e)}"
+                status_code=500, detail=f"Failed to index {file_name}, {str(e)}"
             )
         finally:
             if os.path.exists(temp_file_path):
                 logger.info(f"Removing temporary file {temp_file_path}")
                 os.remove(temp_file_path)
 
+    def process_file_upload(
+        self, file: UploadFile, namespace: str
+    ):
+        temp_file_path, _ = self.save_upload(file, namespace)
+        return self.process_file(temp_file_path, namespace)
+
     def document_overview(self, documents: List[Document]) -> str:
         template = f"""You are an expert summarizer and your task is to provide a concise and clear overview of the content of a document. Analyze the first few sections of the provided text to determine its main themes, purpose, and structure. Focus on identifying the document's key topics, objectives, and any overarching message or argument.
 